@@ -44,16 +44,10 @@
 
 __author__ = 'api.jscudder (Jeffrey Scudder)'
 
-try:
-  from xml.etree import cElementTree as ElementTree
-except ImportError:
-  try:
-    import cElementTree as ElementTree
-  except ImportError:
-    try:
-      from xml.etree import ElementTree
-    except ImportError:
-      from elementtree import ElementTree
+import atom.core
+# Trees are built for serialization using the same ElementTree module as
+# atom.core. XML is parsed with the backend selected in atom.core.
+ElementTree = atom.core.ElementTree
 import warnings
 
 
@@ -124,7 +118,7 @@ def CreateClassFromXMLString(target_class, xml_string, string_encoding=None):
   encoding = string_encoding or XML_STRING_ENCODING
   if encoding and isinstance(xml_string, unicode):
     xml_string = xml_string.encode(encoding)
-  tree = ElementTree.fromstring(xml_string)
+  tree = atom.core.get_xml_backend().fromstring(xml_string)
   return _CreateClassFromElementTree(target_class, tree)
 
 
@@ -0,0 +1,650 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Makes many HTTP requests at once from a single thread.
+
+AsyncHttpClient has the same request(http_request) interface as
+atom.http_core.HttpClient, but instead of waiting for the server it returns
+an atom.executor.Future right away. All of the requests are multiplexed over
+non-blocking HTTP/1.1 keep-alive connections on an asyncore event loop,
+which is driven by calling run:
+
+  client = atom.aio.AsyncHttpClient()
+  futures = [client.request(atom.http_core.HttpRequest(uri, 'GET'))
+             for uri in uris]
+  client.run()
+  responses = [future.result() for future in futures]
+
+Responses are atom.http_core.HttpResponse objects whose body has already
+been read. Host names are resolved before connecting, which blocks, and
+proxies are not used. See gdata.client.AsyncGDClient for a GDClient which
+uses this transport.
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import asyncore
+import collections
+import errno
+import socket
+import sys
+import time
+import atom.executor
+import atom.http_core
+ssl = None
+try:
+  import ssl
+except ImportError:
+  pass
+
+
+class Error(Exception):
+  pass
+
+
+class ProtocolError(Error):
+  pass
+
+
+class ConnectionClosed(Error):
+  pass
+
+
+class Timeout(Error):
+  pass
+
+
+# The number of bytes read from a socket at a time.
+READ_SIZE = 64 * 1024
+# How long each pass of the event loop waits for a socket to be ready.
+POLL_SECONDS = 0.1
+_WOULD_BLOCK = (errno.EWOULDBLOCK, errno.EAGAIN)
+
+
+class AsyncHttpResponse(atom.http_core.HttpResponse):
+  """A complete response. As with httplib, header names ignore case."""
+
+  def getheader(self, name, default=None):
+    name = name.lower()
+    for header, value in self._headers.iteritems():
+      if header.lower() == name:
+        return value
+    return default
+
+
+class AsyncHttpClient(object):
+  """Makes HTTP requests concurrently on a single-threaded event loop.
+
+  At most max_per_host connections are opened to each (scheme, host, port);
+  further requests wait for one of them to become free. Connections are
+  kept alive and reused, and idle connections are closed after
+  idle_timeout seconds. If timeout is set, a request which takes longer
+  than that many seconds fails with atom.aio.Timeout.
+
+  An AsyncHttpClient is not thread safe: requests should be made and run
+  called from the thread which runs the event loop.
+  """
+  debug = None
+  compress_responses = False
+
+  def __init__(self, max_per_host=6, idle_timeout=30, timeout=None,
+               ssl_context=None):
+    """Constructs a client.
+
+    Args:
+      max_per_host: int The most connections which will be open to a host.
+      idle_timeout: float Seconds after which idle connections are closed.
+      timeout: float (optional) Seconds after which a request fails.
+      ssl_context: ssl.SSLContext (optional) Used for https connections.
+          By default, the same context as httplib's is used.
+    """
+    self.max_per_host = max_per_host
+    self.idle_timeout = idle_timeout
+    self.timeout = timeout
+    self.ssl_context = ssl_context
+    self.transfer_stats = atom.http_core.TransferStats()
+    # The asyncore socket map which holds this client's connections.
+    self._map = {}
+    # Maps (scheme, host, port) to a deque of requests waiting to be sent.
+    self._queues = {}
+    # Maps (scheme, host, port) to the number of connections in use.
+    self._busy = {}
+    # Maps (scheme, host, port) to a list of idle connections.
+    self._idle = {}
+
+  def request(self, http_request):
+    """Starts an HTTP request.
+
+    Args:
+      http_request: atom.http_core.HttpRequest The request to send. Its body
+          parts are read when the request is sent.
+
+    Returns:
+      An atom.executor.Future whose result will be an AsyncHttpResponse.
+    """
+    headers = http_request.headers.copy()
+    if self.compress_responses and 'Accept-Encoding' not in headers:
+      headers['Accept-Encoding'] = atom.http_core.ACCEPT_ENCODING
+    exchange = _Exchange(http_request.method, http_request.uri, headers,
+                         http_request._body_parts)
+    key = atom.http_core._pool_key(http_request.uri)
+    self._queues.setdefault(key, collections.deque()).append(exchange)
+    self._dispatch(key)
+    return exchange.future
+
+  Request = request
+
+  def run(self, futures=None, timeout=None):
+    """Runs the event loop until requests have finished.
+
+    Args:
+      futures: (optional) A list of atom.executor.Future objects to wait
+          for. These may be chained to requests made by this client, see
+          atom.executor.chain. By default, runs until there are no requests
+          left.
+      timeout: float (optional) Seconds after which atom.aio.Timeout is
+          raised if the requests have not finished.
+    """
+    deadline = None
+    if timeout is not None:
+      deadline = time.time() + timeout
+    while not self._finished(futures):
+      if not self._queues and not [n for n in self._busy.itervalues() if n]:
+        raise Error('No requests remain which could finish the futures')
+      if deadline is not None and time.time() > deadline:
+        raise Timeout('Requests did not finish within %s seconds' % timeout)
+      asyncore.loop(timeout=POLL_SECONDS, use_poll=True, map=self._map,
+                    count=1)
+      self._expire()
+
+  Run = run
+
+  def close(self):
+    """Closes all connections. Requests in progress fail."""
+    for connection in self._map.values():
+      connection._abandon((ConnectionClosed,
+                           ConnectionClosed('The client was closed'), None))
+    for queue in self._queues.values():
+      for exchange in queue:
+        exchange.future._set_exc_info(
+            (ConnectionClosed, ConnectionClosed('The client was closed'),
+             None))
+    self._queues = {}
+
+  Close = close
+
+  def _finished(self, futures):
+    if futures is None:
+      return (not self._queues
+              and not [n for n in self._busy.itervalues() if n])
+    for future in futures:
+      if not future.done():
+        return False
+    return True
+
+  def _dispatch(self, key):
+    """Sends waiting requests for key over free or new connections."""
+    queue = self._queues.get(key)
+    while queue and self._busy.get(key, 0) < self.max_per_host:
+      exchange = queue.popleft()
+      connection = self._get_idle(key)
+      if connection is None:
+        try:
+          connection = _Connection(self, key)
+        except socket.error:
+          exchange.future._set_exc_info(sys.exc_info())
+          continue
+      self._busy[key] = self._busy.get(key, 0) + 1
+      connection.start(exchange)
+    if not queue:
+      self._queues.pop(key, None)
+
+  def _get_idle(self, key):
+    idle = self._idle.get(key)
+    while idle:
+      connection = idle.pop()
+      if time.time() - connection.idle_since < self.idle_timeout:
+        return connection
+      connection.close()
+    return None
+
+  def _expire(self):
+    """Closes idle connections and fails requests which took too long."""
+    now = time.time()
+    for connection in self._map.values():
+      if connection.exchange is not None:
+        if (self.timeout is not None
+            and now - connection.exchange.started > self.timeout):
+          connection._abandon((Timeout, Timeout(
+              'No response within %s seconds' % self.timeout), None))
+      elif (connection.idle_since is not None
+            and now - connection.idle_since >= self.idle_timeout):
+        self._remove_idle(connection)
+        connection.close()
+
+  def _remove_idle(self, connection):
+    idle = self._idle.get(connection.key)
+    if idle and connection in idle:
+      idle.remove(connection)
+
+  def _exchange_done(self, connection, exchange, response, reusable):
+    self._busy[connection.key] -= 1
+    if reusable:
+      connection.idle_since = time.time()
+      self._idle.setdefault(connection.key, []).append(connection)
+    if self.compress_responses:
+      response = atom.http_core.decode_response(response, self.transfer_stats)
+    exchange.future._set_result(response)
+    self._dispatch(connection.key)
+
+  def _connection_lost(self, connection, exchange, exc_info, retry):
+    self._remove_idle(connection)
+    if exchange is None:
+      return
+    self._busy[connection.key] -= 1
+    if (retry and not exchange.retried
+        and atom.http_core._can_retry(exchange.method, exchange.body_parts)):
+      # The server closed a reused keep-alive connection before it received
+      # the request, so the request is sent again on a new connection.
+      exchange.retried = True
+      self._queues.setdefault(connection.key,
+                              collections.deque()).appendleft(exchange)
+    else:
+      exchange.future._set_exc_info(exc_info)
+    self._dispatch(connection.key)
+
+
+class _Exchange(object):
+  """A request and the Future for its response."""
+
+  def __init__(self, method, uri, headers, body_parts):
+    self.future = atom.executor.Future()
+    self.method = method
+    self.uri = uri
+    self.headers = headers
+    self.body_parts = body_parts
+    self.started = None
+    self.retried = False
+
+
+def _request_chunks(exchange):
+  """Yields the strings which make up the HTTP request."""
+  uri = exchange.uri
+  lines = ['%s %s HTTP/1.1' % (exchange.method, uri._get_relative_path())]
+  if 'Host' not in exchange.headers:
+    if (uri.port is None
+        or int(uri.port) == atom.http_core.DEFAULT_PORTS.get(uri.scheme)):
+      lines.append('Host: %s' % uri.host)
+    else:
+      lines.append('Host: %s:%s' % (uri.host, uri.port))
+  for name, value in exchange.headers.iteritems():
+    lines.append('%s: %s' % (name, value))
+  yield '\r\n'.join(lines) + '\r\n\r\n'
+  chunked = exchange.headers.get('Transfer-Encoding') == 'chunked'
+  for part in exchange.body_parts or ():
+    for data in _part_chunks(part):
+      if not data:
+        continue
+      if chunked:
+        yield '%x\r\n%s\r\n' % (len(data), data)
+      else:
+        yield data
+  if chunked:
+    yield '0\r\n\r\n'
+
+
+def _part_chunks(part):
+  """Yields the strings in a body part, as atom.http_core sends them."""
+  if isinstance(part, (str, unicode)):
+    yield part
+  elif hasattr(part, 'read'):
+    while True:
+      data = part.read(READ_SIZE)
+      if not data:
+        break
+      yield data
+  elif hasattr(part, '__iter__'):
+    for data in part:
+      yield data
+  else:
+    yield str(part)
+
+
+def _would_block(error):
+  if ssl is not None and isinstance(error, ssl.SSLError):
+    return error.args[0] in (ssl.SSL_ERROR_WANT_READ,
+                             ssl.SSL_ERROR_WANT_WRITE)
+  return error.args[0] in _WOULD_BLOCK
+
+
+class _Connection(asyncore.dispatcher):
+  """A non-blocking HTTP/1.1 connection which carries one request at a time.
+  """
+
+  def __init__(self, client, key):
+    asyncore.dispatcher.__init__(self, map=client._map)
+    self.client = client
+    self.key = key
+    self.exchange = None
+    self.idle_since = None
+    self.completed = 0
+    self._out = ''
+    self._chunks = None
+    self._handshaking = False
+    self._want_write = False
+    self._reset()
+    scheme, host, port = key
+    family, socktype, proto, name, address = socket.getaddrinfo(
+        host, port, 0, socket.SOCK_STREAM)[0]
+    self.create_socket(family, socktype)
+    try:
+      self.connect(address)
+    except socket.error:
+      self.close()
+      raise
+
+  def _reset(self):
+    self._in = ''
+    self._state = 'status'
+    self._received = False
+    self._version = None
+    self._status = None
+    self._reason = None
+    self._headers = {}
+    self._last_header = None
+    self._body = []
+    self._remaining = None
+
+  def start(self, exchange):
+    exchange.started = time.time()
+    self.exchange = exchange
+    self.idle_since = None
+    self._reset()
+    self._out = ''
+    self._chunks = _request_chunks(exchange)
+
+  def readable(self):
+    return True
+
+  def writable(self):
+    if not self.connected:
+      return True
+    if self._handshaking:
+      return self._want_write
+    return bool(self._out) or self._chunks is not None
+
+  def handle_connect(self):
+    if self.key[0] != 'https':
+      return
+    if ssl is None:
+      raise Error('The ssl module is required for https requests')
+    context = self.client.ssl_context
+    if context is None and hasattr(ssl, '_create_default_https_context'):
+      context = ssl._create_default_https_context()
+    sock = self.socket
+    self.del_channel()
+    if context is not None:
+      sock = context.wrap_socket(sock, server_hostname=self.key[1],
+                                 do_handshake_on_connect=False)
+    else:
+      sock = ssl.wrap_socket(sock, do_handshake_on_connect=False)
+    self.set_socket(sock)
+    self._handshaking = True
+    self._handshake()
+
+  def _handshake(self):
+    try:
+      self.socket.do_handshake()
+    except ssl.SSLError, error:
+      if error.args[0] == ssl.SSL_ERROR_WANT_READ:
+        self._want_write = False
+        return
+      elif error.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+        self._want_write = True
+        return
+      raise
+    self._handshaking = False
+
+  def handle_write(self):
+    if self._handshaking:
+      self._handshake()
+      return
+    while True:
+      if not self._out:
+        if self._chunks is None:
+          return
+        try:
+          self._out = self._chunks.next()
+        except StopIteration:
+          self._chunks = None
+          return
+        continue
+      try:
+        sent = self.socket.send(self._out)
+      except socket.error, error:
+        if _would_block(error):
+          return
+        raise
+      self._out = self._out[sent:]
+      if self._out:
+        # The socket's buffer is full.
+        return
+
+  def handle_read(self):
+    if self._handshaking:
+      self._handshake()
+      return
+    while True:
+      try:
+        data = self.socket.recv(READ_SIZE)
+      except socket.error, error:
+        if _would_block(error):
+          return
+        raise
+      if not data:
+        self.handle_close()
+        return
+      if self.exchange is None:
+        # An idle connection should receive nothing.
+        self.client._remove_idle(self)
+        self.close()
+        return
+      self._received = True
+      self._in += data
+      self._parse()
+      # Decrypted data may be waiting in the SSL object rather than the
+      # socket, where poll would not see it.
+      if (self.exchange is None or not hasattr(self.socket, 'pending')
+          or not self.socket.pending()):
+        return
+
+  def handle_close(self):
+    if self.exchange is not None and self._state == 'until_close':
+      self._complete(reusable=False)
+      return
+    # A reused connection which the server closed before sending anything
+    # was most likely closed while it was idle.
+    self._abandon((ConnectionClosed,
+                   ConnectionClosed('The server closed the connection'),
+                   None),
+                  retry=self.completed > 0 and not self._received)
+
+  def handle_error(self):
+    exc_info = sys.exc_info()
+    self._abandon(exc_info, retry=(self.completed > 0 and not self._received
+                                   and isinstance(exc_info[1],
+                                                  socket.error)))
+
+  def handle_expt(self):
+    self.handle_close()
+
+  def _abandon(self, exc_info, retry=False):
+    exchange, self.exchange = self.exchange, None
+    self.close()
+    self.client._connection_lost(self, exchange, exc_info, retry)
+
+  def _read_line(self):
+    end = self._in.find('\n')
+    if end == -1:
+      return None
+    line = self._in[:end].rstrip('\r')
+    self._in = self._in[end + 1:]
+    return line
+
+  def _parse(self):
+    """Consumes as much of the received data as possible."""
+    while self.exchange is not None:
+      if self._state == 'status':
+        line = self._read_line()
+        if line is None:
+          return
+        if not line:
+          # Tolerate blank lines before the status line.
+          continue
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+          raise ProtocolError('Invalid status line %r' % line)
+        self._version = parts[0]
+        try:
+          self._status = int(parts[1])
+        except ValueError:
+          raise ProtocolError('Invalid status line %r' % line)
+        self._reason = (parts[2:] or [''])[0]
+        self._state = 'headers'
+      elif self._state == 'headers':
+        line = self._read_line()
+        if line is None:
+          return
+        if line:
+          self._add_header(line)
+        else:
+          self._start_body()
+      elif self._state == 'body':
+        data = self._in[:self._remaining]
+        self._in = self._in[len(data):]
+        self._body.append(data)
+        self._remaining -= len(data)
+        if not self._remaining:
+          self._complete()
+        elif not self._in:
+          return
+      elif self._state == 'chunk_size':
+        line = self._read_line()
+        if line is None:
+          return
+        try:
+          self._remaining = int(line.split(';')[0], 16)
+        except ValueError:
+          raise ProtocolError('Invalid chunk size %r' % line)
+        if self._remaining:
+          self._state = 'chunk'
+        else:
+          self._state = 'trailer'
+      elif self._state == 'chunk':
+        data = self._in[:self._remaining]
+        self._in = self._in[len(data):]
+        self._body.append(data)
+        self._remaining -= len(data)
+        if not self._remaining:
+          self._state = 'chunk_end'
+        elif not self._in:
+          return
+      elif self._state == 'chunk_end':
+        line = self._read_line()
+        if line is None:
+          return
+        self._state = 'chunk_size'
+      elif self._state == 'trailer':
+        line = self._read_line()
+        if line is None:
+          return
+        if not line:
+          self._complete()
+      elif self._state == 'until_close':
+        self._body.append(self._in)
+        self._in = ''
+        return
+
+  def _add_header(self, line):
+    if line[0] in ' \t' and self._last_header is not None:
+      # A continuation of the previous header's value.
+      self._headers[self._last_header] += ' ' + line.strip()
+      return
+    name, sep, value = line.partition(':')
+    if not sep:
+      raise ProtocolError('Invalid header line %r' % line)
+    name = name.strip()
+    value = value.strip()
+    if name in self._headers:
+      self._headers[name] = '%s, %s' % (self._headers[name], value)
+    else:
+      self._headers[name] = value
+    self._last_header = name
+
+  def _header(self, name):
+    name = name.lower()
+    for header, value in self._headers.iteritems():
+      if header.lower() == name:
+        return value
+    return None
+
+  def _start_body(self):
+    status = self._status
+    if 100 <= status < 200:
+      # Skip interim responses such as 100 Continue.
+      self._state = 'status'
+      self._headers = {}
+      self._last_header = None
+      return
+    length = self._header('Content-Length')
+    if (self.exchange.method == 'HEAD' or status in (204, 304)):
+      self._complete()
+    elif 'chunked' in (self._header('Transfer-Encoding') or '').lower():
+      self._state = 'chunk_size'
+    elif length is not None:
+      try:
+        self._remaining = int(length)
+      except ValueError:
+        raise ProtocolError('Invalid Content-Length %r' % length)
+      if self._remaining:
+        self._state = 'body'
+      else:
+        self._complete()
+    else:
+      self._state = 'until_close'
+
+  def _complete(self, reusable=True):
+    connection_header = (self._header('Connection') or '').lower()
+    if self._version == 'HTTP/1.0':
+      reusable = reusable and 'keep-alive' in connection_header
+    else:
+      reusable = reusable and 'close' not in connection_header
+    # Nothing should follow the response, since requests are not pipelined.
+    reusable = reusable and not self._in
+    response = AsyncHttpResponse(self._status, self._reason, self._headers,
+                                 ''.join(self._body))
+    exchange, self.exchange = self.exchange, None
+    self.completed += 1
+    self._reset()
+    if not reusable:
+      self.close()
+    self.client._exchange_done(self, exchange, response, reusable)
@@ -22,7 +22,9 @@
 __author__ = 'j.s@google.com (Jeff Scudder)'
 
 
+import atom.executor
 import atom.http_core
+import atom.observer
 
 
 class Error(Exception):
@@ -37,6 +39,10 @@ class AtomPubClient(object):
   host = None
   auth_token = None
   ssl = False # Whether to force all requests over https
+  # A list of observers which are given an atom.observer.RequestEvent for
+  # each request made by this client, in addition to the observers
+  # installed with atom.observer.add_observer.
+  observers = None
 
   def __init__(self, http_client=None, host=None,
                auth_token=None, source=None, **kwargs):
@@ -112,12 +118,41 @@ class AtomPubClient(object):
     if http_request.uri.host is None:
       raise MissingHost('No host provided in request %s %s' % (
           http_request.method, str(http_request.uri)))
+    observers = atom.observer.get_observers(self.observers)
+    if observers:
+      return self._observed_request(http_request, observers)
     # Perform the fully specified request using the http_client instance.
     # Sends the request to the server and returns the server's response.
     return self.http_client.request(http_request)
 
   Request = request
 
+  def _observed_request(self, http_request, observers):
+    """Makes the request, measuring it for the observers.
+
+    The HTTP client fills in the measurements it can make, such as the
+    connect time, through the event set on the request.
+    """
+    event = atom.observer.RequestEvent(
+        http_request.method, http_request.uri.host, http_request.uri.path,
+        getattr(self, 'auth_service', None), observers)
+    http_request.event = event
+    try:
+      response = self.http_client.request(http_request)
+    except Exception, error:
+      event.fail(error)
+      raise
+    finally:
+      http_request.event = None
+    if isinstance(response, atom.executor.Future):
+      # Requests made by an event loop client finish later.
+      def fail_if_error(future):
+        if future.exception() is not None:
+          event.fail(future.exception())
+      response.add_done_callback(fail_if_error)
+      return atom.executor.chain(response, event.response_received)
+    return event.response_received(response)
+
   def get(self, uri=None, auth_token=None, http_request=None, **kwargs):
     """Performs a request using the GET method, returns an HTTP response."""
     return self.request(method='GET', uri=uri, auth_token=auth_token,
@@ -22,6 +22,9 @@ __author__ = 'j.s@google.com (Jeff Scudder)'
 
 
 import inspect
+import os
+import StringIO
+import warnings
 try:
   from xml.etree import cElementTree as ElementTree
 except ImportError:
@@ -49,22 +52,24 @@ class XmlElement(object):
   # appropriate member classes.
   _rule_set = None
   _members = None
+  # Compact classes (see _get_compact_class) store members in slots and
+  # create the containers for other elements and attributes on demand.
+  _compact = False
   text = None
 
   def __init__(self, text=None, *args, **kwargs):
-    if ('_members' not in self.__class__.__dict__
-        or self.__class__._members is None):
-      self.__class__._members = tuple(self.__class__._list_xml_members())
-    for member_name, member_type in self.__class__._members:
+    # The list of members is the same in all versions, so the plan for
+    # version 1 is used to find the members which need to be initialized.
+    for member_name, repeating in _get_plan(self.__class__, 1).members:
       if member_name in kwargs:
         setattr(self, member_name, kwargs[member_name])
+      elif repeating:
+        setattr(self, member_name, [])
       else:
-        if isinstance(member_type, list):
-          setattr(self, member_name, [])
-        else:
-          setattr(self, member_name, None)
-    self._other_elements = []
-    self._other_attributes = {}
+        setattr(self, member_name, None)
+    if not self._compact:
+      self._other_elements = _ElementList()
+      self._other_attributes = {}
     if text is not None:
       self.text = text
 
@@ -200,18 +205,36 @@ class XmlElement(object):
       A list of the matching XmlElements.
     """
     matches = []
-    ignored1, elements, ignored2 = self.__class__._get_rules(version)
-    if elements:
-      for qname, element_def in elements.iteritems():
-        member = getattr(self, element_def[0])
-        if member:
-          if _qname_matches(tag, namespace, qname):
-            if element_def[2]:
-              # If this is a repeating element, copy all instances into the
-              # result list.
-              matches.extend(member)
-            else:
-              matches.append(member)
+    plan = _get_plan(self.__class__, version)
+    if tag is not None and namespace:
+      # Only elements with exactly this qname can match, so look them up
+      # instead of comparing against every member and other element.
+      qname = '{%s}%s' % (namespace, tag)
+      rule = plan.elements_by_qname.get(qname)
+      if rule is not None:
+        member = getattr(self, rule[0])
+        if member and rule[1]:
+          matches.extend(member)
+        elif member:
+          matches.append(member)
+      if isinstance(self._other_elements, _ElementList):
+        matches.extend(self._other_elements.find(qname))
+      else:
+        for element in self._other_elements:
+          if element._qname == qname:
+            matches.append(element)
+      return matches
+    for qname, member_namespace, member_tag, member_name, repeating in (
+        plan.elements):
+      member = getattr(self, member_name)
+      if member:
+        if _names_match(tag, namespace, member_tag, member_namespace):
+          if repeating:
+            # If this is a repeating element, copy all instances into the
+            # result list.
+            matches.extend(member)
+          else:
+            matches.append(member)
     for element in self._other_elements:
       if _qname_matches(tag, namespace, element._qname):
         matches.append(element)
@@ -246,17 +269,12 @@ class XmlElement(object):
       A list of XmlAttribute objects for the matching attributes.
     """
     matches = []
-    ignored1, ignored2, attributes = self.__class__._get_rules(version)
-    if attributes:
-      for qname, attribute_def in attributes.iteritems():
-        if isinstance(attribute_def, (list, tuple)):
-          attribute_def = attribute_def[0]
-        member = getattr(self, attribute_def)
-        # TODO: ensure this hasn't broken existing behavior.
-        #member = getattr(self, attribute_def[0])
-        if member:
-          if _qname_matches(tag, namespace, qname):
-            matches.append(XmlAttribute(qname, member))
+    plan = _get_plan(self.__class__, version)
+    for qname, member_namespace, member_tag, member_name in plan.attributes:
+      member = getattr(self, member_name)
+      if member:
+        if _names_match(tag, namespace, member_tag, member_namespace):
+          matches.append(XmlAttribute(qname, member))
     for qname, value in self._other_attributes.iteritems():
       if _qname_matches(tag, namespace, qname):
         matches.append(XmlAttribute(qname, value))
@@ -264,33 +282,90 @@ class XmlElement(object):
 
   GetAttributes = get_attributes
 
-  def _harvest_tree(self, tree, version=1):
-    """Populates object members from the data in the tree Element."""
-    qname, elements, attributes = self.__class__._get_rules(version)
+  def _harvest_tree(self, tree, version=1, projection=None):
+    """Populates object members from the data in the tree Element.
+
+    Args:
+      tree: ElementTree.Element
+      version: int The version of the XML rules used in the conversion.
+      projection: dict (optional) Child handlers built by _get_projection.
+          If given, only the child elements which have a handler are
+          converted and all other children are skipped.
+    """
+    plan = _get_plan(self.__class__, version)
+    if projection is None:
+      handlers = plan.child_handlers
+    else:
+      handlers = projection
     for element in tree:
-      if elements and element.tag in elements:
-        definition = elements[element.tag]
-        # If this is a repeating element, make sure the member is set to a
-        # list.
-        if definition[2]:
-          if getattr(self, definition[0]) is None:
-            setattr(self, definition[0], [])
-          getattr(self, definition[0]).append(_xml_element_from_tree(element,
-              definition[1], version))
-        else:
-          setattr(self, definition[0], _xml_element_from_tree(element,
-              definition[1], version))
-      else:
-        self._other_elements.append(_xml_element_from_tree(element, XmlElement,
-                                                           version))
+      handler = handlers.get(element.tag)
+      if handler is not None:
+        handler(self, element)
+      elif projection is None:
+        self._other_elements.append(_xml_element_from_tree(element,
+            plan.other_class, version))
+    attribute_members = plan.attribute_members
     for attrib, value in tree.attrib.iteritems():
-      if attributes and attrib in attributes:
-        setattr(self, attributes[attrib], value)
-      else:
+      member_name = attribute_members.get(attrib)
+      if member_name is None:
         self._other_attributes[attrib] = value
+      else:
+        setattr(self, member_name, value)
     if tree.text:
       self.text = tree.text
 
+  def _harvest_child(self, element, version=1):
+    """Converts a single child Element and stores it in the matching member.
+
+    Args:
+      element: ElementTree.Element which is a direct child of this object's
+               XML element.
+      version: int The version of the XML rules used in the conversion.
+    """
+    plan = _get_plan(self.__class__, version)
+    handler = plan.child_handlers.get(element.tag)
+    if handler is None:
+      self._other_elements.append(_xml_element_from_tree(element,
+          plan.other_class, version))
+    else:
+      handler(self, element)
+
+  def _defer_tree(self, tree, version=1):
+    """Stores the child nodes from the tree to be converted when first used.
+
+    XML attributes and text are copied immediately, but each child element
+    is kept in its ElementTree form until the member which holds it is
+    accessed. This is used when parsing in lazy mode, and requires that the
+    object's class be one created by _get_lazy_class.
+    """
+    child_members = _get_plan(self.__class__, version).child_members
+    pending = {}
+    for element in tree:
+      member_name = child_members.get(element.tag, '_other_elements')
+      if member_name in pending:
+        pending[member_name].append(element)
+      else:
+        pending[member_name] = [element]
+    # Remove the default values set in the constructor so that the lazy
+    # member descriptors in the class will be consulted.
+    for member_name in pending:
+      self.__dict__.pop(member_name, None)
+    self._lazy_children = pending
+    self._lazy_version = version
+    self._harvest_attributes(tree, version)
+    if tree.text:
+      self.text = tree.text
+
+  def _harvest_attributes(self, tree, version=1):
+    """Copies the XML attributes from the tree Element into members."""
+    attribute_members = _get_plan(self.__class__, version).attribute_members
+    for attrib, value in tree.attrib.iteritems():
+      member_name = attribute_members.get(attrib)
+      if member_name is None:
+        self._other_attributes[attrib] = value
+      else:
+        setattr(self, member_name, value)
+
   def _to_tree(self, version=1, encoding=None):
     new_tree = ElementTree.Element(_get_qname(self, version))
     self._attach_members(new_tree, version, encoding)
@@ -309,23 +384,21 @@ class XmlElement(object):
       version: int Ingnored in this method but used by VersionedElement.
       encoding: str (optional)
     """
-    qname, elements, attributes = self.__class__._get_rules(version)
+    plan = _get_plan(self.__class__, version)
     encoding = encoding or STRING_ENCODING
     # Add the expected elements and attributes to the tree.
-    if elements:
-      for tag, element_def in elements.iteritems():
-        member = getattr(self, element_def[0])
-        # If this is a repeating element and there are members in the list.
-        if member and element_def[2]:
-          for instance in member:
-            instance._become_child(tree, version)
-        elif member:
-          member._become_child(tree, version)
-    if attributes:
-      for attribute_tag, member_name in attributes.iteritems():
-        value = getattr(self, member_name)
-        if value:
-          tree.attrib[attribute_tag] = value
+    for member_name, repeating in plan.element_members:
+      member = getattr(self, member_name)
+      # If this is a repeating element and there are members in the list.
+      if member and repeating:
+        for instance in member:
+          instance._become_child(tree, version)
+      elif member:
+        member._become_child(tree, version)
+    for attribute_tag, member_name in plan.attribute_members.iteritems():
+      value = getattr(self, member_name)
+      if value:
+        tree.attrib[attribute_tag] = value
     # Add the unexpected (other) elements and attributes to the tree.
     for element in self._other_elements:
       element._become_child(tree, version)
@@ -343,7 +416,7 @@ class XmlElement(object):
 
   def to_string(self, version=1, encoding=None):
     """Converts this object to XML."""
-    return ElementTree.tostring(self._to_tree(version, encoding))
+    return XmlWriter(self, version, encoding).to_string()
 
   ToString = to_string
 
@@ -435,6 +508,425 @@ def _get_qname(element, version):
     return element._qname
 
 
+class _XmlPlan(object):
+  """Precompiled instructions for parsing and serializing an XmlElement class.
+
+  A plan is built once for each class and XML version from the rules
+  returned by _get_rules. It holds a dispatch table which maps child element
+  qnames to functions which convert the child and store it in the correct
+  member, along with flattened tuples of the element and attribute members
+  so that the members need not be rediscovered each time an instance is
+  created, parsed, searched or converted to XML.
+  """
+
+  def __init__(self, cls, version):
+    qname, elements, attributes = cls._get_rules(version)
+    self.qname = qname
+    # Pairs of (member_name, repeating) for each XML member of the class.
+    self.members = tuple([(member_name, isinstance(target, list))
+                          for member_name, target in cls._members])
+    # Maps a child element's qname to a function which takes the parent
+    # instance and the child's ElementTree node.
+    self.child_handlers = {}
+    # Maps a child element's qname to the name of the member which holds it.
+    self.child_members = {}
+    # Maps a child element's qname to (member_name, member_class, repeating).
+    self.child_classes = {}
+    # Children of a compact element are also compact.
+    if cls._compact:
+      self.other_class = _get_compact_class(XmlElement)
+    else:
+      self.other_class = XmlElement
+    element_rules = []
+    for child_qname, definition in elements.iteritems():
+      member_name, member_class, repeating = definition
+      if cls._compact:
+        member_class = _get_compact_class(member_class)
+      self.child_members[child_qname] = member_name
+      self.child_classes[child_qname] = (member_name, member_class, repeating)
+      self.child_handlers[child_qname] = _make_child_handler(
+          member_name, member_class, repeating, version)
+      member_namespace, member_tag = _split_qname(child_qname)
+      element_rules.append((child_qname, member_namespace, member_tag,
+                            member_name, repeating))
+    # Tuples of (qname, namespace, tag, member_name, repeating).
+    self.elements = tuple(element_rules)
+    # Pairs of (member_name, repeating) in serialization order.
+    self.element_members = tuple([(rule[3], rule[4]) for rule in element_rules])
+    # Maps a child element's qname to its (member_name, repeating) pair.
+    self.elements_by_qname = dict([(rule[0], (rule[3], rule[4]))
+                                   for rule in element_rules])
+    # Maps an attribute qname to the member which stores its value.
+    self.attribute_members = attributes.copy()
+    attribute_rules = []
+    for attribute_qname, member_name in attributes.iteritems():
+      member_namespace, member_tag = _split_qname(attribute_qname)
+      attribute_rules.append((attribute_qname, member_namespace, member_tag,
+                              member_name))
+    # Tuples of (qname, namespace, tag, member_name).
+    self.attributes = tuple(attribute_rules)
+
+
+def _make_child_handler(member_name, member_class, repeating, version,
+                        projection=None):
+  """Creates a function which converts a child node and stores it."""
+  if repeating:
+    def append_child(instance, element):
+      members = getattr(instance, member_name)
+      # Make sure the member is set to a list for repeating elements.
+      if members is None:
+        members = []
+        setattr(instance, member_name, members)
+      members.append(_xml_element_from_tree(element, member_class, version,
+                                            projection=projection))
+    return append_child
+  else:
+    def set_child(instance, element):
+      setattr(instance, member_name,
+              _xml_element_from_tree(element, member_class, version,
+                                     projection=projection))
+    return set_child
+
+
+# Caches the _XmlPlan for each class, in a dict for each version.
+_plans = {}
+
+
+def _get_plan(cls, version):
+  """Returns the _XmlPlan for the class, building it on first use."""
+  try:
+    return _plans[version][cls]
+  except KeyError:
+    if '_members' not in cls.__dict__ or cls._members is None:
+      cls._members = tuple(cls._list_xml_members())
+    plan = _XmlPlan(cls, version)
+    _plans.setdefault(version, {})[cls] = plan
+    return plan
+
+
+class _LazyMember(object):
+  """Converts a member's XML the first time it is read from an instance.
+
+  This is a non-data descriptor, so once the converted value has been
+  stored in the instance's __dict__ it is found there directly and the
+  descriptor is no longer consulted. When accessed on the class, the
+  descriptor returns the original member definition.
+  """
+
+  def __init__(self, member_name, target):
+    self.member_name = member_name
+    self.target = target
+    if isinstance(target, list):
+      self.member_class = target[0]
+      self.repeating = True
+    else:
+      self.member_class = target
+      self.repeating = False
+
+  def __get__(self, instance, owner):
+    if instance is None:
+      return self.target
+    pending = instance._lazy_children
+    nodes = pending and pending.get(self.member_name)
+    if nodes is None:
+      return self.target
+    version = instance._lazy_version
+    if self.repeating:
+      value = [_xml_element_from_tree(node, self.member_class, version, True)
+               for node in nodes]
+      if self.member_name == '_other_elements':
+        value = _ElementList(value)
+    else:
+      # As in _harvest_tree, the last occurrence of a single element wins.
+      value = _xml_element_from_tree(nodes[-1], self.member_class, version,
+                                     True)
+    # If another thread converted this member first, use its value.
+    value = instance.__dict__.setdefault(self.member_name, value)
+    pending.pop(self.member_name, None)
+    return value
+
+
+# Caches the lazily parsed subclass for each XmlElement class.
+_lazy_classes = {}
+
+
+def _get_lazy_class(cls):
+  """Returns a subclass of cls in which members are converted on first use.
+
+  The subclass has the same name, rules and qname as cls, but each XML
+  member (and the _other_elements list) is a _LazyMember descriptor.
+  """
+  # Lazy classes are never subclassed again, use the original class.
+  cls = cls.__dict__.get('_lazy_base', cls)
+  try:
+    return _lazy_classes[cls]
+  except KeyError:
+    # Make sure the member list has been computed for the original class.
+    _get_plan(cls, 1)
+    namespace = {'__module__': cls.__module__, '__doc__': cls.__doc__,
+                 '_members': cls._members, '_lazy_base': cls,
+                 '_lazy_children': None, '_lazy_version': None,
+                 '_other_elements': _LazyMember('_other_elements',
+                                                [XmlElement])}
+    for member_name, target in cls._members:
+      namespace[member_name] = _LazyMember(member_name, target)
+    lazy_class = type(cls.__name__, (cls,), namespace)
+    _lazy_classes[cls] = lazy_class
+    return lazy_class
+
+
+def _attach_on_change(method):
+  """Wraps a container method to store the container in its owner first."""
+  def attach_and_call(self, *args):
+    owner = self._owner
+    if owner is None:
+      return method(self, *args)
+    self._owner = None
+    try:
+      target = getattr(owner, self._slot_name)
+    except AttributeError:
+      setattr(owner, self._slot_name, self)
+      target = self
+    return method(target, *args)
+  return attach_and_call
+
+
+def _discard_index(method):
+  """Wraps a list method to discard the _ElementList index before a change."""
+  def discard_and_call(self, *args, **kwargs):
+    self._index = None
+    return method(self, *args, **kwargs)
+  return discard_and_call
+
+
+class _ElementList(list):
+  """A list of XmlElements which can be searched by qname.
+
+  Used for _other_elements. The index from qname to elements is built by
+  the first call to find. Elements added to the end of the list (by append,
+  extend or +=) are indexed on the next call to find, and any other change
+  to the list discards the index. Changing the qname of an element which is
+  already in the list is not tracked.
+  """
+  _index = None
+  _indexed = 0
+
+  def find(self, qname):
+    """Returns the elements in the list which have the qname, in order."""
+    index = self._index
+    if index is None:
+      index = self._index = {}
+      self._indexed = 0
+    if self._indexed < len(self):
+      for element in self[self._indexed:]:
+        if element._qname in index:
+          index[element._qname].append(element)
+        else:
+          index[element._qname] = [element]
+      self._indexed = len(self)
+    return [element for element in index.get(qname, ())
+            if element._qname == qname]
+
+  insert = _discard_index(list.insert)
+  remove = _discard_index(list.remove)
+  pop = _discard_index(list.pop)
+  reverse = _discard_index(list.reverse)
+  sort = _discard_index(list.sort)
+  __setitem__ = _discard_index(list.__setitem__)
+  __delitem__ = _discard_index(list.__delitem__)
+  __setslice__ = _discard_index(list.__setslice__)
+  __delslice__ = _discard_index(list.__delslice__)
+  __imul__ = _discard_index(list.__imul__)
+
+
+class _DetachedList(_ElementList):
+  """An empty list which is stored in a compact element once it is changed.
+
+  Returned when a compact element's _other_elements have not been created.
+  Reading from the list allocates nothing in the element, but the first
+  change stores the list in the element's slot.
+  """
+  __slots__ = ('_owner', '_slot_name')
+
+  def __init__(self, owner, slot_name):
+    list.__init__(self)
+    self._owner = owner
+    self._slot_name = slot_name
+
+  append = _attach_on_change(_ElementList.append)
+  extend = _attach_on_change(_ElementList.extend)
+  insert = _attach_on_change(_ElementList.insert)
+  __setitem__ = _attach_on_change(_ElementList.__setitem__)
+  __setslice__ = _attach_on_change(_ElementList.__setslice__)
+  __iadd__ = _attach_on_change(_ElementList.__iadd__)
+
+
+class _DetachedDict(dict):
+  """An empty dict which is stored in a compact element once it is changed.
+
+  The _other_attributes counterpart of _DetachedList.
+  """
+  __slots__ = ('_owner', '_slot_name')
+
+  def __init__(self, owner, slot_name):
+    dict.__init__(self)
+    self._owner = owner
+    self._slot_name = slot_name
+
+  __setitem__ = _attach_on_change(dict.__setitem__)
+  update = _attach_on_change(dict.update)
+  setdefault = _attach_on_change(dict.setdefault)
+
+
+def _compact_container(slot_name, detached_class):
+  """Creates a property which reads and writes a container in a slot."""
+  def get_container(self):
+    try:
+      return getattr(self, slot_name)
+    except AttributeError:
+      return detached_class(self, slot_name)
+
+  def set_container(self, value):
+    setattr(self, slot_name, value)
+
+  return property(get_container, set_container)
+
+
+def _get_compact_text(self):
+  try:
+    return self._text
+  except AttributeError:
+    return None
+
+
+def _set_compact_text(self, value):
+  self._text = value
+
+
+# Caches the compact subclass for each XmlElement class.
+_compact_classes = {}
+
+
+def _get_compact_class(cls):
+  """Returns a subclass of cls which stores its members in __slots__.
+
+  Instances of the subclass do not allocate a __dict__ unless an attribute
+  which is not an XML member is set on them (for example the _qname of an
+  element which was not expected by the parsing rules). The lists and dicts
+  for other elements and attributes are only created once something is
+  added to them. The subclass has the same name, rules and qname as cls.
+  """
+  cls = cls.__dict__.get('_compact_base', cls)
+  try:
+    return _compact_classes[cls]
+  except KeyError:
+    # Make sure the member list has been computed for the original class.
+    _get_plan(cls, 1)
+    slots = [member_name for member_name, target in cls._members]
+    slots.extend(['_text', '_compact_elements', '_compact_attributes'])
+    namespace = {'__module__': cls.__module__, '__doc__': cls.__doc__,
+                 '__slots__': tuple(slots), '_members': cls._members,
+                 '_compact_base': cls, '_compact': True,
+                 'text': property(_get_compact_text, _set_compact_text),
+                 '_other_elements': _compact_container('_compact_elements',
+                                                       _DetachedList),
+                 '_other_attributes': _compact_container(
+                     '_compact_attributes', _DetachedDict)}
+    compact_class = type(cls.__name__, (cls,), namespace)
+    _compact_classes[cls] = compact_class
+    return compact_class
+
+
+def _parse_fields(fields):
+  """Converts a field projection into a dict of member names.
+
+  Args:
+    fields: str or a sequence of str. Member names are separated by commas
+        and a member may be followed by the fields to keep in the member
+        itself, in parentheses. This is the syntax used by the fields query
+        parameter in version 2 of the Google Data APIs, for example
+        'id,updated,entry(id,title)' or ('id', 'updated', 'entry(id,title)').
+
+  Returns:
+    A dict which maps each member name to None if the whole member is kept,
+    or to a dict of the member's own fields.
+  """
+  if not isinstance(fields, basestring):
+    fields = ','.join(fields)
+  # Each dict on the stack holds the fields for one level of parentheses.
+  stack = [{}]
+  name = []
+  for character in fields + ',':
+    if character in ',()':
+      member_name = ''.join(name).strip()
+      name = []
+      if member_name:
+        stack[-1][member_name] = None
+      if character == '(':
+        if not member_name:
+          raise ValueError('Missing member name before ( in fields %r' % (
+              fields,))
+        stack[-1][member_name] = {}
+        stack.append(stack[-1][member_name])
+      elif character == ')':
+        if len(stack) == 1:
+          raise ValueError('Unbalanced ) in fields %r' % (fields,))
+        stack.pop()
+    else:
+      name.append(character)
+  if len(stack) != 1:
+    raise ValueError('Unbalanced ( in fields %r' % (fields,))
+  return stack[0]
+
+
+def _get_projection(cls, fields, version):
+  """Creates child handlers which convert only the requested members.
+
+  Args:
+    cls: XmlElement or a subclass.
+    fields: dict of member names, as returned by _parse_fields.
+    version: int
+
+  Returns:
+    A dict which maps the qname of each child element to be kept to a
+    function which converts the child, for use in XmlElement._harvest_tree.
+  """
+  plan = _get_plan(cls, version)
+  member_names = [member_name for member_name, repeating in plan.members]
+  for member_name in fields:
+    if member_name not in member_names:
+      raise ValueError('%s has no member named %s' % (cls.__name__,
+                                                      member_name))
+  projection = {}
+  for child_qname, definition in cls._get_rules(version)[1].iteritems():
+    member_name, member_class, repeating = definition
+    if member_name not in fields:
+      continue
+    if fields[member_name] is None:
+      projection[child_qname] = plan.child_handlers[child_qname]
+    else:
+      if cls._compact:
+        member_class = _get_compact_class(member_class)
+      projection[child_qname] = _make_child_handler(member_name, member_class,
+          repeating, version,
+          _get_projection(member_class, fields[member_name], version))
+  return projection
+
+
+def _split_qname(qname):
+  """Splits a '{namespace}tag' string into a (namespace, tag) tuple.
+
+  The namespace is None if the qname does not contain a namespace, and both
+  the namespace and tag are None if the qname is None.
+  """
+  if qname is None:
+    return (None, None)
+  if qname.startswith('{'):
+    end = qname.index('}')
+    return (qname[1:end], qname[end + 1:])
+  return (None, qname)
+
+
 def _qname_matches(tag, namespace, qname):
   """Logic determines if a QName matches the desired local tag and namespace.
 
@@ -452,17 +944,17 @@ def _qname_matches(tag, namespace, qname):
     boolean True if the member's tag and namespace fit the expected tag and
     namespace.
   """
+  member_namespace, member_tag = _split_qname(qname)
+  return _names_match(tag, namespace, member_tag, member_namespace)
+
+
+def _names_match(tag, namespace, member_tag, member_namespace):
+  """Compares the desired tag and namespace with a member's tag and namespace.
+
+  Performs the same comparison as _qname_matches, but uses a qname which has
+  already been split into the namespace and tag.
+  """
   # If there is no expected namespace or tag, then everything will match.
-  if qname is None:
-    member_tag = None
-    member_namespace = None
-  else:
-    if qname.startswith('{'):
-      member_namespace = qname[1:qname.index('}')]
-      member_tag = qname[qname.index('}') + 1:]
-    else:
-      member_namespace = None
-      member_tag = qname
   return ((tag is None and namespace is None)
       # If there is a tag, but no namespace, see if the local tag matches.
       or (namespace is None and member_tag == tag)
@@ -482,27 +974,62 @@ def _qname_matches(tag, namespace, qname):
           and member_namespace is None))
 
 
-def parse(xml_string, target_class=None, version=1, encoding=None):
+def parse(xml_string, target_class=None, version=1, encoding=None,
+          lazy=False, compact=False, fields=None):
   """Parses the XML string according to the rules for the target_class.
 
+  In lazy mode, each object keeps the parsed XML nodes for its child
+  elements and converts a member only when it is first accessed. This
+  makes parsing cheaper when only a few members of a large entry or feed
+  will be used. The returned objects are instances of a subclass of the
+  target_class (see _get_lazy_class) and otherwise behave the same as
+  objects produced by a normal parse, including in to_string.
+
+  In compact mode, objects are instances of a subclass of the target_class
+  which keeps its members in __slots__ (see _get_compact_class). This
+  greatly reduces the memory needed to hold large feeds.
+
+  If fields are given, only the listed members are converted. Child
+  elements for any other member, and unknown child elements which would
+  usually be stored in extension_elements, are skipped. XML attributes and
+  text are always kept.
+
   Args:
-    xml_string: str or unicode
+    xml_string: str, unicode, or a file-like object with a read method
+        which takes the number of bytes to read, such as an HTTP response.
+        The XML is parsed as it is read from a file-like object, so the
+        whole document is never held in memory as a string.
     target_class: XmlElement or a subclass. If None is specified, the
         XmlElement class is used.
     version: int (optional) The version of the schema which should be used when
         converting the XML into an object. The default is 1.
     encoding: str (optional) The character encoding of the bytes in the
         xml_string. Default is 'UTF-8'.
+    lazy: boolean (optional) If True, child elements are converted the first
+        time they are accessed instead of while parsing. Default is False.
+    compact: boolean (optional) If True, the objects created use less
+        memory. Cannot be combined with lazy. Default is False.
+    fields: str or sequence of str (optional) The names of the members to
+        convert, using the syntax of the fields query parameter, for example
+        ('id', 'updated', 'entry(id,updated)'). Cannot be combined with
+        lazy. See _parse_fields.
   """
   if target_class is None:
     target_class = XmlElement
+  if lazy and (compact or fields is not None):
+    raise ValueError('Lazy parsing cannot be combined with compact or '
+                     'fields.')
+  if compact:
+    target_class = _get_compact_class(target_class)
+  if fields is not None:
+    fields = _parse_fields(fields)
   if isinstance(xml_string, unicode):
     if encoding is None:
       xml_string = xml_string.encode(STRING_ENCODING)
     else:
       xml_string = xml_string.encode(encoding)
-  tree = ElementTree.fromstring(xml_string)
-  return _xml_element_from_tree(tree, target_class, version)
+  return _xml_backend.parse_xml(xml_string, target_class, version, lazy,
+                                fields)
 
 
 Parse = parse
@@ -510,20 +1037,718 @@ xml_element_from_string = parse
 XmlElementFromString = xml_element_from_string
 
 
-def _xml_element_from_tree(tree, target_class, version=1):
-  if target_class._qname is None:
+# The number of bytes requested in each read when parsing from a stream.
+STREAM_READ_SIZE = 16 * 1024
+
+
+class ElementTreeBackend(object):
+  """Parses XML using an ElementTree compatible module.
+
+  A backend turns XML into XmlElement objects for parse, and provides the
+  ElementTree functions used by lazy parsing, iter_entries and the version 1
+  atom module. This backend uses the same cElementTree/ElementTree module
+  which atom.core uses to build trees in _to_tree.
+  """
+  name = 'etree'
+
+  def __init__(self, module=None):
+    self.module = module or ElementTree
+
+  def _make_parser(self):
+    return self.module.XMLParser()
+
+  def fromstring(self, xml_string):
+    """Returns the root Element of the XML in a str."""
+    return self.module.fromstring(xml_string)
+
+  def tree_from_stream(self, stream):
+    """Returns the root Element of the XML read from a file-like object.
+
+    Each block is passed to the parser as soon as it has been read, so
+    parsing overlaps with the arrival of the rest of the data.
+    """
+    parser = self._make_parser()
+    while 1:
+      data = stream.read(STREAM_READ_SIZE)
+      if not data:
+        break
+      parser.feed(data)
+    return parser.close()
+
+  def iterparse(self, stream, events):
+    return self.module.iterparse(stream, events=events)
+
+  def parse_xml(self, xml, target_class, version, lazy, fields):
+    """Converts XML into an instance of the target_class.
+
+    Args:
+      xml: str or a file-like object.
+      target_class: XmlElement or a subclass.
+      version: int
+      lazy: boolean
+      fields: dict of member names returned by _parse_fields, or None.
+    """
+    projection = None
+    if fields is not None:
+      projection = _get_projection(target_class, fields, version)
+    if hasattr(xml, 'read'):
+      tree = self.tree_from_stream(xml)
+    else:
+      tree = self.fromstring(xml)
+    return _xml_element_from_tree(tree, target_class, version, lazy,
+                                  projection)
+
+
+class LxmlBackend(ElementTreeBackend):
+  """Parses XML using lxml.etree, which must be installed.
+
+  Comments and processing instructions are removed while parsing, since
+  lxml would otherwise include them among the children of an element.
+  """
+  name = 'lxml'
+
+  def __init__(self):
+    from lxml import etree
+    ElementTreeBackend.__init__(self, etree)
+
+  def _make_parser(self):
+    return self.module.XMLParser(remove_comments=True, remove_pis=True)
+
+  def fromstring(self, xml_string):
+    return self.module.fromstring(xml_string, self._make_parser())
+
+  def iterparse(self, stream, events):
+    return self.module.iterparse(stream, events=events, remove_comments=True,
+                                 remove_pis=True)
+
+
+class ExpatBackend(ElementTreeBackend):
+  """Builds XmlElements directly from xml.parsers.expat events.
+
+  No ElementTree is created while parsing, each object is created and
+  filled in as its start tag, text and end tag are read. Lazy parsing needs
+  the ElementTree nodes, so in lazy mode (and for iter_entries) the
+  ElementTreeBackend behavior is used instead.
+  """
+  name = 'expat'
+
+  def __init__(self):
+    from xml.parsers import expat
+    ElementTreeBackend.__init__(self)
+    self.expat = expat
+
+  def parse_xml(self, xml, target_class, version, lazy, fields):
+    if lazy:
+      return ElementTreeBackend.parse_xml(self, xml, target_class, version,
+                                          lazy, fields)
+    if fields is not None:
+      # Reject unknown member names before parsing.
+      _get_projection(target_class, fields, version)
+    builder = _ExpatBuilder(self.expat, target_class, version, fields)
+    try:
+      if hasattr(xml, 'read'):
+        while 1:
+          data = xml.read(STREAM_READ_SIZE)
+          if not data:
+            break
+          builder.parser.Parse(data, 0)
+        builder.parser.Parse('', 1)
+      else:
+        builder.parser.Parse(xml, 1)
+    except self.expat.ExpatError, error:
+      raise getattr(ElementTree, 'ParseError', SyntaxError)(str(error))
+    return builder.root
+
+
+def _fix_text(text):
+  """Converts ASCII unicode to str, as ElementTree does."""
+  try:
+    return text.encode('ascii')
+  except UnicodeError:
+    return text
+
+
+class _ExpatBuilder(object):
+  """Handles expat events to create XmlElements without an ElementTree.
+
+  The conversion matches XmlElement._harvest_tree: children are stored in
+  the member given by the parent class' plan (or in _other_elements), the
+  text of an element is the character data before its first child, and
+  children outside of the requested fields are skipped.
+  """
+
+  def __init__(self, expat, target_class, version, fields):
+    self.parser = expat.ParserCreate(None, '}')
+    self.parser.buffer_text = True
+    self.parser.StartElementHandler = self.start
+    self.parser.EndElementHandler = self.end
+    self.parser.CharacterDataHandler = self.data
+    self.root = None
+    self._target_class = target_class
+    self._version = version
+    self._fields = fields
+    # Each entry is [instance, plan, fields, member_name, repeating, text]
+    # where text is a list of strings, or None once a child has started.
+    self._stack = []
+    # The depth of the subtree being skipped, if any.
+    self._skip = 0
+    self._names = {}
+
+  def _fix_name(self, name):
+    try:
+      return self._names[name]
+    except KeyError:
+      qname = _fix_text(name)
+      if '}' in qname:
+        qname = '{' + qname
+      self._names[name] = qname
+      return qname
+
+  def start(self, name, attributes):
+    if self._skip:
+      self._skip += 1
+      return
+    qname = self._fix_name(name)
+    member_name = None
+    repeating = False
+    if self._stack:
+      parent = self._stack[-1]
+      self._end_text(parent)
+      parent_plan = parent[1]
+      parent_fields = parent[2]
+      rule = parent_plan.child_classes.get(qname)
+      if rule is None:
+        if parent_fields is not None:
+          self._skip = 1
+          return
+        member_class = parent_plan.other_class
+        fields = None
+      else:
+        member_name, member_class, repeating = rule
+        if parent_fields is None:
+          fields = None
+        elif member_name in parent_fields:
+          fields = parent_fields[member_name]
+        else:
+          self._skip = 1
+          return
+    else:
+      member_class = self._target_class
+      fields = self._fields
+    plan = _get_plan(member_class, self._version)
+    if plan.qname is not None and plan.qname != qname:
+      # As in _xml_element_from_tree, the root must match the target class.
+      self._skip = 1
+      return
+    instance = member_class()
+    if plan.qname is None:
+      instance._qname = qname
+    attribute_members = plan.attribute_members
+    for attribute, value in attributes.iteritems():
+      attribute = self._fix_name(attribute)
+      attribute_name = attribute_members.get(attribute)
+      if attribute_name is None:
+        instance._other_attributes[attribute] = _fix_text(value)
+      else:
+        setattr(instance, attribute_name, _fix_text(value))
+    self._stack.append([instance, plan, fields, member_name, repeating, []])
+
+  def data(self, text):
+    if not self._skip and self._stack:
+      chunks = self._stack[-1][5]
+      if chunks is not None:
+        chunks.append(text)
+
+  def end(self, name):
+    if self._skip:
+      self._skip -= 1
+      return
+    current = self._stack.pop()
+    self._end_text(current)
+    instance = current[0]
+    if not self._stack:
+      self.root = instance
+      return
+    parent = self._stack[-1][0]
+    member_name = current[3]
+    if member_name is None:
+      parent._other_elements.append(instance)
+    elif current[4]:
+      members = getattr(parent, member_name)
+      # Make sure the member is set to a list for repeating elements.
+      if members is None:
+        members = []
+        setattr(parent, member_name, members)
+      members.append(instance)
+    else:
+      setattr(parent, member_name, instance)
+
+  def _end_text(self, entry):
+    """Sets the text of the element once its text is complete."""
+    chunks = entry[5]
+    if chunks is not None:
+      entry[5] = None
+      if chunks:
+        entry[0].text = _fix_text(''.join(chunks))
+
+
+# Maps backend names to the classes which implement them.
+_xml_backends = {'etree': ElementTreeBackend, 'lxml': LxmlBackend,
+                 'expat': ExpatBackend}
+_xml_backend = None
+# The environment variable which selects the backend when atom.core loads.
+XML_BACKEND_ENV = 'ATOM_XML_BACKEND'
+
+
+def register_xml_backend(name, backend_class):
+  """Makes a backend available to set_xml_backend.
+
+  Args:
+    name: str The name used to select the backend.
+    backend_class: A class (or other callable) which takes no arguments and
+        returns an object with the interface of ElementTreeBackend. It
+        should raise ImportError if a required module is not installed.
+  """
+  _xml_backends[name] = backend_class
+
+
+RegisterXmlBackend = register_xml_backend
+
+
+def set_xml_backend(name):
+  """Selects the XML backend used by parse, iter_entries and atom.
+
+  The built in backends are 'etree' (the default, which uses cElementTree
+  or ElementTree), 'lxml' (lxml.etree, if installed) and 'expat', which
+  creates XmlElements directly from xml.parsers.expat events. A backend can
+  also be chosen by setting the ATOM_XML_BACKEND environment variable before
+  atom.core is imported; if that backend cannot be used, a warning is given
+  and 'etree' is used instead.
+
+  Raises:
+    ValueError if there is no backend with the name.
+    ImportError if the modules needed by the backend are not installed.
+  """
+  global _xml_backend
+  if name not in _xml_backends:
+    raise ValueError('Unknown XML backend %r, choose from %s' % (
+        name, ', '.join(sorted(_xml_backends))))
+  _xml_backend = _xml_backends[name]()
+
+
+SetXmlBackend = set_xml_backend
+
+
+def get_xml_backend():
+  """Returns the backend object selected by set_xml_backend."""
+  return _xml_backend
+
+
+GetXmlBackend = get_xml_backend
+
+
+def _xml_element_from_tree(tree, target_class, version=1, lazy=False,
+                           projection=None):
+  if lazy:
+    target_class = _get_lazy_class(target_class)
+  qname = _get_plan(target_class, version).qname
+  if qname is None:
     instance = target_class()
     instance._qname = tree.tag
-    instance._harvest_tree(tree, version)
-    return instance
   # TODO handle the namespace-only case
   # Namespace only will be used with Google Spreadsheets rows and
   # Google Base item attributes.
-  elif tree.tag == _get_qname(target_class, version):
+  elif tree.tag == qname:
     instance = target_class()
-    instance._harvest_tree(tree, version)
-    return instance
-  return None
+  else:
+    return None
+  if lazy:
+    instance._defer_tree(tree, version)
+  else:
+    instance._harvest_tree(tree, version, projection)
+  return instance
+
+
+def iter_entries(xml_stream, feed_class, version=1, encoding=None):
+  """Incrementally parses a feed, returning its entries one at a time.
+
+  Unlike parse, which builds the complete object tree for the feed, this
+  function reads the XML in pieces and converts each entry as soon as its
+  closing tag has been parsed. The entry's portion of the XML tree is then
+  discarded, so the memory required does not grow with the number of
+  entries in the feed.
+
+  Args:
+    xml_stream: A file-like object with a read method, or a str or unicode
+        containing the XML for the feed.
+    feed_class: XmlElement subclass which describes the feed. The class of
+        each entry is determined by the feed class' entry member, for
+        example entry = [atom.data.Entry].
+    version: int (optional) The version of the schema which should be used
+        when converting the XML into objects. The default is 1.
+    encoding: str (optional) The character encoding to use if xml_stream is
+        a unicode object. Default is 'UTF-8'.
+
+  Returns:
+    An EntryIterator which yields instances of the entry class. The feed
+    level data is available in the iterator's feed member.
+  """
+  return EntryIterator(xml_stream, feed_class, version=version,
+                       encoding=encoding)
+
+
+IterEntries = iter_entries
+
+
+class EntryIterator(object):
+  """Yields the entries in a feed as they are parsed from a stream.
+
+  All children of the feed other than the entries (id, links,
+  openSearch:totalResults, etc.) are converted and stored in the feed member,
+  which is an instance of the feed class. Feed members which appear in the
+  XML before the first entry are available as soon as the first entry has
+  been returned. Members which follow the entries are available once
+  iteration is complete. The feed's entry list is left empty.
+  """
+  feed = None
+
+  def __init__(self, xml_stream, feed_class, version=1, encoding=None,
+               member_name='entry'):
+    if isinstance(xml_stream, unicode):
+      xml_stream = xml_stream.encode(encoding or STRING_ENCODING)
+    if isinstance(xml_stream, str):
+      xml_stream = StringIO.StringIO(xml_stream)
+    self._feed_class = feed_class
+    self._version = version
+    # Find the parsing rule for the feed's repeating entry member.
+    self._entry_qname = None
+    self._entry_class = None
+    for qname, definition in feed_class._get_rules(version)[1].iteritems():
+      if definition[0] == member_name:
+        self._entry_qname = qname
+        self._entry_class = definition[1]
+        break
+    self._events = iter(_xml_backend.iterparse(xml_stream,
+                                               ('start', 'end')))
+    self._root = None
+    self._depth = 0
+    self._done = False
+
+  def __iter__(self):
+    return self
+
+  def next(self):
+    if self._done:
+      raise StopIteration()
+    for event, element in self._events:
+      if event == 'start':
+        self._depth += 1
+        if self._depth == 1:
+          self._start_feed(element)
+          if self.feed is None:
+            break
+        continue
+      # This is an end event.
+      self._depth -= 1
+      if self._depth == 1:
+        # A direct child of the feed has been fully parsed. Convert it and
+        # remove it from the tree so that it can be garbage collected.
+        self._root.remove(element)
+        if element.tag == self._entry_qname:
+          entry = _xml_element_from_tree(element, self._entry_class,
+                                         self._version)
+          element.clear()
+          return entry
+        self.feed._harvest_child(element, self._version)
+        element.clear()
+      elif self._depth == 0:
+        if element.text:
+          self.feed.text = element.text
+        break
+    self._done = True
+    self._events = None
+    self._root = None
+    raise StopIteration()
+
+  def _start_feed(self, element):
+    if self._feed_class._qname is None:
+      self.feed = self._feed_class()
+      self.feed._qname = element.tag
+    elif element.tag == _get_qname(self._feed_class, self._version):
+      self.feed = self._feed_class()
+    else:
+      return
+    self._root = element
+    self.feed._harvest_attributes(element, self._version)
+
+
+class XmlWriter(object):
+  """Writes the XML for an XmlElement without building an ElementTree.
+
+  The text is produced directly from the object graph and matches the
+  output of ElementTree.tostring for the tree built by _to_tree: all
+  namespace prefixes are declared on the root element, attributes are
+  sorted and non-ASCII characters are written as character references.
+
+  Iterating over the writer yields the XML in pieces: the start tag of the
+  root element, then the XML for each of its children, then the end tag.
+  Since it is iterable and len() gives the size of the XML, a writer may be
+  passed to atom.http_core.HttpRequest.add_body_part so that a large feed
+  is sent without ever being held in memory as one string:
+
+    writer = atom.core.XmlWriter(batch_feed)
+    http_request.add_body_part(writer, 'application/atom+xml', len(writer))
+  """
+
+  def __init__(self, element, version=1, encoding=None):
+    """Constructs a writer for an XmlElement.
+
+    Args:
+      element: XmlElement The object to be converted to XML.
+      version: int (optional) The version of the schema which should be used
+          when converting the element.
+      encoding: str (optional) The encoding of str text and attribute values
+          in the root element. Defaults to STRING_ENCODING.
+    """
+    self.element = element
+    self.version = version
+    self.encoding = encoding
+
+  def __iter__(self):
+    qnames, namespaces = self._collect_names()
+    declarations = _namespace_declarations(namespaces)
+    chunks = []
+    end_tag, children = _write_start(chunks.append, self.element,
+        self.version, self.encoding or STRING_ENCODING, qnames, namespaces,
+        declarations)
+    yield ''.join(chunks)
+    for child in children:
+      chunks = []
+      _write_element(chunks.append, child, self.version, STRING_ENCODING,
+                     qnames, namespaces)
+      yield ''.join(chunks)
+    if end_tag:
+      yield end_tag
+
+  def __len__(self):
+    size = 0
+    for chunk in self:
+      size += len(chunk)
+    return size
+
+  def write_to(self, stream):
+    """Writes the XML to a file-like object with a write method."""
+    qnames, namespaces = self._collect_names()
+    _write_element(stream.write, self.element, self.version,
+                   self.encoding or STRING_ENCODING, qnames, namespaces,
+                   _namespace_declarations(namespaces))
+
+  WriteTo = write_to
+
+  def to_string(self):
+    """Returns the XML as a single string.
+
+    The namespace declarations for the root element are filled in after the
+    rest of the XML has been written, so the element is only traversed once.
+    """
+    qnames = {None: None}
+    namespaces = {}
+    chunks = []
+    # The empty declarations are a placeholder which follows the root tag.
+    _write_element(chunks.append, self.element, self.version,
+                   self.encoding or STRING_ENCODING, qnames, namespaces, '')
+    if qnames[_get_qname(self.element, self.version)] is not None:
+      chunks[1] = _namespace_declarations(namespaces)
+    return ''.join(chunks)
+
+  ToString = to_string
+
+  def _collect_names(self):
+    """Finds the prefixed name for each qname used in the XML.
+
+    Returns:
+      A pair of dicts: the first maps each element and attribute qname to
+      the name which is written, and the second maps each namespace to its
+      prefix.
+    """
+    qnames = {None: None}
+    namespaces = {}
+    _collect_qnames(self.element, self.version,
+                    self.encoding or STRING_ENCODING, qnames, namespaces)
+    return qnames, namespaces
+
+
+# The prefixes registered with ElementTree are used for the same namespaces
+# when writing XML, so that the output matches ElementTree.tostring.
+try:
+  from xml.etree.ElementTree import _namespace_map as _registered_namespaces
+except ImportError:
+  _registered_namespaces = {'http://www.w3.org/XML/1998/namespace': 'xml'}
+
+
+def _serialization_parts(element, version, encoding):
+  """Returns the qname, attributes, text and children to write for element.
+
+  The members are read in the same order as in XmlElement._attach_members.
+  """
+  plan = _get_plan(element.__class__, version)
+  children = []
+  for member_name, repeating in plan.element_members:
+    member = getattr(element, member_name)
+    if member and repeating:
+      children.extend(member)
+    elif member:
+      children.append(member)
+  attributes = {}
+  for attribute_tag, member_name in plan.attribute_members.iteritems():
+    value = getattr(element, member_name)
+    if value:
+      attributes[attribute_tag] = value
+  children.extend(element._other_elements)
+  for key, value in element._other_attributes.iteritems():
+    if not isinstance(value, unicode):
+      value = value.decode(encoding)
+    attributes[key] = value
+  text = element.text
+  if text and not isinstance(text, unicode):
+    text = text.decode(encoding)
+  return _get_qname(element, version), attributes, text, children
+
+
+def _add_qname(qname, qnames, namespaces):
+  """Chooses the prefixed name for a qname which has not been seen before."""
+  try:
+    if qname[:1] == '{':
+      uri, tag = qname[1:].rsplit('}', 1)
+      prefix = namespaces.get(uri)
+      if prefix is None:
+        prefix = _registered_namespaces.get(uri)
+        if prefix is None:
+          prefix = 'ns%d' % len(namespaces)
+        if prefix != 'xml':
+          namespaces[uri] = prefix
+      if prefix:
+        qnames[qname] = ('%s:%s' % (prefix, tag)).encode('us-ascii')
+      else:
+        qnames[qname] = tag.encode('us-ascii')
+    else:
+      qnames[qname] = qname.encode('us-ascii')
+  except (TypeError, AttributeError):
+    _raise_serialization_error(qname)
+
+
+def _collect_qnames(element, version, encoding, qnames, namespaces):
+  qname, attributes, text, children = _serialization_parts(element, version,
+                                                           encoding)
+  if qname not in qnames:
+    _add_qname(qname, qnames, namespaces)
+  for key in attributes:
+    if key not in qnames:
+      _add_qname(key, qnames, namespaces)
+  for child in children:
+    _collect_qnames(child, version, STRING_ENCODING, qnames, namespaces)
+
+
+def _write_start(write, element, version, encoding, qnames, namespaces,
+                 declarations=None):
+  """Writes the start tag and text of an element.
+
+  Args:
+    write: function which is called with each piece of XML text.
+    element: XmlElement
+    version: int
+    encoding: str Used to decode str text and attribute values.
+    qnames: dict Maps qnames to prefixed names. New qnames are added.
+    namespaces: dict Maps namespaces to prefixes. New namespaces are added.
+    declarations: str (optional) Namespace declarations to be written in the
+        start tag of this element.
+
+  Returns:
+    A pair containing the end tag which should be written after the
+    children (possibly an empty string) and the list of child elements.
+  """
+  qname, attributes, text, children = _serialization_parts(element, version,
+                                                           encoding)
+  if qname not in qnames:
+    _add_qname(qname, qnames, namespaces)
+  for key in attributes:
+    if key not in qnames:
+      _add_qname(key, qnames, namespaces)
+  tag = qnames[qname]
+  if tag is None:
+    # An element without a qname contributes only its text and children.
+    if text:
+      write(_escape_cdata(text))
+    return '', children
+  write('<' + tag)
+  if declarations is not None:
+    write(declarations)
+  if attributes:
+    for key, value in sorted(attributes.iteritems()):
+      write(' %s="%s"' % (qnames[key], _escape_attrib(value)))
+  if text or children:
+    write('>')
+    if text:
+      write(_escape_cdata(text))
+    return '</' + tag + '>', children
+  write(' />')
+  return '', children
+
+
+def _write_element(write, element, version, encoding, qnames, namespaces,
+                   declarations=None):
+  # As in XmlElement._become_child, children always use STRING_ENCODING.
+  end_tag, children = _write_start(write, element, version, encoding, qnames,
+                                   namespaces, declarations)
+  for child in children:
+    _write_element(write, child, version, STRING_ENCODING, qnames, namespaces)
+  if end_tag:
+    write(end_tag)
+
+
+def _namespace_declarations(namespaces):
+  declarations = []
+  for namespace, prefix in sorted(namespaces.items(), key=lambda x: x[1]):
+    if prefix:
+      prefix = ':' + prefix
+    declarations.append(' xmlns%s="%s"' % (prefix.encode('us-ascii'),
+                                           _escape_attrib(namespace)))
+  return ''.join(declarations)
+
+
+def _escape_cdata(text):
+  try:
+    if '&' in text:
+      text = text.replace('&', '&amp;')
+    if '<' in text:
+      text = text.replace('<', '&lt;')
+    if '>' in text:
+      text = text.replace('>', '&gt;')
+    return text.encode('us-ascii', 'xmlcharrefreplace')
+  except (TypeError, AttributeError):
+    _raise_serialization_error(text)
+
+
+def _escape_attrib(text):
+  try:
+    if '&' in text:
+      text = text.replace('&', '&amp;')
+    if '<' in text:
+      text = text.replace('<', '&lt;')
+    if '>' in text:
+      text = text.replace('>', '&gt;')
+    if '"' in text:
+      text = text.replace('"', '&quot;')
+    if '\n' in text:
+      text = text.replace('\n', '&#10;')
+    return text.encode('us-ascii', 'xmlcharrefreplace')
+  except (TypeError, AttributeError):
+    _raise_serialization_error(text)
+
+
+def _raise_serialization_error(text):
+  raise TypeError('cannot serialize %r (type %s)' % (text,
+                                                     type(text).__name__))
 
 
 class XmlAttribute(object):
@@ -532,3 +1757,23 @@ class XmlAttribute(object):
     self._qname = qname
     self.value = value
 
+
+def _set_default_xml_backend():
+  """Selects the backend named by ATOM_XML_BACKEND, or else 'etree'.
+
+  A backend named in the environment which is unknown or not installed
+  causes a warning instead of making atom.core impossible to import.
+  """
+  name = os.environ.get(XML_BACKEND_ENV)
+  if name:
+    try:
+      set_xml_backend(name)
+      return
+    except (ImportError, ValueError), error:
+      warnings.warn('Cannot use the XML backend %r named by %s (%s), using '
+                    'etree instead' % (name, XML_BACKEND_ENV, error),
+                    RuntimeWarning)
+  set_xml_backend('etree')
+
+
+_set_default_xml_backend()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Runs HTTP requests on a pool of threads.
+
+A RequestExecutor runs functions (usually client methods like
+gdata.client.GDClient.get_feed) in worker threads and returns a Future for
+each call. Each call is made on behalf of a host, and no more than
+max_per_host calls for the same host are run at once, so that a batch of
+requests to one server does not open an unbounded number of connections.
+
+  executor = atom.executor.RequestExecutor(max_workers=8, max_per_host=4)
+  futures = [executor.submit(uri.host, client.get_feed, uri)
+             for uri in uris]
+  feeds = [future.result() for future in futures]
+  executor.shutdown()
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import sys
+import threading
+
+
+class Error(Exception):
+  pass
+
+
+class Timeout(Error):
+  pass
+
+
+class Cancelled(Error):
+  pass
+
+
+class ExecutorShutdown(Error):
+  pass
+
+
+class Future(object):
+  """The eventual result of a call submitted to a RequestExecutor."""
+
+  def __init__(self):
+    self._done = threading.Event()
+    self._result = None
+    self._exc_info = None
+    self._callbacks = []
+    self._lock = threading.Lock()
+
+  def done(self):
+    return self._done.isSet()
+
+  Done = done
+
+  def result(self, timeout=None):
+    """Waits for the call to finish and returns its result.
+
+    If the call raised an exception, the same exception is raised here.
+
+    Args:
+      timeout: float (optional) The number of seconds to wait before raising
+               atom.executor.Timeout. By default, waits until the call is
+               finished.
+    """
+    self._wait(timeout)
+    if self._exc_info is not None:
+      raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+    return self._result
+
+  Result = result
+
+  def exception(self, timeout=None):
+    """Waits for the call to finish and returns the exception it raised.
+
+    Returns None if the call returned normally.
+    """
+    self._wait(timeout)
+    if self._exc_info is not None:
+      return self._exc_info[1]
+    return None
+
+  def add_done_callback(self, function):
+    """Calls function(future) once the call has finished.
+
+    If the call has already finished, function is called right away.
+    Otherwise it is called by the thread which finishes the call, and any
+    exception it raises is ignored.
+    """
+    self._lock.acquire()
+    try:
+      if not self._done.isSet():
+        self._callbacks.append(function)
+        return
+    finally:
+      self._lock.release()
+    function(self)
+
+  AddDoneCallback = add_done_callback
+
+  def _wait(self, timeout):
+    self._done.wait(timeout)
+    if not self._done.isSet():
+      raise Timeout('The call did not finish within %s seconds' % timeout)
+
+  def _set_result(self, result):
+    self._result = result
+    self._finish()
+
+  def _set_exc_info(self, exc_info):
+    self._exc_info = exc_info
+    self._finish()
+
+  def _finish(self):
+    self._lock.acquire()
+    try:
+      self._done.set()
+      callbacks, self._callbacks = self._callbacks, []
+    finally:
+      self._lock.release()
+    for function in callbacks:
+      try:
+        function(self)
+      except Exception:
+        # A failing callback must not prevent the others from running or
+        # stop the thread which finished the call.
+        pass
+
+
+def chain(future, function):
+  """Returns a Future for the result of calling function(future.result()).
+
+  If future raises an exception, function is not called and the returned
+  Future raises the same exception. If function returns another Future, the
+  returned Future takes on its outcome once it is done.
+  """
+  chained = Future()
+  def call(finished):
+    try:
+      result = function(finished.result())
+    except:
+      chained._set_exc_info(sys.exc_info())
+      return
+    if isinstance(result, Future):
+      result.add_done_callback(lambda inner: _copy_outcome(inner, chained))
+    else:
+      chained._set_result(result)
+  future.add_done_callback(call)
+  return chained
+
+
+Chain = chain
+
+
+def _copy_outcome(source, destination):
+  if source._exc_info is not None:
+    destination._set_exc_info(source._exc_info)
+  else:
+    destination._set_result(source._result)
+
+
+class _Task(object):
+
+  def __init__(self, host, function, args, kwargs):
+    self.future = Future()
+    self.host = host
+    self.function = function
+    self.args = args
+    self.kwargs = kwargs
+
+  def run(self):
+    try:
+      result = self.function(*self.args, **self.kwargs)
+    except:
+      self.future._set_exc_info(sys.exc_info())
+    else:
+      self.future._set_result(result)
+
+
+class RequestExecutor(object):
+  """Runs calls on up to max_workers threads, max_per_host at a time per host.
+
+  Calls are started in the order in which they were submitted, except that a
+  call waits while its host already has max_per_host calls running.
+  Worker threads are started as needed and are daemon threads, so an
+  executor which is not shut down does not keep the program running.
+  """
+
+  def __init__(self, max_workers=8, max_per_host=4):
+    self.max_workers = max_workers
+    self.max_per_host = max_per_host
+    self._pending = []
+    # Maps each host to the number of its calls which are running.
+    self._running = {}
+    self._threads = []
+    self._idle_threads = 0
+    self._shutdown = False
+    self._condition = threading.Condition()
+
+  def submit(self, host, function, *args, **kwargs):
+    """Schedules function(*args, **kwargs) to be called in a worker thread.
+
+    Args:
+      host: str The server which the call will contact, used to limit the
+            number of concurrent calls to each host. May be None for calls
+            which should only be limited by max_workers.
+      function: The callable to run.
+
+    Returns:
+      An atom.executor.Future for the result of the call.
+    """
+    task = _Task(host, function, args, kwargs)
+    self._condition.acquire()
+    try:
+      if self._shutdown:
+        raise ExecutorShutdown('Cannot submit calls after shutdown')
+      self._pending.append(task)
+      if (len(self._pending) > self._idle_threads
+          and len(self._threads) < self.max_workers):
+        thread = threading.Thread(target=self._work)
+        thread.setDaemon(True)
+        self._threads.append(thread)
+        thread.start()
+      self._condition.notify()
+    finally:
+      self._condition.release()
+    return task.future
+
+  Submit = submit
+
+  def shutdown(self, wait=True, cancel_pending=False):
+    """Stops accepting calls and lets the worker threads exit.
+
+    Args:
+      wait: bool If True, blocks until all calls have finished.
+      cancel_pending: bool If True, calls which have not started yet are
+                      not run. Their futures raise atom.executor.Cancelled.
+    """
+    self._condition.acquire()
+    try:
+      self._shutdown = True
+      if cancel_pending:
+        cancelled, self._pending = self._pending, []
+        for task in cancelled:
+          task.future._set_exc_info(
+              (Cancelled, Cancelled('The executor was shut down'), None))
+      self._condition.notifyAll()
+      threads = self._threads[:]
+    finally:
+      self._condition.release()
+    if wait:
+      for thread in threads:
+        if thread is not threading.currentThread():
+          thread.join()
+
+  Shutdown = shutdown
+
+  def _next_task(self):
+    """Removes the first pending task whose host is below its limit.
+
+    Must be called while holding the condition's lock.
+    """
+    for i, task in enumerate(self._pending):
+      if (task.host is None
+          or self._running.get(task.host, 0) < self.max_per_host):
+        del self._pending[i]
+        if task.host is not None:
+          self._running[task.host] = self._running.get(task.host, 0) + 1
+        return task
+    return None
+
+  def _work(self):
+    while True:
+      self._condition.acquire()
+      try:
+        task = self._next_task()
+        while task is None:
+          if self._shutdown and not self._pending:
+            return
+          self._idle_threads += 1
+          self._condition.wait()
+          self._idle_threads -= 1
+          task = self._next_task()
+      finally:
+        self._condition.release()
+      task.run()
+      self._condition.acquire()
+      try:
+        if task.host is not None:
+          self._running[task.host] -= 1
+          if not self._running[task.host]:
+            del self._running[task.host]
+        # Tasks held back by the host limit may now be able to run.
+        self._condition.notifyAll()
+      finally:
+        self._condition.release()
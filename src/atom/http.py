@@ -40,17 +40,8 @@ import os
 import httplib
 import atom.url
 import atom.http_interface
-import socket
 import base64
 import atom.http_core
-ssl_imported = False
-ssl = None
-try:
-  import ssl
-  ssl_imported = True
-except ImportError:
-  pass
-  
 
 
 class ProxyError(atom.http_interface.Error):
@@ -68,10 +59,15 @@ class HttpClient(atom.http_interface.GenericHttpClient):
   # Added to allow old v1 HttpClient objects to use the new 
   # http_code.HttpClient. Used in unit tests to inject a mock client.
   v2_http_client = None
+  # Set to True to ask servers for gzip or deflate compressed responses,
+  # which are decompressed as they are read.
+  compress_responses = False
 
   def __init__(self, headers=None):
     self.debug = False
     self.headers = headers or {}
+    # Counts the bytes read and decoded for compressed responses.
+    self.transfer_stats = atom.http_core.TransferStats()
 
   def request(self, operation, url, data=None, headers=None):
     """Performs an HTTP call to the server, supports GET, POST, PUT, and 
@@ -114,13 +110,19 @@ class HttpClient(atom.http_interface.GenericHttpClient):
     if 'Content-Type' not in all_headers:
       all_headers['Content-Type'] = DEFAULT_CONTENT_TYPE
 
-    if self.v2_http_client is not None:
+    if self.compress_responses and 'Accept-Encoding' not in all_headers:
+      all_headers['Accept-Encoding'] = atom.http_core.ACCEPT_ENCODING
+
+    v2_http_client = self._get_v2_http_client(url)
+    if v2_http_client is not None:
       http_request = atom.http_core.HttpRequest(method=operation)
       atom.http_core.Uri.parse_uri(str(url)).modify_request(http_request)
       http_request.headers = all_headers
-      if data:
+      if isinstance(data, list):
+        http_request._body_parts.extend(data)
+      elif data:
         http_request._body_parts.append(data)
-      return self.v2_http_client.request(http_request=http_request)
+      return self._decode(v2_http_client.request(http_request=http_request))
 
     if not isinstance(url, atom.url.Url):
       if isinstance(url, types.StringTypes):
@@ -171,7 +173,15 @@ class HttpClient(atom.http_interface.GenericHttpClient):
         _send_data_part(data, connection)
 
     # Return the HTTP Response from the server.
-    return connection.getresponse()
+    return self._decode(connection.getresponse())
+
+  def _get_v2_http_client(self, url):
+    return self.v2_http_client
+
+  def _decode(self, response):
+    if self.compress_responses:
+      return atom.http_core.decode_response(response, self.transfer_stats)
+    return response
     
   def _prepare_connection(self, url, headers):
     if not isinstance(url, atom.url.Url):
@@ -203,64 +213,33 @@ class ProxiedHttpClient(HttpClient):
   be in the 'proxy-username' or 'proxy_username' variable and the 
   'proxy-password' or 'proxy_password' variable.
   
-  After connecting to the proxy server, the request is completed as in 
-  HttpClient.request.
+  HTTPS requests through a proxy are sent by an
+  atom.http_core.ProxiedHttpClient, which keeps the tunnels opened by the
+  proxy and reuses them for later requests to the same host. Other requests
+  are completed as in HttpClient.request after connecting to the proxy
+  server.
   """
+
+  def __init__(self, headers=None):
+    HttpClient.__init__(self, headers=headers)
+    self.tunnel_client = atom.http_core.ProxiedHttpClient()
+
+  def _get_v2_http_client(self, url):
+    if (self.v2_http_client is None and str(url).startswith('https:')
+        and os.environ.get('https_proxy')):
+      self.tunnel_client.debug = self.debug
+      return self.tunnel_client
+    return self.v2_http_client
+
   def _prepare_connection(self, url, headers):
     proxy_auth = _get_proxy_auth()
     if url.protocol == 'https':
       # destination is https
       proxy = os.environ.get('https_proxy')
       if proxy:
-        # Set any proxy auth headers 
-        if proxy_auth:
-          proxy_auth = 'Proxy-authorization: %s' % proxy_auth
-          
-        # Construct the proxy connect command.
-        port = url.port
-        if not port:
-          port = '443'
-        proxy_connect = 'CONNECT %s:%s HTTP/1.0\r\n' % (url.host, port)
-        
-        # Set the user agent to send to the proxy
-        if headers and 'User-Agent' in headers:
-          user_agent = 'User-Agent: %s\r\n' % (headers['User-Agent'])
-        else:
-          user_agent = ''
-        
-        proxy_pieces = '%s%s%s\r\n' % (proxy_connect, proxy_auth, user_agent)
-        
-        # Find the proxy host and port.
-        proxy_url = atom.url.parse_url(proxy)
-        if not proxy_url.port:
-          proxy_url.port = '80'
-        
-        # Connect to the proxy server, very simple recv and error checking
-        p_sock = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        p_sock.connect((proxy_url.host, int(proxy_url.port)))
-        p_sock.sendall(proxy_pieces)
-        response = ''
-
-        # Wait for the full response.
-        while response.find("\r\n\r\n") == -1:
-          response += p_sock.recv(8192)
-       
-        p_status = response.split()[1]
-        if p_status != str(200):
-          raise ProxyError('Error status=%s' % str(p_status))
-
-        # Trivial setup for ssl socket.
-        sslobj = None
-        if ssl_imported:
-          sslobj = ssl.wrap_socket(p_sock, None, None)
-        else:
-          sock_ssl = socket.ssl(p_sock, None, None)
-          sslobj = httplib.FakeSocket(p_sock, sock_ssl)
- 
-        # Initalize httplib and replace with the proxy socket.
-        connection = httplib.HTTPConnection(proxy_url.host)
-        connection.sock = sslobj
-        return connection
+        # Open a tunnel through the proxy in the same way as the v2 client.
+        return self.tunnel_client._get_connection(
+            atom.http_core.Uri.parse_uri(str(url)), headers)
       else:
         # The request was HTTPS, but there was no https_proxy set.
         return HttpClient._prepare_connection(self, url, headers)
@@ -280,10 +259,42 @@ class ProxiedHttpClient(HttpClient):
         # The request was HTTP, but there was no http_proxy set.
         return HttpClient._prepare_connection(self, url, headers)
 
+  def close(self):
+    """Closes the idle tunnels held by this client."""
+    self.tunnel_client.close()
+
   def _get_access_url(self, url):
     return url.to_string()
 
 
+class PooledHttpClient(ProxiedHttpClient):
+  """Performs HTTP requests over reusable keep-alive connections.
+
+  Adapts atom.http_core.PooledHttpClient for use with v1 services, for
+  example:
+
+    service.http_client = atom.http.PooledHttpClient()
+
+  Responses must be read completely so that their connections can be reused.
+  """
+
+  def __init__(self, headers=None, max_idle_per_host=4, idle_timeout=30,
+               pool=None):
+    ProxiedHttpClient.__init__(self, headers=headers)
+    self.v2_http_client = atom.http_core.PooledHttpClient(
+        max_idle_per_host=max_idle_per_host, idle_timeout=idle_timeout,
+        pool=pool)
+
+  def request(self, operation, url, data=None, headers=None):
+    self.v2_http_client.debug = self.debug
+    return ProxiedHttpClient.request(self, operation, url, data=data,
+                                     headers=headers)
+
+  def close(self):
+    """Closes the idle connections held by this client's pool."""
+    self.v2_http_client.close()
+
+
 def _get_proxy_auth():
   proxy_username = os.environ.get('proxy-username')
   if not proxy_username:
@@ -303,6 +314,9 @@ def _send_data_part(data, connection):
   if isinstance(data, types.StringTypes):
     connection.send(data)
     return
+  # Regular files are sent without reading them into strings.
+  elif hasattr(data, 'read') and atom.http_core._send_file(data, connection):
+    return
   # Check to see if data is a file-like object that has a read method.
   elif hasattr(data, 'read'):
     # Read the file and send it a chunk at a time.
@@ -22,11 +22,18 @@
 __author__ = 'j.s@google.com (Jeff Scudder)'
 
 
+import mmap
 import os
+import stat
 import StringIO
 import urlparse
 import urllib
 import httplib
+import select
+import socket
+import threading
+import time
+import zlib
 ssl = None
 try:
   import ssl
@@ -83,6 +90,10 @@ class HttpRequest(object):
   """
   method = None
   uri = None
+  # An atom.observer.RequestEvent in which the HTTP client records how long
+  # the request took, set while the request is made if observers are
+  # installed.
+  event = None
 
   def __init__(self, uri=None, method=None, headers=None):
     """Construct an HTTP request.
@@ -109,17 +120,26 @@ class HttpRequest(object):
     request. This method is designed to create MIME 1.0 requests as specified
     in RFC 1341.
 
+    If the size of any part is not known, the request body is sent using
+    chunked transfer encoding instead of with a Content-Length, so that
+    data which is still being produced can be sent as it becomes available.
+
     Args:
-      data: str or a file-like object containing a part of the request body.
+      data: str, a file-like object or an iterable which yields strings
+            (such as an atom.core.XmlWriter or a generator) containing a part
+            of the request body. An iterable is read again each time the
+            request is sent.
       mime_type: str The MIME type describing the data
-      size: int Required if the data is a file like object. If the data is a
+      size: int (optional) The number of bytes in a file like object or an
+            iterable. If omitted, the body will be chunked. If the data is a
             string, the size is calculated so this parameter is ignored.
     """
     if isinstance(data, str):
       size = len(data)
     if size is None:
-      # TODO: support chunked transfer if some of the body is of unknown size.
-      raise UnknownSize('Each part of the body must have a known size.')
+      self.headers.pop('Content-Length', None)
+      self.headers['Transfer-Encoding'] = 'chunked'
+      size = 0
     if 'Content-Length' in self.headers:
       content_length = int(self.headers['Content-Length'])
     else:
@@ -169,7 +189,8 @@ class HttpRequest(object):
       self._body_parts.insert(-1, type_string)
       content_length += len(type_string)
       self._body_parts.insert(-1, data)
-    self.headers['Content-Length'] = str(content_length)
+    if self.headers.get('Transfer-Encoding') != 'chunked':
+      self.headers['Content-Length'] = str(content_length)
   # I could add an "append_to_body_part" method as well.
 
   AddBodyPart = add_body_part
@@ -394,6 +415,156 @@ class HttpResponse(object):
       return self._body.read(amt)
 
 
+# Sent in the Accept-Encoding header when an HttpClient's compress_responses
+# is True.
+ACCEPT_ENCODING = 'gzip, deflate'
+# The number of compressed bytes read from the server at a time.
+DECODE_READ_SIZE = 16 * 1024
+_ENCODED_HEADERS = ('content-encoding', 'content-length')
+
+
+class TransferStats(object):
+  """Counts the bytes of compressed responses received by an HttpClient.
+
+  wire_bytes is the number of bytes read from the server and decoded_bytes
+  is the number of bytes they were decompressed to. May be updated by
+  several threads at once.
+  """
+
+  def __init__(self):
+    self.responses = 0
+    self.wire_bytes = 0
+    self.decoded_bytes = 0
+    self._lock = threading.Lock()
+
+  def add(self, wire_bytes, decoded_bytes, responses=0):
+    self._lock.acquire()
+    try:
+      self.responses += responses
+      self.wire_bytes += wire_bytes
+      self.decoded_bytes += decoded_bytes
+    finally:
+      self._lock.release()
+
+  def compression_ratio(self):
+    """Returns decoded_bytes / wire_bytes, or None if nothing was read."""
+    if not self.wire_bytes:
+      return None
+    return float(self.decoded_bytes) / self.wire_bytes
+
+
+class DecodedResponse(object):
+  """Decompresses a gzip or deflate encoded response as it is read.
+
+  Compressed data is read from the wrapped response in blocks of
+  DECODE_READ_SIZE and decompressed incrementally, so read(amt) never holds
+  much more than amt bytes of decoded data. The Content-Encoding and
+  Content-Length headers, which describe the compressed body, are hidden.
+  All other attributes are those of the wrapped response.
+  """
+
+  def __init__(self, response, encoding, stats=None):
+    self._response = response
+    self._stats = stats
+    self._raw_deflate = False
+    if encoding == 'deflate':
+      self._decompressor = zlib.decompressobj()
+    else:
+      # Adding 16 to the window size makes zlib expect a gzip header.
+      self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    self._encoding = encoding
+    self._tail = ''
+    self._done = False
+    self.wire_bytes = 0
+    self.decoded_bytes = 0
+    if stats is not None:
+      stats.add(0, 0, responses=1)
+
+  def read(self, amt=None):
+    chunks = []
+    remaining = amt
+    while not self._done and (amt is None or remaining > 0):
+      if self._tail:
+        data, self._tail = self._tail, ''
+        wire_bytes = 0
+      else:
+        data = self._response.read(DECODE_READ_SIZE)
+        wire_bytes = len(data)
+      if not data:
+        decoded = self._decompressor.flush()
+        self._done = True
+      elif amt is None:
+        decoded = self._decompress(data, 0)
+      else:
+        decoded = self._decompress(data, remaining)
+        self._tail = self._decompressor.unconsumed_tail
+        remaining -= len(decoded)
+      self._count(wire_bytes, len(decoded))
+      chunks.append(decoded)
+    return ''.join(chunks)
+
+  def _decompress(self, data, max_length):
+    try:
+      return self._decompressor.decompress(data, max_length)
+    except zlib.error:
+      # Some servers send deflate data without the zlib header.
+      if (self._encoding != 'deflate' or self._raw_deflate
+          or self.decoded_bytes):
+        raise
+      self._raw_deflate = True
+      self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+      return self._decompressor.decompress(data, max_length)
+
+  def _count(self, wire_bytes, decoded_bytes):
+    self.wire_bytes += wire_bytes
+    self.decoded_bytes += decoded_bytes
+    if self._stats is not None:
+      self._stats.add(wire_bytes, decoded_bytes)
+
+  def getheader(self, name, default=None):
+    if name.lower() in _ENCODED_HEADERS:
+      return default
+    return self._response.getheader(name, default)
+
+  def getheaders(self):
+    headers = get_headers(self._response)
+    if isinstance(headers, dict):
+      return dict([(name, value) for name, value in headers.iteritems()
+                   if name.lower() not in _ENCODED_HEADERS])
+    return [(name, value) for name, value in headers
+            if name.lower() not in _ENCODED_HEADERS]
+
+  def __getattr__(self, name):
+    return getattr(self._response, name)
+
+
+def decode_response(response, stats=None):
+  """Wraps a gzip or deflate encoded response in a DecodedResponse.
+
+  Args:
+    response: An HTTP response object such as an httplib.HTTPResponse.
+    stats: TransferStats (optional) which will count the bytes read.
+
+  Returns:
+    A DecodedResponse if the response was compressed, otherwise the
+    response object which was passed in.
+  """
+  encoding = (response.getheader('Content-Encoding')
+              or response.getheader('content-encoding') or '')
+  encoding = encoding.strip().lower()
+  if encoding in ('gzip', 'x-gzip'):
+    return DecodedResponse(response, 'gzip', stats)
+  elif encoding == 'deflate':
+    return DecodedResponse(response, 'deflate', stats)
+  return response
+
+
+DecodeResponse = decode_response
+
+
+_stats_lock = threading.Lock()
+
+
 def _dump_response(http_response):
   """Converts to a string for printing debug messages.
   
@@ -412,12 +583,43 @@ def _dump_response(http_response):
 
 
 class HttpClient(object):
-  """Performs HTTP requests using httplib."""
+  """Performs HTTP requests using httplib.
+
+  If compress_responses is set to True, the server is asked to compress its
+  responses and gzip or deflate encoded responses are decompressed as they
+  are read. The bytes received and decoded are counted in transfer_stats.
+  """
   debug = None
+  compress_responses = False
+  transfer_stats = None
+  # An ssl.SSLContext for HTTPS connections. If None, httplib's default
+  # context is used.
+  ssl_context = None
 
   def request(self, http_request):
-    return self._http_request(http_request.method, http_request.uri,
-                              http_request.headers, http_request._body_parts)
+    headers = http_request.headers
+    if self.compress_responses and 'Accept-Encoding' not in headers:
+      headers = headers.copy()
+      headers['Accept-Encoding'] = ACCEPT_ENCODING
+    if http_request.event is None:
+      response = self._http_request(http_request.method, http_request.uri,
+                                    headers, http_request._body_parts)
+    else:
+      response = self._http_request(http_request.method, http_request.uri,
+                                    headers, http_request._body_parts,
+                                    event=http_request.event)
+    if self.compress_responses:
+      response = decode_response(response, self._get_transfer_stats())
+    return response
+
+  def _get_transfer_stats(self):
+    _stats_lock.acquire()
+    try:
+      if self.transfer_stats is None:
+        self.transfer_stats = TransferStats()
+      return self.transfer_stats
+    finally:
+      _stats_lock.release()
 
   Request = request
 
@@ -431,10 +633,14 @@ class HttpClient(object):
     """
     connection = None
     if uri.scheme == 'https':
+      kwargs = {}
+      if self.ssl_context is not None:
+        kwargs['context'] = self.ssl_context
       if not uri.port:
-        connection = httplib.HTTPSConnection(uri.host)
+        connection = httplib.HTTPSConnection(uri.host, **kwargs)
       else:
-        connection = httplib.HTTPSConnection(uri.host, int(uri.port))
+        connection = httplib.HTTPSConnection(uri.host, int(uri.port),
+                                             **kwargs)
     else:
       if not uri.port:
         connection = httplib.HTTPConnection(uri.host)
@@ -442,7 +648,8 @@ class HttpClient(object):
         connection = httplib.HTTPConnection(uri.host, int(uri.port))
     return connection
 
-  def _http_request(self, method, uri, headers=None, body_parts=None):
+  def _http_request(self, method, uri, headers=None, body_parts=None,
+                    event=None):
     """Makes an HTTP request using httplib.
 
     Args:
@@ -453,12 +660,23 @@ class HttpClient(object):
       body_parts: list of strings, objects with a read method, or objects
                   which can be converted to strings using str. Each of these
                   will be sent in order as the body of the HTTP request.
+      event: atom.observer.RequestEvent (optional) Records the connect time,
+             bytes sent and time to first byte. Only passed when observers
+             are installed.
     """
     if isinstance(uri, (str, unicode)):
       uri = Uri.parse_uri(uri)
 
     connection = self._get_connection(uri, headers=headers)
+    if event is not None:
+      _connect(connection, event)
+    self._send_request(connection, method, uri, headers, body_parts, event)
+    # Return the HTTP Response from the server.
+    return _get_response(connection, event)
 
+  def _send_request(self, connection, method, uri, headers, body_parts,
+                    event=None):
+    """Writes the request line, headers and body to an open connection."""
     if self.debug:
       connection.debuglevel = 1
 
@@ -488,13 +706,85 @@ class HttpClient(object):
       connection.putheader(header_name, value)
     connection.endheaders()
 
+    if event is not None:
+      connection = _SendCounter(connection, event)
     # If there is data, send it in the request.
-    if body_parts:
+    if headers.get('Transfer-Encoding') == 'chunked':
+      chunked = _ChunkedWriter(connection)
+      for part in body_parts or ():
+        _send_data_part(part, chunked)
+      chunked.close()
+    elif body_parts:
       for part in body_parts:
         _send_data_part(part, connection)
+    if event is not None:
+      event.request_sent = time.time()
+
+
+def _connect(connection, event):
+  """Opens a new connection, recording the time taken in event."""
+  start = time.time()
+  connection.connect()
+  event.connect_time = time.time() - start
+
+
+def _get_response(connection, event):
+  response = connection.getresponse()
+  if event is not None:
+    event.first_byte_time = time.time() - event.request_sent
+  return response
 
-    # Return the HTTP Response from the server.
-    return connection.getresponse()
+
+class _SendCounter(object):
+  """Counts the bytes of the request body in a RequestEvent."""
+
+  def __init__(self, connection, event):
+    self.connection = connection
+    self.event = event
+
+  def send(self, data):
+    self.event.bytes_sent += len(data)
+    self.connection.send(data)
+
+
+# The number of bytes passed to each connection.send call when a file is
+# sent from a memory map.
+SEND_BUFFER_SIZE = 256 * 1024
+
+
+def _send_file(data, connection, buffer_size=None):
+  """Sends the rest of a regular file from a memory map.
+
+  Buffer objects over slices of the mapped file are passed to the
+  connection, so the file's contents are not copied into Python strings.
+  This works for plain and SSL sockets alike. Afterwards the file is
+  positioned at its end, as if it had been read.
+
+  Returns:
+    True if the file was sent, False (having sent nothing) if data is not a
+    regular file with a fileno which can be mapped.
+  """
+  try:
+    fileno = data.fileno()
+    position = data.tell()
+    info = os.fstat(fileno)
+  except (AttributeError, EnvironmentError, ValueError):
+    return False
+  size = info.st_size
+  if not stat.S_ISREG(info.st_mode) or position >= size:
+    return False
+  try:
+    mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+  except (EnvironmentError, ValueError):
+    return False
+  try:
+    buffer_size = buffer_size or SEND_BUFFER_SIZE
+    for start in xrange(position, size, buffer_size):
+      connection.send(buffer(mapped, start, buffer_size))
+  finally:
+    mapped.close()
+  data.seek(size)
+  return True
 
 
 def _send_data_part(data, connection):
@@ -502,6 +792,9 @@ def _send_data_part(data, connection):
     # I might want to just allow str, not unicode.
     connection.send(data)
     return
+  # Regular files are sent without reading them into strings.
+  elif hasattr(data, 'read') and _send_file(data, connection):
+    return
   # Check to see if data is a file-like object that has a read method.
   elif hasattr(data, 'read'):
     # Read the file and send it a chunk at a time.
@@ -510,6 +803,11 @@ def _send_data_part(data, connection):
       if binarydata == '': break
       connection.send(binarydata)
     return
+  # Send each string produced by an iterable, like an atom.core.XmlWriter.
+  elif hasattr(data, '__iter__'):
+    for chunk in data:
+      connection.send(chunk)
+    return
   else:
     # The data object was not a file.
     # Try to convert to a string and send the data.
@@ -517,69 +815,389 @@ def _send_data_part(data, connection):
     return
 
 
+class _ChunkedWriter(object):
+  """Sends data over a connection using chunked transfer encoding."""
+
+  def __init__(self, connection):
+    self.connection = connection
+
+  def send(self, data):
+    # An empty chunk would mark the end of the body. The data is sent on its
+    # own since it may be a buffer over a mapped file.
+    if len(data):
+      self.connection.send('%x\r\n' % len(data))
+      self.connection.send(data)
+      self.connection.send('\r\n')
+
+  def close(self):
+    self.connection.send('0\r\n\r\n')
+
+
 class ProxiedHttpClient(HttpClient):
+  """Performs HTTP requests through the proxy named in the environment.
+
+  The URL of the proxy server is read from the http_proxy or https_proxy
+  environment variable, and Basic Auth credentials for the proxy from
+  proxy_username and proxy_password. HTTPS requests are sent through a
+  tunnel which the proxy opens in response to a CONNECT request. Once a
+  response has been read to the end, its tunnel is kept in tunnel_pool and
+  reused for the next request to the same host and port through the same
+  proxy, saving the CONNECT round trip and the TLS handshake.
+  """
+  tunnel_pool = None
+
+  def _http_request(self, method, uri, headers=None, body_parts=None,
+                    event=None):
+    if isinstance(uri, (str, unicode)):
+      uri = Uri.parse_uri(uri)
+    proxy_uri = _get_proxy_uri(uri)
+    if uri.scheme != 'https' or proxy_uri is None:
+      return HttpClient._http_request(self, method, uri, headers, body_parts,
+                                      event)
+    return self._pooled_http_request(
+        self._get_tunnel_pool(), _pool_key(uri, proxy_uri), method, uri,
+        headers, body_parts, event)
+
+  def _get_tunnel_pool(self):
+    _pool_lock.acquire()
+    try:
+      if self.tunnel_pool is None:
+        self.tunnel_pool = ConnectionPool()
+      return self.tunnel_pool
+    finally:
+      _pool_lock.release()
+
+  def _pooled_http_request(self, pool, key, method, uri, headers,
+                           body_parts, event=None):
+    """Sends the request over an idle connection from pool if there is one.
+
+    If a reused connection has been reset by the server, idempotent
+    requests are retried once on a new connection.
+    """
+    connection = pool.get(key)
+    if connection is not None:
+      if event is not None:
+        event.connect_time = 0.0
+        event.reused_connection = True
+      try:
+        return self._pooled_request(pool, connection, key, method, uri,
+                                    headers, body_parts, event)
+      except (socket.error, httplib.BadStatusLine):
+        connection.close()
+        if not _can_retry(method, body_parts):
+          raise
+        if event is not None:
+          event.retries += 1
+          event.reused_connection = False
+          event.bytes_sent = 0
+    connection = self._get_connection(uri, headers=headers)
+    if event is not None:
+      _connect(connection, event)
+    return self._pooled_request(pool, connection, key, method, uri, headers,
+                                body_parts, event)
+
+  def _pooled_request(self, pool, connection, key, method, uri, headers,
+                      body_parts, event=None):
+    self._send_request(connection, method, uri, headers, body_parts, event)
+    return PooledResponse(_get_response(connection, event), pool, key,
+                          connection)
 
   def _get_connection(self, uri, headers=None):
-    # Check to see if there are proxy settings required for this request.
-    proxy = None
-    if uri.scheme == 'https':
-      proxy = os.environ.get('https_proxy')
-    elif uri.scheme == 'http':
-      proxy = os.environ.get('http_proxy')
-    if not proxy:
+    proxy_uri = _get_proxy_uri(uri)
+    if proxy_uri is None:
       return HttpClient._get_connection(self, uri, headers=headers)
-    # Now we have the URL of the appropriate proxy server.
     # Get a username and password for the proxy if required.
     proxy_auth = _get_proxy_auth()
     if uri.scheme == 'https':
-      import socket
+      proxy_headers = {}
       if proxy_auth:
-        proxy_auth = 'Proxy-authorization: %s' % proxy_auth
-      # Construct the proxy connect command.
-      port = uri.port
-      if not port:
-        port = 443
-      proxy_connect = 'CONNECT %s:%s HTTP/1.0\r\n' % (uri.host, port)
+        proxy_headers['Proxy-Authorization'] = proxy_auth.strip()
       # Set the user agent to send to the proxy
-      user_agent = ''
       if headers and 'User-Agent' in headers:
-        user_agent = 'User-Agent: %s\r\n' % (headers['User-Agent'])
-      proxy_pieces = '%s%s%s\r\n' % (proxy_connect, proxy_auth, user_agent)
-      # Find the proxy host and port.
-      proxy_uri = Uri.parse_uri(proxy)
-      if not proxy_uri.port:
-        proxy_uri.port = '80'
-      # Connect to the proxy server, very simple recv and error checking
-      p_sock = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-      p_sock.connect((proxy_uri.host, int(proxy_uri.port)))
-      p_sock.sendall(proxy_pieces)
-      response = ''
-      # Wait for the full response.
-      while response.find("\r\n\r\n") == -1:
-        response += p_sock.recv(8192)
-      p_status = response.split()[1]
-      if p_status != str(200):
-        raise ProxyError('Error status=%s' % str(p_status))
-      # Trivial setup for ssl socket.
-      sslobj = None
-      if ssl is not None:
-        sslobj = ssl.wrap_socket(p_sock, None, None)
-      else:
-        sock_ssl = socket.ssl(p_sock, None, Nonesock_)
-        sslobj = httplib.FakeSocket(p_sock, sock_ssl)
-      # Initalize httplib and replace with the proxy socket.
-      connection = httplib.HTTPConnection(proxy_uri.host)
-      connection.sock = sslobj
-      return connection
+        proxy_headers['User-Agent'] = headers['User-Agent']
+      return _TunnelConnection(uri.host, int(uri.port or 443),
+                               proxy_uri.host, int(proxy_uri.port),
+                               proxy_headers, self.ssl_context)
     elif uri.scheme == 'http':
-      proxy_uri = Uri.parse_uri(proxy)
-      if not proxy_uri.port:
-        proxy_uri.port = '80'
       if proxy_auth:
         headers['Proxy-Authorization'] = proxy_auth.strip()
       return httplib.HTTPConnection(proxy_uri.host, int(proxy_uri.port))
     return None
 
+  def close(self):
+    """Closes the idle tunnels held by this client."""
+    if self.tunnel_pool is not None:
+      self.tunnel_pool.clear()
+
+
+_pool_lock = threading.Lock()
+
+
+def _get_proxy_uri(uri):
+  """Returns the proxy server for the URI's scheme as a Uri, or None."""
+  proxy = None
+  if uri.scheme == 'https':
+    proxy = os.environ.get('https_proxy')
+  elif uri.scheme == 'http':
+    proxy = os.environ.get('http_proxy')
+  if not proxy:
+    return None
+  proxy_uri = Uri.parse_uri(proxy)
+  if not proxy_uri.port:
+    proxy_uri.port = '80'
+  return proxy_uri
+
+
+class _TunnelConnection(httplib.HTTPSConnection):
+  """An HTTPS connection to a server through a proxy's CONNECT tunnel.
+
+  When the connection is opened, the proxy is asked to connect to the
+  server and TLS is then started with the server over the proxy's socket.
+  If httplib reopens the connection, a new tunnel is opened in the same
+  way, so requests never bypass the proxy.
+  """
+
+  def __init__(self, host, port, proxy_host, proxy_port, proxy_headers=None,
+               ssl_context=None):
+    if ssl_context is not None:
+      httplib.HTTPSConnection.__init__(self, host, port, context=ssl_context)
+    else:
+      httplib.HTTPSConnection.__init__(self, host, port)
+    self.proxy_host = proxy_host
+    self.proxy_port = proxy_port
+    self.proxy_headers = proxy_headers or {}
+
+  def connect(self):
+    sock = socket.create_connection((self.proxy_host, self.proxy_port),
+                                    self.timeout)
+    try:
+      _connect_tunnel(sock, self.host, self.port, self.proxy_headers)
+      context = getattr(self, '_context', None)
+      if context is not None:
+        self.sock = context.wrap_socket(sock, server_hostname=self.host)
+      else:
+        self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file)
+    except:
+      sock.close()
+      raise
+
+
+def _connect_tunnel(sock, host, port, proxy_headers=None):
+  """Asks the HTTP proxy connected to sock to open a tunnel to host:port.
+
+  The proxy's response is parsed by httplib, so it may arrive in any number
+  of packets and include any headers. Nothing past the end of the response
+  is read from the socket.
+
+  Raises:
+    ProxyError if the proxy does not respond with a 200 status.
+  """
+  lines = ['CONNECT %s:%s HTTP/1.0' % (host, port)]
+  for name, value in (proxy_headers or {}).iteritems():
+    lines.append('%s: %s' % (name, value))
+  sock.sendall('\r\n'.join(lines) + '\r\n\r\n')
+  response = httplib.HTTPResponse(sock, method='CONNECT')
+  try:
+    response.begin()
+  finally:
+    response.close()
+  if response.status != 200:
+    error = ProxyError('Error status=%i %s' % (response.status,
+                                               response.reason))
+    error.status = response.status
+    error.reason = response.reason
+    raise error
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Requests with these methods may safely be sent a second time if a reused
+# connection turns out to have been closed by the server.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE')
+
+
+class ConnectionPool(object):
+  """Holds idle keep-alive connections so that they can be reused.
+
+  Connections are grouped by a (scheme, host, port) key. At most
+  max_idle_per_host idle connections are kept for each key, and connections
+  which have been idle for longer than idle_timeout seconds are closed
+  instead of being reused. A ConnectionPool may be shared between threads.
+  """
+
+  def __init__(self, max_idle_per_host=4, idle_timeout=30):
+    self.max_idle_per_host = max_idle_per_host
+    self.idle_timeout = idle_timeout
+    # Maps each key to a list of (connection, time returned) pairs, oldest
+    # first.
+    self._idle = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    """Removes and returns an idle connection for key, or None.
+
+    Connections which have expired or which the server appears to have
+    closed are discarded.
+    """
+    while True:
+      self._lock.acquire()
+      try:
+        idle = self._idle.get(key)
+        if not idle:
+          return None
+        connection, returned = idle.pop()
+      finally:
+        self._lock.release()
+      if (time.time() - returned < self.idle_timeout
+          and not _is_stale(connection)):
+        return connection
+      connection.close()
+
+  def put(self, key, connection):
+    """Returns a connection whose last response has been fully read."""
+    self._lock.acquire()
+    try:
+      idle = self._idle.setdefault(key, [])
+      idle.append((connection, time.time()))
+      if len(idle) > self.max_idle_per_host:
+        connection = idle.pop(0)[0]
+      else:
+        connection = None
+    finally:
+      self._lock.release()
+    if connection is not None:
+      connection.close()
+
+  def clear(self):
+    """Closes all idle connections."""
+    self._lock.acquire()
+    try:
+      idle, self._idle = self._idle, {}
+    finally:
+      self._lock.release()
+    for connections in idle.itervalues():
+      for connection, returned in connections:
+        connection.close()
+
+  def count(self, key=None):
+    """Returns the number of idle connections, for key or for all keys."""
+    self._lock.acquire()
+    try:
+      if key is not None:
+        return len(self._idle.get(key, ()))
+      return sum([len(idle) for idle in self._idle.itervalues()])
+    finally:
+      self._lock.release()
+
+
+def _is_stale(connection):
+  """Checks whether an idle connection can no longer be used.
+
+  An idle socket should have nothing to read, so a readable socket means
+  the server has closed it (or sent something unexpected).
+  """
+  if connection.sock is None:
+    return True
+  try:
+    readable = select.select([connection.sock], [], [], 0)[0]
+  except (select.error, socket.error, ValueError):
+    return True
+  return bool(readable)
+
+
+def _pool_key(uri, proxy_uri=None):
+  port = uri.port or DEFAULT_PORTS.get(uri.scheme, 80)
+  key = (uri.scheme, uri.host, int(port))
+  if proxy_uri is not None:
+    # Connections through a proxy are only reused through the same proxy.
+    key += (proxy_uri.host, int(proxy_uri.port))
+  return key
+
+
+def _can_retry(method, body_parts):
+  """Only idempotent requests whose body can be sent again are retried."""
+  if method not in IDEMPOTENT_METHODS:
+    return False
+  for part in body_parts or ():
+    if not isinstance(part, (str, unicode)):
+      return False
+  return True
+
+
+class PooledHttpClient(ProxiedHttpClient):
+  """Performs HTTP requests over reusable keep-alive connections.
+
+  Once a response has been read to the end, its connection is returned to a
+  ConnectionPool and used again for the next request to the same scheme,
+  host and port, avoiding a new TCP connection and TLS handshake. If a
+  reused connection has been reset by the server, idempotent requests are
+  retried once on a new connection. Proxy settings are honored as in
+  ProxiedHttpClient.
+
+  Responses must be read completely (or closed) so that their connections
+  can be reused. A single PooledHttpClient may be used from several threads.
+  """
+
+  def __init__(self, max_idle_per_host=4, idle_timeout=30, pool=None):
+    self.pool = pool or ConnectionPool(max_idle_per_host, idle_timeout)
+
+  def _http_request(self, method, uri, headers=None, body_parts=None,
+                    event=None):
+    if isinstance(uri, (str, unicode)):
+      uri = Uri.parse_uri(uri)
+    key = _pool_key(uri, _get_proxy_uri(uri))
+    return self._pooled_http_request(self.pool, key, method, uri, headers,
+                                     body_parts, event)
+
+  def close(self):
+    """Closes the idle connections held by this client's pool."""
+    self.pool.clear()
+
+
+class PooledResponse(object):
+  """Wraps an httplib response to return its connection to a pool.
+
+  The connection goes back to the pool once the response body has been
+  read to the end. Closing the response early closes the connection. All
+  other attributes are those of the wrapped response.
+  """
+
+  def __init__(self, response, pool, key, connection):
+    self._response = response
+    self._pool = pool
+    self._key = key
+    self._connection = connection
+    # Responses which can have no body are finished as soon as they arrive.
+    if response.length == 0 and not response.chunked:
+      response.read()
+    self._release()
+
+  def read(self, amt=None):
+    if amt is None:
+      data = self._response.read()
+    else:
+      data = self._response.read(amt)
+    self._release()
+    return data
+
+  def close(self):
+    if self._connection is not None and not self._response.isclosed():
+      self._connection.close()
+      self._connection = None
+    self._response.close()
+    self._release()
+
+  def _release(self):
+    if self._connection is None or not self._response.isclosed():
+      return
+    connection, self._connection = self._connection, None
+    if self._response.will_close:
+      connection.close()
+    else:
+      self._pool.put(self._key, connection)
+
+  def __getattr__(self, name):
+    return getattr(self._response, name)
+
 
 def _get_proxy_auth():
   import base64
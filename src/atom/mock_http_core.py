@@ -269,6 +269,9 @@ class EchoHttpClient(object):
         body.write(part)
       elif hasattr(part, 'read'):
         body.write(part.read())
+      elif hasattr(part, '__iter__'):
+        for chunk in part:
+          body.write(chunk)
     body.seek(0)
     return response
 
@@ -304,6 +307,8 @@ class SettableHttpClient(object):
 
 
 class MockHttpResponse(atom.http_core.HttpResponse):
+  # Position of the next read which asks for a specific number of bytes.
+  _offset = 0
 
   def __init__(self, status=None, reason=None, headers=None, body=None):
     self._headers = headers or {}
@@ -319,5 +324,19 @@ class MockHttpResponse(atom.http_core.HttpResponse):
       else:
         self._body = body
 
-  def read(self):
-    return self._body
+  def read(self, amt=None):
+    """Returns the whole body, or the next amt bytes if amt is given.
+
+    Reading without an amount always returns the entire body. Once reads of
+    amt bytes have reached the end of the body, the next read starts again
+    at the beginning. In both cases, the same recorded response can be
+    returned and read for more than one request.
+    """
+    if not amt or self._body is None:
+      return self._body
+    data = self._body[self._offset:self._offset + amt]
+    if data:
+      self._offset += len(data)
+    else:
+      self._offset = 0
+    return data
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Reports the timing and size of each HTTP request made by a client.
+
+An observer is any object with a request_finished(event) method. Observers
+may be installed for all clients with add_observer, or for one client by
+setting the observers member of an atom.client.AtomPubClient. Once the
+response to a request has been read (or the request has failed), each
+observer is given a RequestEvent describing it. When no observers are
+installed, requests are not measured at all.
+
+  timings = atom.observer.AggregatingObserver()
+  atom.observer.add_observer(timings)
+  client.get_feed(uri)
+  print timings.report()
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import re
+import threading
+import time
+
+
+# Observers which are given the events for requests made by every client.
+_observers = []
+_observers_lock = threading.Lock()
+
+
+def add_observer(observer):
+  """Installs an observer for the requests made by all clients."""
+  global _observers
+  _observers_lock.acquire()
+  try:
+    # The list is replaced rather than changed, so that requests in other
+    # threads can use the old list without locking.
+    _observers = _observers + [observer]
+  finally:
+    _observers_lock.release()
+
+
+AddObserver = add_observer
+
+
+def remove_observer(observer):
+  """Removes an observer installed with add_observer."""
+  global _observers
+  _observers_lock.acquire()
+  try:
+    _observers = [installed for installed in _observers
+                  if installed is not observer]
+  finally:
+    _observers_lock.release()
+
+
+RemoveObserver = remove_observer
+
+
+def get_observers(client_observers=None):
+  """Returns the global observers followed by client_observers."""
+  if client_observers:
+    return _observers + list(client_observers)
+  return _observers
+
+
+GetObservers = get_observers
+
+
+# Path segments which hold IDs, email addresses, or other values which vary
+# from one request to the next. A segment is replaced if it contains an
+# escaped character, '@', ':' or '.', three or more digits in a row, or is
+# eight or more letters and digits including at least one digit.
+VARIABLE_SEGMENT = re.compile(r'[%@:.]|\d{3}|^(?=.*\d)[\w\-]{8,}$')
+
+
+def path_template(path):
+  """Replaces the variable segments of a URL path with {id}.
+
+  Requests for different entries of the same feed have the same template,
+  for example /m8/feeds/contacts/liz%40gmail.com/full/3b9e5f0c8a8d4e2 becomes
+  /m8/feeds/contacts/{id}/full/{id}.
+  """
+  if not path:
+    return '/'
+  path = path.split('?', 1)[0]
+  segments = path.split('/')
+  for i, segment in enumerate(segments):
+    if VARIABLE_SEGMENT.search(segment):
+      segments[i] = '{id}'
+  return '/'.join(segments)
+
+
+PathTemplate = path_template
+
+
+class RequestEvent(object):
+  """Describes one HTTP request and its response.
+
+  Times are in seconds. A time which could not be measured, for example
+  connect_time when the HTTP client does not report it, is None.
+
+  Attributes:
+    method: str The HTTP method.
+    host: str The server the request was sent to.
+    path: str The path of the request URL.
+    path_template: str The path with IDs replaced, see path_template.
+    service: str The name of the service, such as 'cl' for Google Calendar.
+        Falls back to the host for clients which do not set auth_service.
+    status: int The status of the response, or None if there was none.
+    error: The exception raised by the request, or None.
+    start: float When the request was started, from time.time().
+    connect_time: float The time taken to open the connection (including
+        any proxy tunnel and TLS handshake). 0.0 for a reused connection.
+    reused_connection: bool True if the request was sent over an idle
+        connection from a pool.
+    request_sent: float When the request body finished sending, from
+        time.time().
+    first_byte_time: float The time from sending the request to receiving
+        the response headers.
+    transfer_time: float The time from receiving the response headers to
+        reading the end of the response body.
+    total_time: float The time from start to the end of the request.
+    bytes_sent: int The number of request body bytes sent.
+    bytes_received: int The number of response body bytes read.
+    retries: int The number of times the request was sent again because a
+        reused connection had been closed by the server.
+  """
+  status = None
+  error = None
+  connect_time = None
+  reused_connection = False
+  request_sent = None
+  first_byte_time = None
+  transfer_time = None
+  total_time = None
+
+  def __init__(self, method, host, path, service=None, observers=None):
+    self.method = method
+    self.host = host
+    self.path = path
+    self.path_template = path_template(path)
+    self.service = service or host
+    self.observers = observers or []
+    self.start = time.time()
+    self.bytes_sent = 0
+    self.bytes_received = 0
+    self.retries = 0
+    self._headers_received = None
+
+  def response_received(self, response):
+    """Records the response headers.
+
+    Returns:
+      An ObservedResponse which finishes this event once the response body
+      has been read.
+    """
+    self._headers_received = time.time()
+    self.status = getattr(response, 'status', None)
+    if self.first_byte_time is None:
+      # The HTTP client did not measure the request, so the time taken to
+      # send it is included.
+      self.first_byte_time = self._headers_received - self.start
+    if _has_empty_body(response):
+      # The caller may never read a response with no body.
+      self.finish()
+    return ObservedResponse(response, self)
+
+  def fail(self, error):
+    """Finishes the event for a request which raised error."""
+    self.error = error
+    self.finish()
+
+  def finish(self):
+    """Records the end of the request and passes this event to observers."""
+    if self.total_time is not None:
+      return
+    now = time.time()
+    self.total_time = now - self.start
+    if self._headers_received is not None:
+      self.transfer_time = now - self._headers_received
+    for observer in self.observers:
+      try:
+        observer.request_finished(self)
+      except Exception:
+        # A failing observer must not affect the request.
+        pass
+
+
+def _has_empty_body(response):
+  if getattr(response, 'length', None) == 0:
+    return True
+  getheader = getattr(response, 'getheader', None)
+  return getheader is not None and getheader('Content-Length') == '0'
+
+
+class ObservedResponse(object):
+  """Wraps a response to count the bytes read and finish its RequestEvent.
+
+  The event is finished when the end of the body is read or the response is
+  closed. All other attributes are those of the wrapped response.
+  """
+
+  def __init__(self, response, event):
+    self._response = response
+    self.event = event
+
+  def read(self, amt=None):
+    try:
+      if amt is None:
+        data = self._response.read()
+      else:
+        data = self._response.read(amt)
+    except Exception, error:
+      self.event.fail(error)
+      raise
+    if data:
+      self.event.bytes_received += len(data)
+    if amt is None or not data or self._is_closed():
+      self.event.finish()
+    return data
+
+  def close(self):
+    if hasattr(self._response, 'close'):
+      self._response.close()
+    self.event.finish()
+
+  def _is_closed(self):
+    isclosed = getattr(self._response, 'isclosed', None)
+    return isclosed is not None and isclosed()
+
+  def __getattr__(self, name):
+    return getattr(self._response, name)
+
+
+class Histogram(object):
+  """Counts values in buckets with fixed upper bounds."""
+
+  def __init__(self, bounds):
+    self.bounds = list(bounds)
+    # The last bucket holds values greater than all of the bounds.
+    self.counts = [0] * (len(self.bounds) + 1)
+    self.count = 0
+    self.total = 0.0
+    self.maximum = None
+
+  def add(self, value):
+    i = 0
+    while i < len(self.bounds) and value > self.bounds[i]:
+      i += 1
+    self.counts[i] += 1
+    self.count += 1
+    self.total += value
+    if self.maximum is None or value > self.maximum:
+      self.maximum = value
+
+  def mean(self):
+    if not self.count:
+      return None
+    return self.total / self.count
+
+  def percentile(self, percent):
+    """Estimates a percentile as the upper bound of the bucket holding it.
+
+    Values beyond the last bound are estimated by the largest value seen.
+    """
+    if not self.count:
+      return None
+    rank = self.count * percent / 100.0
+    seen = 0
+    for i, count in enumerate(self.counts):
+      seen += count
+      if count and seen >= rank:
+        if i < len(self.bounds):
+          return min(self.bounds[i], self.maximum)
+        return self.maximum
+    return self.maximum
+
+
+# Bucket bounds for request times, in seconds.
+LATENCY_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0,
+                  2.0, 5.0, 10.0, 20.0, 60.0)
+
+
+class EndpointStats(object):
+  """Aggregated measurements of the requests to one endpoint."""
+
+  def __init__(self, bounds=LATENCY_BOUNDS):
+    self.requests = 0
+    self.errors = 0
+    self.redirects = 0
+    self.retries = 0
+    self.reused_connections = 0
+    self.bytes_sent = 0
+    self.bytes_received = 0
+    self.total_time = Histogram(bounds)
+    self.connect_time = Histogram(bounds)
+    self.first_byte_time = Histogram(bounds)
+    self.transfer_time = Histogram(bounds)
+
+  def add(self, event):
+    self.requests += 1
+    if event.error is not None or (event.status or 0) >= 400:
+      self.errors += 1
+    elif event.status is not None and 300 <= event.status < 400:
+      self.redirects += 1
+    self.retries += event.retries
+    if event.reused_connection:
+      self.reused_connections += 1
+    self.bytes_sent += event.bytes_sent
+    self.bytes_received += event.bytes_received
+    for name in ('total_time', 'connect_time', 'first_byte_time',
+                 'transfer_time'):
+      value = getattr(event, name)
+      if value is not None:
+        getattr(self, name).add(value)
+
+
+class AggregatingObserver(object):
+  """Collects latency histograms for each service and endpoint.
+
+  Requests are grouped by (service, method, path_template). An
+  AggregatingObserver may be installed on several clients and used from
+  several threads at once.
+  """
+
+  def __init__(self, bounds=LATENCY_BOUNDS):
+    self.bounds = bounds
+    self._stats = {}
+    self._lock = threading.Lock()
+
+  def request_finished(self, event):
+    key = (event.service, event.method, event.path_template)
+    self._lock.acquire()
+    try:
+      stats = self._stats.get(key)
+      if stats is None:
+        stats = self._stats[key] = EndpointStats(self.bounds)
+      stats.add(event)
+    finally:
+      self._lock.release()
+
+  def get_stats(self):
+    """Returns a dict mapping (service, method, path_template) to the
+    EndpointStats for those requests."""
+    self._lock.acquire()
+    try:
+      return self._stats.copy()
+    finally:
+      self._lock.release()
+
+  GetStats = get_stats
+
+  def clear(self):
+    self._lock.acquire()
+    try:
+      self._stats = {}
+    finally:
+      self._lock.release()
+
+  def report(self):
+    """Formats the stats as a table with one line per endpoint.
+
+    Times are in milliseconds. The percentiles are of the total time, and
+    connect, ttfb (time to first byte) and xfer (body transfer) are means.
+    """
+    lines = ['%-10s %-6s %-44s %6s %5s %7s %7s %7s %7s %7s %7s %10s' % (
+        'service', 'method', 'path', 'count', 'errs', 'p50', 'p90', 'p99',
+        'connect', 'ttfb', 'xfer', 'bytes in')]
+    stats = self.get_stats()
+    keys = stats.keys()
+    keys.sort()
+    for key in keys:
+      endpoint = stats[key]
+      service, method, template = key
+      lines.append(
+          '%-10s %-6s %-44s %6i %5i %7s %7s %7s %7s %7s %7s %10i' % (
+              service, method, template, endpoint.requests, endpoint.errors,
+              _format_ms(endpoint.total_time.percentile(50)),
+              _format_ms(endpoint.total_time.percentile(90)),
+              _format_ms(endpoint.total_time.percentile(99)),
+              _format_ms(endpoint.connect_time.mean()),
+              _format_ms(endpoint.first_byte_time.mean()),
+              _format_ms(endpoint.transfer_time.mean()),
+              endpoint.bytes_received))
+    return '\n'.join(lines)
+
+  Report = report
+
+
+def _format_ms(seconds):
+  if seconds is None:
+    return '-'
+  return '%.1f' % (seconds * 1000)
@@ -33,6 +33,7 @@ __author__ = 'api.jscudder (Jeff Scudder)'
 import atom.http_interface
 import atom.url
 import atom.http
+import atom.http_core
 import atom.token_store
 
 import os
@@ -698,6 +699,9 @@ def __SendDataPart(data, connection):
   elif ElementTree.iselement(data):
     connection.send(ElementTree.tostring(data))
     return
+  # Regular files are sent without reading them into strings.
+  elif hasattr(data, 'read') and atom.http_core._send_file(data, connection):
+    return
   # Check to see if data is a file-like object that has a read method.
   elif hasattr(data, 'read'):
     # Read the file and send it a chunk at a time.
@@ -117,6 +117,28 @@ class AppsService(gdata.service.GDataService):
       next = next_feed.GetNextLink()
     return link_finder
 
+  def _GetEntryGenerator(self, retrieve_first_page, func, checkpoint,
+                         num_retries, delay, backoff):
+    """Returns a generator of the entries of every page of a feed.
+
+    The first page is retrieve_first_page(), unless checkpoint holds the URL
+    of the page at which an earlier listing stopped.
+    """
+    uri = None
+    if checkpoint is not None:
+      uri = checkpoint.load()
+    if uri is None:
+      first_page = retrieve_first_page()
+    else:
+      try:
+        first_page = func(str(self.GetWithRetries(
+            uri, num_retries=num_retries, delay=delay, backoff=backoff)))
+      except gdata.service.RequestError, e:
+        raise AppsForYourDomainException(e.args[0])
+    return self.GetEntryGeneratorFromLinkFinder(
+      first_page, func, num_retries=num_retries, delay=delay,
+      backoff=backoff, checkpoint=checkpoint)
+
   def RetrievePageOfEmailLists(self, start_email_list_name=None,
                                num_retries=gdata.service.DEFAULT_NUM_RETRIES,
                                delay=gdata.service.DEFAULT_DELAY,
@@ -142,6 +164,21 @@ class AppsService(gdata.service.GDataService):
       first_page, gdata.apps.EmailListRecipientFeedFromString,
       num_retries=num_retries, delay=delay, backoff=backoff)
 
+  def GetEntryGeneratorForAllEmailLists(
+    self, checkpoint=None, num_retries=gdata.service.DEFAULT_NUM_RETRIES,
+    delay=gdata.service.DEFAULT_DELAY, backoff=gdata.service.DEFAULT_BACKOFF):
+    """Retrieve a generator for each email list in this domain.
+
+    Pages are fetched as the email lists are used. If a
+    gdata.sync.FileCheckpoint is given, an interrupted listing resumes from
+    the page at which it stopped.
+    """
+    return self._GetEntryGenerator(
+      lambda: self.RetrievePageOfEmailLists(
+          num_retries=num_retries, delay=delay, backoff=backoff),
+      gdata.apps.EmailListFeedFromString, checkpoint, num_retries, delay,
+      backoff)
+
   def RetrieveAllEmailLists(self):
     """Retrieve all email list of a domain."""
 
@@ -214,6 +251,22 @@ class AppsService(gdata.service.GDataService):
       first_page, gdata.apps.EmailListRecipientFeedFromString,
       num_retries=num_retries, delay=delay, backoff=backoff)
 
+  def GetEntryGeneratorForAllRecipients(
+    self, list_name, checkpoint=None,
+    num_retries=gdata.service.DEFAULT_NUM_RETRIES,
+    delay=gdata.service.DEFAULT_DELAY, backoff=gdata.service.DEFAULT_BACKOFF):
+    """Retrieve a generator for each recipient of an email list.
+
+    Pages are fetched as the recipients are used. If a
+    gdata.sync.FileCheckpoint is given, an interrupted listing resumes from
+    the page at which it stopped.
+    """
+    return self._GetEntryGenerator(
+      lambda: self.RetrievePageOfRecipients(
+          list_name, num_retries=num_retries, delay=delay, backoff=backoff),
+      gdata.apps.EmailListRecipientFeedFromString, checkpoint, num_retries,
+      delay, backoff)
+
   def RetrieveAllRecipients(self, list_name):
     """Retrieve all recipient of an email list."""
 
@@ -292,6 +345,21 @@ class AppsService(gdata.service.GDataService):
       first_page, gdata.apps.NicknameFeedFromString, num_retries=num_retries,
       delay=delay, backoff=backoff)
 
+  def GetEntryGeneratorForAllNicknames(
+    self, checkpoint=None, num_retries=gdata.service.DEFAULT_NUM_RETRIES,
+    delay=gdata.service.DEFAULT_DELAY, backoff=gdata.service.DEFAULT_BACKOFF):
+    """Retrieve a generator for each nickname in this domain.
+
+    Pages are fetched as the nicknames are used. If a
+    gdata.sync.FileCheckpoint is given, an interrupted listing resumes from
+    the page at which it stopped.
+    """
+    return self._GetEntryGenerator(
+      lambda: self.RetrievePageOfNicknames(
+          num_retries=num_retries, delay=delay, backoff=backoff),
+      gdata.apps.NicknameFeedFromString, checkpoint, num_retries, delay,
+      backoff)
+
   def RetrieveAllNicknames(self):
     """Retrieve all nicknames in the domain"""
 
@@ -453,6 +521,21 @@ class AppsService(gdata.service.GDataService):
       first_page, gdata.apps.UserFeedFromString, num_retries=num_retries,
       delay=delay, backoff=backoff)
 
+  def GetEntryGeneratorForAllUsers(
+    self, checkpoint=None, num_retries=gdata.service.DEFAULT_NUM_RETRIES,
+    delay=gdata.service.DEFAULT_DELAY, backoff=gdata.service.DEFAULT_BACKOFF):
+    """Retrieve a generator for each user in this domain.
+
+    Unlike RetrieveAllUsers, only one page of users is held at a time, so
+    this suits domains with very many users. If a gdata.sync.FileCheckpoint
+    is given, an interrupted listing resumes from the page at which it
+    stopped.
+    """
+    return self._GetEntryGenerator(
+      lambda: self.RetrievePageOfUsers(
+          num_retries=num_retries, delay=delay, backoff=backoff),
+      gdata.apps.UserFeedFromString, checkpoint, num_retries, delay, backoff)
+
   def RetrieveAllUsers(self):
     """Retrieve all users in this domain. OBSOLETE"""
 
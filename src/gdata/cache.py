@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Caches feeds and entries so that unchanged ones are not downloaded again.
+
+Set the response_cache member of a gdata.client.GDClient to have get_feed,
+get_entry and other GET requests which parse the response into a
+desired_class remember each response which has an ETag or Last-Modified
+header:
+
+  client.response_cache = gdata.cache.ResponseCache(
+      max_bytes=20*1024*1024, directory='/var/cache/myapp')
+
+When the same URL is requested again (by the same user, with the same API
+version), the client sends If-None-Match and If-Modified-Since headers. If
+the server replies 304 Not Modified, the cached object is returned instead
+of raising gdata.client.NotModified. The parsed object is shared between
+calls, so it should not be modified.
+
+Responses are kept in memory up to max_bytes of response bodies, dropping
+the least recently used first. If a directory is given, bodies are also
+written there (up to max_disk_bytes) so that they outlive the process; a
+response found only on disk is parsed again when it is used.
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class CachedResponse(object):
+  """A response body with the validators needed to revalidate it.
+
+  Attributes:
+    etag: str The ETag header of the response, or None.
+    last_modified: str The Last-Modified header of the response, or None.
+    body: str The response body.
+    objects: dict The body parsed into each (desired_class, fields) that it
+             has been requested as.
+  """
+
+  def __init__(self, etag, last_modified, body, objects=None):
+    self.etag = etag
+    self.last_modified = last_modified
+    self.body = body
+    self.objects = objects or {}
+
+  def modify_request(self, http_request):
+    """Makes the request conditional on the response having changed."""
+    if self.etag:
+      http_request.headers['If-None-Match'] = self.etag
+    if self.last_modified:
+      http_request.headers['If-Modified-Since'] = self.last_modified
+    return http_request
+
+  ModifyRequest = modify_request
+
+
+class MemoryCache(object):
+  """Holds CachedResponses, evicting the least recently used past max_bytes.
+  """
+
+  def __init__(self, max_bytes=10*1024*1024):
+    self.max_bytes = max_bytes
+    self.size = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    self._lock.acquire()
+    try:
+      cached = self._entries.pop(key, None)
+      if cached is not None:
+        # Reinserting moves the entry to the most recently used end.
+        self._entries[key] = cached
+      return cached
+    finally:
+      self._lock.release()
+
+  def put(self, key, cached):
+    self._lock.acquire()
+    try:
+      self._remove(key)
+      size = len(cached.body)
+      if size > self.max_bytes:
+        return
+      self._entries[key] = cached
+      self.size += size
+      while self.size > self.max_bytes:
+        oldest = iter(self._entries).next()
+        self._remove(oldest)
+    finally:
+      self._lock.release()
+
+  def delete(self, key):
+    self._lock.acquire()
+    try:
+      self._remove(key)
+    finally:
+      self._lock.release()
+
+  def clear(self):
+    self._lock.acquire()
+    try:
+      self._entries.clear()
+      self.size = 0
+    finally:
+      self._lock.release()
+
+  def _remove(self, key):
+    cached = self._entries.pop(key, None)
+    if cached is not None:
+      self.size -= len(cached.body)
+
+  def __len__(self):
+    return len(self._entries)
+
+
+class DiskCache(object):
+  """Stores CachedResponses as files in a directory.
+
+  Each file holds the key, the validators and the body. Files are written
+  to a temporary name and renamed, so that readers in other processes never
+  see part of a file. When the files take more than max_bytes, those read
+  or written longest ago are removed.
+  """
+
+  def __init__(self, directory, max_bytes=100*1024*1024):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  def get(self, key):
+    path = self._get_path(key)
+    try:
+      cache_file = open(path, 'rb')
+    except EnvironmentError:
+      return None
+    try:
+      stored_key = cache_file.readline().rstrip('\n')
+      etag = cache_file.readline().rstrip('\n') or None
+      last_modified = cache_file.readline().rstrip('\n') or None
+      body = cache_file.read()
+    finally:
+      cache_file.close()
+    if stored_key != repr(key):
+      # Another key with the same hash.
+      return None
+    try:
+      # Marks the file as recently used.
+      os.utime(path, None)
+    except EnvironmentError:
+      pass
+    return CachedResponse(etag, last_modified, body)
+
+  def put(self, key, cached):
+    if len(cached.body) > self.max_bytes:
+      self.delete(key)
+      return
+    handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    cache_file = os.fdopen(handle, 'wb')
+    try:
+      cache_file.write('%s\n%s\n%s\n' % (repr(key), cached.etag or '',
+                                         cached.last_modified or ''))
+      cache_file.write(cached.body)
+    finally:
+      cache_file.close()
+    os.rename(temp_path, self._get_path(key))
+    self._evict()
+
+  def delete(self, key):
+    try:
+      os.remove(self._get_path(key))
+    except EnvironmentError:
+      pass
+
+  def clear(self):
+    for name in os.listdir(self.directory):
+      if name.endswith('.cache'):
+        try:
+          os.remove(os.path.join(self.directory, name))
+        except EnvironmentError:
+          pass
+
+  def _get_path(self, key):
+    return os.path.join(self.directory,
+                        hashlib.sha1(repr(key)).hexdigest() + '.cache')
+
+  def _evict(self):
+    self._lock.acquire()
+    try:
+      files = []
+      total = 0
+      for name in os.listdir(self.directory):
+        if not name.endswith('.cache'):
+          continue
+        path = os.path.join(self.directory, name)
+        try:
+          info = os.stat(path)
+        except EnvironmentError:
+          continue
+        files.append((info.st_mtime, info.st_size, path))
+        total += info.st_size
+      files.sort()
+      for mtime, size, path in files:
+        if total <= self.max_bytes:
+          break
+        try:
+          os.remove(path)
+        except EnvironmentError:
+          pass
+        total -= size
+    finally:
+      self._lock.release()
+
+
+class ResponseCache(object):
+  """A memory cache, optionally backed by a DiskCache."""
+
+  def __init__(self, max_bytes=10*1024*1024, directory=None,
+               max_disk_bytes=100*1024*1024):
+    """Creates a cache which may be shared by several clients and threads.
+
+    Args:
+      max_bytes: int The most bytes of response bodies to keep in memory.
+      directory: str (optional) Where to store responses on disk.
+      max_disk_bytes: int The most bytes to store on disk.
+    """
+    self.memory = MemoryCache(max_bytes)
+    self.disk = None
+    if directory is not None:
+      self.disk = DiskCache(directory, max_disk_bytes)
+
+  def get(self, key):
+    """Returns the CachedResponse for key, or None."""
+    cached = self.memory.get(key)
+    if cached is None and self.disk is not None:
+      cached = self.disk.get(key)
+      if cached is not None:
+        self.memory.put(key, cached)
+    return cached
+
+  Get = get
+
+  def put(self, key, cached):
+    self.memory.put(key, cached)
+    if self.disk is not None:
+      self.disk.put(key, cached)
+
+  Put = put
+
+  def delete(self, key):
+    self.memory.delete(key)
+    if self.disk is not None:
+      self.disk.delete(key)
+
+  Delete = delete
+
+  def clear(self):
+    self.memory.clear()
+    if self.disk is not None:
+      self.disk.clear()
+
+  Clear = clear
+
+
+class RecordingResponse(object):
+  """Keeps a copy of the body of a response as it is read."""
+
+  def __init__(self, response):
+    self._response = response
+    self._chunks = []
+
+  def read(self, amt=None):
+    if amt is None:
+      data = self._response.read()
+    else:
+      data = self._response.read(amt)
+    if data:
+      self._chunks.append(data)
+    return data
+
+  def get_body(self):
+    return ''.join(self._chunks)
+
+  def __getattr__(self, name):
+    return getattr(self._response, name)
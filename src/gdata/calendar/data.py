@@ -189,6 +189,7 @@ class SequenceNumberProperty(atom.core.XmlElement):
 class CalendarRecurrenceExceptionEntry(gdata.data.GDEntry):
   """Describes an entry used by a Calendar recurrence exception entry link"""
   uid = IcalUIDProperty
+  event_status = gdata.data.EventStatus
   sequence = SequenceNumberProperty
 
 
@@ -241,6 +242,7 @@ class CalendarEventEntry(gdata.data.BatchEntry):
   private_copy = PrivateCopyProperty
   suppress_reply_notifications = SuppressReplyNotificationsProperty
   uid = IcalUIDProperty
+  event_status = gdata.data.EventStatus
 
 
 class TimeZoneProperty(atom.core.XmlElement):
@@ -31,12 +31,27 @@ in this module is GDClient.
 __author__ = 'j.s@google.com (Jeff Scudder)'
 
 
+import collections
+import os
 import re
+import atom.aio
 import atom.client
 import atom.core
+import atom.executor
 import atom.http_core
 import gdata.gauth
 import gdata.data
+import gdata.cache
+import gdata.ratelimit
+import gdata.retry
+
+
+# The number of bytes read from the server and written at a time by
+# GDClient.download_to.
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# The most operations sent in one request by GDClient.batch. Google Data
+# APIs accept up to 100 operations in a batch feed.
+BATCH_SIZE = 100
 
 
 class Error(Exception):
@@ -94,6 +109,14 @@ class NotImplemented(RequestError):
   pass
 
 
+class BatchOperationNotProcessed(Error):
+  """The server sent no result for a batch operation.
+
+  Usually because it interrupted the batch before reaching the operation.
+  """
+  pass
+
+
 def error_from_response(message, http_response, error_class,
                         response_body=None):
 
@@ -133,6 +156,56 @@ def get_xml_version(version):
   return int(version.split('.')[0])
 
 
+def _plan_pages(feed):
+  """Computes the URLs of the pages after the first page of a feed.
+
+  Returns:
+    A deque of the URLs, or None if they cannot be computed because the
+    feed does not give its total size or does not page by start-index.
+  """
+  next_link = feed.find_next_link()
+  if next_link is None:
+    return collections.deque()
+  total_results = getattr(feed, 'total_results', None)
+  if total_results is None or not total_results.text:
+    return None
+  next_uri = atom.http_core.Uri.parse_uri(next_link)
+  if 'start-index' not in next_uri.query:
+    return None
+  try:
+    total = int(total_results.text)
+    next_start = int(next_uri.query['start-index'])
+    start = 1
+    if feed.start_index is not None and feed.start_index.text:
+      start = int(feed.start_index.text)
+  except ValueError:
+    return None
+  page_size = next_start - start
+  if page_size < 1:
+    return None
+  uris = collections.deque()
+  for page_start in xrange(next_start, total + 1, page_size):
+    page_uri = atom.http_core.Uri(
+        next_uri.scheme, next_uri.host, next_uri.port, next_uri.path,
+        next_uri.query.copy())
+    page_uri.query['start-index'] = str(page_start)
+    uris.append(page_uri)
+  return uris
+
+
+def _is_cacheable(method, http_request):
+  """Returns True for a GET which the caller has not made conditional."""
+  if method is None and http_request is not None:
+    method = http_request.method
+  if method is not None and method.upper() != 'GET':
+    return False
+  if http_request is not None:
+    for header in ('If-None-Match', 'If-Modified-Since'):
+      if header in http_request.headers:
+        return False
+  return True
+
+
 class GDClient(atom.client.AtomPubClient):
   """Communicates with Google Data servers to perform CRUD operations.
 
@@ -181,10 +254,20 @@ class GDClient(atom.client.AtomPubClient):
   auth_service = None
   # URL prefixes which should be requested for AuthSub and OAuth.
   auth_scopes = None
+  # A gdata.ratelimit.RateLimiter which spaces out requests to each host
+  # for each user, and slows down when the server reports that a quota
+  # has been exceeded.
+  rate_limiter = None
+  # A gdata.retry.RetryPolicy which decides whether to send requests again
+  # after a 5xx response or a network error. By default nothing is retried.
+  retry_policy = None
+  # A gdata.cache.ResponseCache which remembers parsed feeds and entries, so
+  # that they are only downloaded again when they have changed.
+  response_cache = None
 
   def request(self, method=None, uri=None, auth_token=None,
               http_request=None, converter=None, desired_class=None,
-              redirects_remaining=4, **kwargs):
+              redirects_remaining=4, fields=None, **kwargs):
     """Make an HTTP request to the server.
 
     See also documentation for atom.client.AtomPubClient.request.
@@ -225,6 +308,12 @@ class GDClient(atom.client.AtomPubClient):
                            server sends a 302 redirect, the request method
                            will raise an exception. This parameter is used in
                            recursive request calls to avoid an infinite loop.
+      fields: (optional) str or sequence of str The members of the
+              desired_class to convert, such as 'id,updated,entry(id)'.
+              Other child elements in the response are skipped while
+              parsing. See atom.core.parse. This does not add a fields
+              parameter to the request URL; include one there as well to
+              have the server send a partial response.
 
     Any additional arguments are passed through to
     atom.client.AtomPubClient.request.
@@ -241,9 +330,202 @@ class GDClient(atom.client.AtomPubClient):
     if isinstance(uri, (str, unicode)):
       uri = atom.http_core.Uri.parse_uri(uri)
 
+    uri = self._apply_gsessionid(uri, http_request)
+
+    # The AtomPubClient should call this class' modify_request before
+    # performing the HTTP request.
+    #http_request = self.modify_request(http_request)
+
+    cache = self.response_cache
+    if (cache is not None and converter is None and desired_class is not None
+        and _is_cacheable(method, http_request)):
+      return self._cached_request(
+          cache, method, uri, auth_token, http_request, desired_class,
+          redirects_remaining, fields, kwargs)
+    if self.retry_policy is not None:
+      return self._request_with_retries(
+          self.retry_policy, method, uri, auth_token, http_request,
+          converter, desired_class, redirects_remaining, fields, kwargs)
+    response = self._send_request(method, uri, auth_token, http_request,
+                                  kwargs)
+    return self._handle_response(response, method, uri, auth_token,
+                                 http_request, converter, desired_class,
+                                 redirects_remaining, fields, kwargs)
+
+  Request = request
+
+  def _send_request(self, method, uri, auth_token, http_request, kwargs):
+    """Makes one attempt at a request, waiting for the rate_limiter."""
+    limiter = self.rate_limiter
+    if limiter is not None:
+      limit_key = self._get_request_key(uri, http_request, auth_token)
+      limiter.acquire(limit_key)
+    response = atom.client.AtomPubClient.request(self, method=method,
+        uri=uri, auth_token=auth_token, http_request=http_request, **kwargs)
+    if limiter is not None:
+      response = limiter.response_received(limit_key, response)
+    return response
+
+  def _request_with_retries(self, policy, method, uri, auth_token,
+                            http_request, converter, desired_class,
+                            redirects_remaining, fields, kwargs):
+    """Makes a request, sending it again as allowed by the retry policy."""
+    # The request is built once, so that each attempt sends the same body
+    # rather than adding the body parts from kwargs again.
+    if http_request is None:
+      http_request = atom.http_core.HttpRequest()
+    if uri is not None:
+      uri.modify_request(http_request)
+    if isinstance(method, (str, unicode)):
+      http_request.method = method
+    for value in kwargs.itervalues():
+      if value is not None:
+        value.modify_request(http_request)
+    body = gdata.retry.RequestBody(http_request)
+    policy.budget.request_started()
+    attempt = 0
+    try:
+      while True:
+        # The body is rewound before asking the policy, so that a retry
+        # which cannot be made is not counted against the budget.
+        try:
+          response = self._send_request(None, None, auth_token,
+                                        http_request, {})
+        except gdata.retry.NETWORK_ERRORS, error:
+          delay = None
+          if body.rewind():
+            delay = policy.get_delay(http_request, attempt, error=error)
+          if delay is None:
+            raise
+        else:
+          delay = None
+          if response.status in policy.statuses and body.rewind():
+            delay = policy.get_delay(http_request, attempt,
+                                     response=response)
+          if delay is None:
+            return self._handle_response(response, method, uri, auth_token,
+                                         http_request, converter,
+                                         desired_class, redirects_remaining,
+                                         fields, {})
+          # Finish with the response, so that its connection can be reused.
+          response.read()
+        policy.wait(delay)
+        attempt += 1
+    finally:
+      body.close()
+
+  def _cached_request(self, cache, method, uri, auth_token, http_request,
+                      desired_class, redirects_remaining, fields, kwargs):
+    """Makes a GET request, revalidating a cached response if there is one.
+
+    Returns:
+      The response parsed into the desired_class, which is the cached object
+      if the server replied 304 Not Modified.
+    """
+    if isinstance(uri, (str, unicode)):
+      uri = atom.http_core.Uri.parse_uri(uri)
+    key = self._get_cache_key(uri, http_request, auth_token, kwargs)
+    if isinstance(fields, list):
+      fields = tuple(fields)
+    cached = cache.get(key)
+
+    def parse_and_store(response):
+      return self._parse_and_cache(cache, key, response, desired_class,
+                                   fields)
+
+    try:
+      return self.request(method=method, uri=uri, auth_token=auth_token,
+                          http_request=http_request,
+                          converter=parse_and_store,
+                          desired_class=desired_class,
+                          redirects_remaining=redirects_remaining,
+                          fields=fields, cached_response=cached, **kwargs)
+    except NotModified:
+      if cached is None:
+        raise
+    return self._get_cached_object(cached, desired_class, fields)
+
+  def _parse_and_cache(self, cache, key, response, desired_class, fields):
+    """Parses a response, storing it in the cache if it has validators."""
+    recorder = gdata.cache.RecordingResponse(response)
+    parsed = self._parse_response(recorder, desired_class, fields)
+    etag = response.getheader('ETag') or response.getheader('etag')
+    last_modified = (response.getheader('Last-Modified')
+                     or response.getheader('last-modified'))
+    if etag or last_modified:
+      cache.put(key, gdata.cache.CachedResponse(
+          etag, last_modified, recorder.get_body(),
+          {(desired_class, fields): parsed}))
+    else:
+      cache.delete(key)
+    return parsed
+
+  def _get_cached_object(self, cached, desired_class, fields):
+    parsed = cached.objects.get((desired_class, fields))
+    if parsed is None:
+      # Responses read from disk, or cached for another class, are parsed
+      # when they are first used.
+      parsed = self._parse_response(cached.body, desired_class, fields)
+      cached.objects[(desired_class, fields)] = parsed
+    return parsed
+
+  def _parse_response(self, response, desired_class, fields):
+    if self.api_version is not None:
+      return atom.core.parse(response, desired_class,
+                             version=get_xml_version(self.api_version),
+                             fields=fields)
+    else:
+      # No API version was specified, so allow parse to
+      # use the default version.
+      return atom.core.parse(response, desired_class, fields=fields)
+
+  def _get_cache_key(self, uri, http_request, auth_token, kwargs):
+    """Identifies a response by user, URL and API version.
+
+    The URL is the one which will be requested, including any parameters
+    added by the modifiers in kwargs, such as a gdata.client.Query.
+    """
+    # The request is built on a copy, since request builds it again.
+    key_request = atom.http_core.HttpRequest()
+    if http_request is not None:
+      original = http_request.uri
+      key_request.uri = atom.http_core.Uri(
+          original.scheme, original.host, original.port, original.path,
+          original.query.copy())
+    if uri is not None:
+      uri.modify_request(key_request)
+    for value in kwargs.itervalues():
+      if value is not None:
+        value.modify_request(key_request)
+    uri = key_request.uri
+    host, user = self._get_request_key(uri, http_request, auth_token)
+    return (user, host, uri.port, uri.path, tuple(sorted(uri.query.items())),
+            self.api_version)
+
+  def _get_request_key(self, uri, http_request, auth_token):
+    """Identifies the host and user that a request is made for."""
+    if uri is not None and uri.host is not None:
+      host = uri.host
+    elif http_request is not None and http_request.uri.host is not None:
+      host = http_request.uri.host
+    else:
+      host = self.host
+    return gdata.ratelimit.request_key(
+        host, auth_token or self.auth_token,
+        uri or (http_request is not None and http_request.uri) or None)
+
+  def _apply_gsessionid(self, uri, http_request):
+    """Adopts or adds the gsessionid URL parameter for a request.
+
+    Returns the Uri to request, which is a copy of uri if the parameter was
+    added.
+    """
     # Add the gsession ID to the URL to prevent further redirects.
     # TODO: If different sessions are using the same client, there will be a
     # multitude of redirects and session ID shuffling.
+    # The stored ID is read once, since other threads may replace it while
+    # this request is being made.
+    gsessionid = self.__gsessionid
     # If the gsession ID is in the URL, adopt it as the standard location.
     if uri is not None and uri.query is not None and 'gsessionid' in uri.query:
       self.__gsessionid = uri.query['gsessionid']
@@ -253,16 +535,22 @@ class GDClient(atom.client.AtomPubClient):
           and 'gsessionid' in http_request.uri.query):
       self.__gsessionid = http_request.uri.query['gsessionid']
     # If the gsession ID is stored in the client, and was not present in the
-    # URI then add it to the URI.
-    elif self.__gsessionid is not None:
-      uri.query['gsessionid'] = self.__gsessionid
+    # URI then add it to a copy of the URI, leaving the caller's Uri (which
+    # may be shared with other threads) unchanged.
+    elif gsessionid is not None and uri is not None:
+      uri = atom.http_core.Uri(uri.scheme, uri.host, uri.port, uri.path,
+                               uri.query.copy())
+      uri.query['gsessionid'] = gsessionid
 
-    # The AtomPubClient should call this class' modify_request before
-    # performing the HTTP request.
-    #http_request = self.modify_request(http_request)
+    return uri
 
-    response = atom.client.AtomPubClient.request(self, method=method,
-        uri=uri, auth_token=auth_token, http_request=http_request, **kwargs)
+  def _handle_response(self, response, method, uri, auth_token, http_request,
+                       converter, desired_class, redirects_remaining, fields,
+                       kwargs):
+    """Converts the server's response or raises an error for its status.
+
+    Redirects are followed by calling self.request again.
+    """
     # On success, convert the response body using the desired converter
     # function if present.
     if response is None:
@@ -271,13 +559,8 @@ class GDClient(atom.client.AtomPubClient):
       if converter is not None:
         return converter(response)
       elif desired_class is not None:
-        if self.api_version is not None:
-          return atom.core.parse(response.read(), desired_class,
-                                 version=get_xml_version(self.api_version))
-        else:
-          # No API version was specified, so allow parse to
-          # use the default version.
-          return atom.core.parse(response.read(), desired_class)
+        # The response is parsed as it is read from the connection.
+        return self._parse_response(response, desired_class, fields)
       else:
         return response
     # TODO: move the redirect logic into the Google Calendar client once it
@@ -290,13 +573,16 @@ class GDClient(atom.client.AtomPubClient):
           m = re.compile('[\?\&]gsessionid=(\w*)').search(location)
           if m is not None:
             self.__gsessionid = m.group(1)
+          # Finish with the redirect response, so that its connection can
+          # be reused and observers see it end.
+          response.read()
           # Make a recursive call with the gsession ID in the URI to follow
           # the redirect.
           return self.request(method=method, uri=uri, auth_token=auth_token,
                               http_request=http_request, converter=converter,
                               desired_class=desired_class,
                               redirects_remaining=redirects_remaining-1,
-                              **kwargs)
+                              fields=fields, **kwargs)
         else:
           raise error_from_response('302 received without Location header',
                                     response, RedirectError)
@@ -319,7 +605,6 @@ class GDClient(atom.client.AtomPubClient):
       raise error_from_response('Server responded with', response,
                                 RequestError)
 
-  Request = request
 
   def request_client_login_token(
       self, email, password, source, service=None,
@@ -629,10 +914,10 @@ class GDClient(atom.client.AtomPubClient):
   ModifyRequest = modify_request
 
   def get_feed(self, uri, auth_token=None, converter=None,
-               desired_class=gdata.data.GDFeed, **kwargs):
+               desired_class=gdata.data.GDFeed, fields=None, **kwargs):
     return self.request(method='GET', uri=uri, auth_token=auth_token,
                         converter=converter, desired_class=desired_class,
-                        **kwargs)
+                        fields=fields, **kwargs)
 
   GetFeed = get_feed
 
@@ -669,6 +954,122 @@ class GDClient(atom.client.AtomPubClient):
 
   GetNext = get_next
 
+  def iter_entries(self, feed_uri, desired_class=gdata.data.GDFeed,
+                   prefetch=2, auth_token=None, checkpoint=None, **kwargs):
+    """Yields every entry in a feed, fetching later pages in the background.
+
+    If the first page gives openSearch:totalResults and its next link pages
+    by start-index, the URLs of all of the remaining pages are computed and
+    up to prefetch of them are fetched at once. Otherwise the next link of
+    each page is fetched while the entries of that page are being used.
+    Either way, entries are yielded in feed order and no more than prefetch
+    pages are held besides the current one.
+
+    If the feed grows while it is being read, pages past the computed ones
+    are found by following next links. If it shrinks, iteration stops at
+    the first empty page.
+
+    Only the current page and the prefetched ones are kept, so a feed of any
+    length can be read in constant memory as long as the caller does not
+    keep the entries.
+
+    Args:
+      feed_uri: str or atom.http_core.Uri The first page of the feed.
+      desired_class: The class of the feed, such as
+                     gdata.contacts.data.ContactsFeed.
+      prefetch: int The number of pages to fetch ahead of the one being
+                read. If 0, each page is only fetched when it is needed.
+      auth_token: (optional) The token which authorizes the requests.
+      checkpoint: (optional) A gdata.sync.FileCheckpoint in which the URL
+                  of the next page is saved once every entry of a page has
+                  been used. If it holds a URL when iteration starts, that
+                  page is read instead of feed_uri, so an interrupted crawl
+                  resumes where it stopped. It is cleared when the last
+                  page has been read.
+
+    Any additional arguments are passed to get_feed. Those which modify the
+    request, such as a query, are only used for the first page, since the
+    URLs of later pages already carry its parameters. Others, such as
+    fields, are used for every page. Pages are fetched on other threads
+    sharing this client's http_client; use an
+    atom.http_core.PooledHttpClient to reuse connections.
+
+    Returns:
+      A generator of the entries.
+    """
+    page_kwargs = {}
+    for name, value in kwargs.iteritems():
+      if not hasattr(value, 'modify_request'):
+        page_kwargs[name] = value
+
+    def fetch(uri):
+      return self.get_feed(uri, auth_token=auth_token,
+                           desired_class=desired_class, **page_kwargs)
+
+    resume_uri = None
+    if checkpoint is not None:
+      resume_uri = checkpoint.load()
+    if resume_uri is not None:
+      feed = fetch(resume_uri)
+    else:
+      feed = self.get_feed(feed_uri, auth_token=auth_token,
+                           desired_class=desired_class, **kwargs)
+    executor = None
+    if prefetch > 0:
+      executor = atom.executor.RequestExecutor(prefetch, prefetch)
+
+    def submit(uri):
+      if executor is None:
+        # Fetched when it is reached.
+        return uri, None
+      if isinstance(uri, (str, unicode)):
+        uri = atom.http_core.Uri.parse_uri(uri)
+      return uri, executor.submit(uri.host or self.host, fetch, uri)
+
+    finished = False
+    try:
+      planned = _plan_pages(feed)
+      pending = collections.deque()
+      while True:
+        if planned is not None:
+          while planned and len(pending) < max(prefetch, 1):
+            pending.append(submit(planned.popleft()))
+        elif not pending:
+          next_link = feed.find_next_link()
+          if next_link is not None:
+            pending.append(submit(next_link))
+        for entry in feed.entry:
+          yield entry
+        if not pending:
+          break
+        uri, page = pending.popleft()
+        if checkpoint is not None:
+          # Every entry before this page has been used.
+          checkpoint.save(str(uri))
+        # The previous page is released as soon as feed is replaced.
+        if page is None:
+          feed = fetch(uri)
+        else:
+          feed = page.result()
+        page = None
+        if planned is not None and not feed.entry:
+          break
+        if planned is not None and not planned and not pending:
+          # The last computed page. Any later pages were added since the
+          # first page was fetched.
+          planned = None
+      finished = True
+      if checkpoint is not None:
+        checkpoint.clear()
+    finally:
+      if executor is not None:
+        # Pages which have not started are dropped if the caller stops
+        # iterating early. Otherwise every page has been fetched, and the
+        # idle worker threads are joined.
+        executor.shutdown(wait=finished, cancel_pending=True)
+
+  IterEntries = iter_entries
+
   # TODO: add a refresh method to re-fetch the entry/feed from the server
   # if it has been updated.
 
@@ -677,9 +1078,15 @@ class GDClient(atom.client.AtomPubClient):
     if converter is None and desired_class is None:
       desired_class = entry.__class__
     http_request = atom.http_core.HttpRequest()
-    http_request.add_body_part(
-        entry.to_string(get_xml_version(self.api_version)),
-        'application/atom+xml')
+    if isinstance(entry, gdata.data.GDFeed):
+      # Feeds, such as batch requests, can be very large so their XML is
+      # sent as it is written instead of being built up as one string.
+      body = atom.core.XmlWriter(entry, get_xml_version(self.api_version))
+      http_request.add_body_part(body, 'application/atom+xml', len(body))
+    else:
+      http_request.add_body_part(
+          entry.to_string(get_xml_version(self.api_version)),
+          'application/atom+xml')
     return self.request(method='POST', uri=uri, auth_token=auth_token,
                         http_request=http_request, converter=converter,
                         desired_class=desired_class, **kwargs)
@@ -743,14 +1150,374 @@ class GDClient(atom.client.AtomPubClient):
 
   Delete = delete
 
-  #TODO: implement batch requests.
-  #def batch(feed, uri, auth_token=None, converter=None, **kwargs):
-  #  pass
+  def download_to(self, uri, file_or_path, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                  progress=None, digest=None, auth_token=None, **kwargs):
+    """Streams the body of a GET response into a file.
+
+    The body is read from the server chunk_size bytes at a time and each
+    chunk is written before the next is read, so downloads of any size use
+    a fixed amount of memory.
+
+    Args:
+      uri: str or atom.http_core.Uri The resource to download.
+      file_or_path: Either a str file path, which is opened for binary
+                    writing once the server has responded successfully, or
+                    a file-like object with a write method. A file opened by
+                    this method is closed when the download finishes, and
+                    removed if the download fails part way through. A file
+                    object which was passed in is left open.
+      chunk_size: int The maximum number of bytes to read at a time.
+      progress: function (optional) Called as progress(bytes_written, total)
+                after each chunk is written. total is the Content-Length of
+                the response, or None if the server did not send one.
+      digest: (optional) An object with an update method, such as
+              hashlib.md5(), which is given each chunk of the body. After
+              the download, digest.hexdigest() checks the file contents
+              without reading them back.
+
+    Any additional arguments are passed to self.request.
+
+    Returns:
+      The number of bytes written.
+    """
+    response = self.request(method='GET', uri=uri, auth_token=auth_token,
+                            **kwargs)
+    try:
+      total = response.getheader('Content-Length')
+      if total is not None:
+        total = int(total)
+      if isinstance(file_or_path, (str, unicode)):
+        destination = open(file_or_path, 'wb')
+      else:
+        destination = file_or_path
+      written = 0
+      try:
+        chunk = response.read(chunk_size)
+        while chunk:
+          destination.write(chunk)
+          written += len(chunk)
+          if digest is not None:
+            digest.update(chunk)
+          if progress is not None:
+            progress(written, total)
+          chunk = response.read(chunk_size)
+      except:
+        if destination is not file_or_path:
+          destination.close()
+          # Do not leave a truncated copy of the resource behind.
+          os.remove(file_or_path)
+        raise
+      if destination is not file_or_path:
+        destination.close()
+      return written
+    finally:
+      # A response which was not read to the end would otherwise keep its
+      # connection from going back to a pool.
+      close = getattr(response, 'close', None)
+      if close is not None:
+        close()
+
+  DownloadTo = download_to
+
+  def map_requests(self, uris, function=None, max_workers=8, max_per_host=4,
+                   **kwargs):
+    """Makes a request for each URI using a pool of threads.
+
+    Up to max_workers requests are in flight at once, and no more than
+    max_per_host to any one host. The results are yielded in the same order
+    as the URIs. A failed request does not stop the others: if a request
+    raises a gdata.client.Error (such as a RequestError for an error status
+    from the server), the exception is yielded in place of its result.
+
+    The client's auth_token and http_client are shared by all of the
+    requests. To reuse connections, set http_client to an
+    atom.http_core.PooledHttpClient. To receive futures instead of results,
+    use an atom.executor.RequestExecutor directly.
+
+    Args:
+      uris: A sequence of str or atom.http_core.Uri.
+      function: (optional) The method called with each URI, for example
+                self.get_entry. Defaults to self.get_feed.
+      max_workers: int The number of threads making requests.
+      max_per_host: int The maximum number of concurrent requests to a host.
+
+    Any additional arguments are passed to function with each URI.
+
+    Returns:
+      A generator which yields the result of each request, or the
+      gdata.client.Error which it raised.
+    """
+    if function is None:
+      function = self.get_feed
+    executor = atom.executor.RequestExecutor(max_workers, max_per_host)
+    try:
+      futures = []
+      for uri in uris:
+        if isinstance(uri, (str, unicode)):
+          uri = atom.http_core.Uri.parse_uri(uri)
+        futures.append(executor.submit(uri.host or self.host, function, uri,
+                                       **kwargs))
+      for future in futures:
+        error = future.exception()
+        if isinstance(error, Error):
+          yield error
+        else:
+          yield future.result()
+    finally:
+      # Requests which have not started are dropped if the caller stops
+      # iterating early.
+      executor.shutdown(wait=False, cancel_pending=True)
+
+  MapRequests = map_requests
+
+  def batch(self, operations, batch_uri, desired_class=gdata.data.BatchFeed,
+            max_batch_size=BATCH_SIZE, max_workers=4, auth_token=None,
+            **kwargs):
+    """Sends any number of batch operations, in as few requests as needed.
+
+    The operations are split into batch feeds of up to max_batch_size
+    entries, and up to max_workers of those are posted at once. Each entry
+    in the responses is matched to its operation by batch:id.
+
+    Operations which fail with a status that the retry policy retries (such
+    as 503), and those which the server did not reach because it
+    interrupted the batch (it then sends batch:interrupted and leaves them
+    out of the response), are sent again in new batches. If a whole request
+    fails with a retryable status or a network error, the server may still
+    have applied it, so only the operations which are safe to repeat are
+    sent again: queries, and updates and deletes of entries with an ETag
+    (see gdata.retry.is_idempotent_operation). The client's retry_policy
+    decides how many times and how long to wait; if it has none, a
+    gdata.retry.RetryPolicy with the default settings is used.
+
+    Args:
+      operations: A sequence of batch entries, such as
+          gdata.contacts.data.ContactEntry objects, with their
+          batch_operation set, or a gdata.data.BatchFeed built with
+          add_insert, add_update, add_delete and add_query. Entries without
+          a batch_id are given their position in the sequence as their id.
+      batch_uri: str or atom.http_core.Uri The batch URL of the feed.
+      desired_class: The class of the response feeds, such as
+          gdata.contacts.data.ContactsFeed.
+      max_batch_size: int The most operations sent in one request.
+      max_workers: int The most requests in flight at once.
+      auth_token: (optional) The token which authorizes the requests.
+
+    Any additional arguments are passed to post for each request.
+
+    Returns:
+      A collections.OrderedDict which maps the batch:id of each operation,
+      in the order given, to the entry the server returned for it. The
+      batch_status of the entry gives the code and reason for that
+      operation. If a whole request failed, the gdata.client.Error or
+      network error which it raised is given for each of its operations,
+      and a BatchOperationNotProcessed for operations which the server
+      left out of its response.
+    """
+    if isinstance(operations, gdata.data.BatchFeed):
+      operations = operations.entry
+    if isinstance(batch_uri, (str, unicode)):
+      batch_uri = atom.http_core.Uri.parse_uri(batch_uri)
+    policy = self.retry_policy or gdata.retry.RetryPolicy()
+    results = collections.OrderedDict()
+    pending = []
+    for entry in operations:
+      if entry.batch_id is None or not entry.batch_id.text:
+        entry.batch_id = gdata.data.BatchId(text=str(len(pending)))
+      if entry.batch_id.text in results:
+        raise Error('Duplicate batch id %s' % entry.batch_id.text)
+      results[entry.batch_id.text] = None
+      pending.append(entry)
+    attempt = 0
+    while pending:
+      pending = self._send_batches(
+          pending, batch_uri, desired_class, max_batch_size, max_workers,
+          policy, results, auth_token, kwargs)
+      if not pending:
+        break
+      delay = policy.get_backoff(attempt)
+      if delay is None:
+        break
+      policy.wait(delay)
+      attempt += 1
+    return results
+
+  Batch = batch
+
+  def _send_batches(self, entries, batch_uri, desired_class, max_batch_size,
+                    max_workers, policy, results, auth_token, kwargs):
+    """Posts entries in batch feeds and stores the result for each one.
+
+    Returns:
+      A list of the entries which should be sent again.
+    """
+    executor = atom.executor.RequestExecutor(max_workers, max_workers)
+    finished = False
+    try:
+      batches = []
+      for start in xrange(0, len(entries), max_batch_size):
+        batch_entries = entries[start:start + max_batch_size]
+        feed = gdata.data.BatchFeed(entry=batch_entries)
+        batches.append((batch_entries, executor.submit(
+            batch_uri.host or self.host, self.post, feed, batch_uri,
+            auth_token=auth_token, desired_class=desired_class, **kwargs)))
+      retry = []
+      for batch_entries, future in batches:
+        error = future.exception()
+        if error is not None:
+          if isinstance(error, RequestError):
+            retryable = error.status in policy.statuses
+          elif isinstance(error, gdata.retry.NETWORK_ERRORS):
+            retryable = True
+          elif isinstance(error, Error):
+            retryable = False
+          else:
+            future.result()
+          for entry in batch_entries:
+            results[entry.batch_id.text] = error
+            # Operations which may have been applied are not sent twice.
+            if retryable and gdata.retry.is_idempotent_operation(entry):
+              retry.append(entry)
+          continue
+        response = future.result()
+        answers = {}
+        for answer in response.entry:
+          if getattr(answer, 'batch_id', None) is not None:
+            answers[answer.batch_id.text] = answer
+        interrupted = getattr(response, 'interrupted', None)
+        if interrupted is None:
+          reason = 'No result was sent for the operation'
+        else:
+          reason = interrupted.reason or 'Batch interrupted'
+        for entry in batch_entries:
+          answer = answers.get(entry.batch_id.text)
+          if answer is None:
+            results[entry.batch_id.text] = BatchOperationNotProcessed(reason)
+            # Only an interrupted batch says that the server stopped before
+            # reaching the missing operations.
+            if interrupted is not None:
+              retry.append(entry)
+            continue
+          results[entry.batch_id.text] = answer
+          status = getattr(answer, 'batch_status', None)
+          if (status is not None and status.code
+              and int(status.code) in policy.statuses):
+            retry.append(entry)
+      finished = True
+      return retry
+    finally:
+      # All of the requests have finished unless one raised an unexpected
+      # exception, in which case those not yet started are dropped.
+      executor.shutdown(wait=finished, cancel_pending=True)
 
   # TODO: add a refresh method to request a conditional update to an entry
   # or feed.
 
 
+class AsyncGDClient(GDClient):
+  """A GDClient which makes many requests at once on an event loop.
+
+  request, and the methods built on it such as get_feed, get_entry,
+  get_next, post, update and delete, return an atom.executor.Future right
+  away instead of waiting for the server. Requests are sent using an
+  atom.aio.AsyncHttpClient, and run drives its event loop until the
+  futures are done:
+
+    client = gdata.client.AsyncGDClient()
+    futures = [client.get_feed(uri) for uri in uris]
+    client.run()
+    feeds = [future.result() for future in futures]
+
+  Requests are modified by auth tokens, Query objects and the client's
+  modify_request just as in GDClient, and responses are converted or raise
+  the same errors (from Future.result). Helpers which make several
+  requests in sequence, such as ResumableUploader, still expect a GDClient.
+
+  A response_cache is used as in GDClient. A retry_policy or rate_limiter
+  would have to wait between requests, which would stall the event loop,
+  so request raises an Error if either is set.
+  """
+
+  def __init__(self, http_client=None, host=None, auth_token=None,
+               source=None, **kwargs):
+    GDClient.__init__(self, http_client=http_client or
+                      atom.aio.AsyncHttpClient(), host=host,
+                      auth_token=auth_token, source=source, **kwargs)
+
+  def request(self, method=None, uri=None, auth_token=None,
+              http_request=None, converter=None, desired_class=None,
+              redirects_remaining=4, fields=None, **kwargs):
+    """Starts an HTTP request, see GDClient.request.
+
+    Returns:
+      An atom.executor.Future for the value which GDClient.request would
+      return. Redirects are followed before the Future is done.
+    """
+    if self.retry_policy is not None or self.rate_limiter is not None:
+      raise Error('An AsyncGDClient cannot use a retry_policy or '
+                  'rate_limiter, since they wait between requests.')
+    if isinstance(uri, (str, unicode)):
+      uri = atom.http_core.Uri.parse_uri(uri)
+    uri = self._apply_gsessionid(uri, http_request)
+    cache = self.response_cache
+    cached = None
+    if (cache is not None and converter is None and desired_class is not None
+        and _is_cacheable(method, http_request)):
+      if isinstance(fields, list):
+        fields = tuple(fields)
+      key = self._get_cache_key(uri, http_request, auth_token, kwargs)
+      cached = cache.get(key)
+    else:
+      cache = None
+    response = atom.client.AtomPubClient.request(self, method=method,
+        uri=uri, auth_token=auth_token, http_request=http_request,
+        cached_response=cached, **kwargs)
+    def handle_response(response):
+      if cache is not None:
+        if response.status == 304 and cached is not None:
+          response.read()
+          return self._get_cached_object(cached, desired_class, fields)
+        elif response.status == 200 or response.status == 201:
+          return self._parse_and_cache(cache, key, response, desired_class,
+                                       fields)
+      return self._handle_response(response, method, uri, auth_token,
+                                   http_request, converter, desired_class,
+                                   redirects_remaining, fields, kwargs)
+    return atom.executor.chain(response, handle_response)
+
+  Request = request
+
+  def run(self, futures=None, timeout=None):
+    """Runs the event loop until the futures are done.
+
+    See atom.aio.AsyncHttpClient.run.
+    """
+    self.http_client.run(futures, timeout)
+
+  Run = run
+
+  def map_requests(self, uris, function=None, max_workers=None,
+                   max_per_host=None, **kwargs):
+    """Makes a request for each URI on the event loop.
+
+    Works like GDClient.map_requests, but no threads are used. max_workers
+    and max_per_host are ignored; the number of connections to each host is
+    limited by the http_client's max_per_host.
+    """
+    if function is None:
+      function = self.get_feed
+    futures = [function(uri, **kwargs) for uri in uris]
+    self.run(futures)
+    for future in futures:
+      error = future.exception()
+      if isinstance(error, Error):
+        yield error
+      else:
+        yield future.result()
+
+  MapRequests = map_requests
+
+
 def _add_query_param(param_string, value, http_request):
   if value:
     http_request.uri.query[param_string] = value
@@ -27,6 +27,7 @@ __author__ = 'vinces1979@gmail.com (Vince Spicer)'
 
 import gdata.client
 import gdata.contacts.data
+import gdata.sync
 import atom.data
 import atom.http_core
 import gdata.gauth
@@ -183,6 +184,34 @@ class ContactsClient(gdata.client.GDClient):
 
   GetContacts = get_contacts
 
+  def get_contacts_sync(self, store=None, contact_list=None, kind='contacts',
+                        max_results=None):
+    """Creates a gdata.sync.FeedSync which mirrors the user's contacts.
+
+    Each sync after the first fetches only the contacts changed since the
+    one before, including deleted contacts so that they are removed from
+    the mirror. If the server no longer has a record of every deletion, the
+    whole feed is fetched again.
+
+    Args:
+      store: (optional) A gdata.sync.FileStore or MemoryStore in which the
+             mirror is kept between syncs.
+      contact_list: str (optional) Defaults to self.contact_list.
+      kind: str (optional) 'contacts' or 'groups'.
+      max_results: int (optional) The number of entries in each page.
+    """
+    if kind == 'groups':
+      desired_class = gdata.contacts.data.GroupsFeed
+    else:
+      desired_class = gdata.contacts.data.ContactsFeed
+    query = ContactsQuery(showdeleted='true', requirealldeleted='true',
+                          max_results=max_results)
+    return gdata.sync.FeedSync(
+        self, self.get_feed_uri(kind=kind, contact_list=contact_list),
+        desired_class, query=query, store=store)
+
+  GetContactsSync = get_contacts_sync
+
   def get_group(self, uri=None, desired_class=gdata.contacts.data.GroupEntry,
                 auth_token=None, **kwargs):
     """ Get a single groups details 
@@ -266,7 +295,7 @@ class ContactsClient(gdata.client.GDClient):
 
   ChangePhoto = change_photo
 
-  def get_photo(self, contact_entry_or_url):
+  def get_photo(self, contact_entry_or_url, file_or_path=None, **kwargs):
     """Retrives the binary data for the contact's profile photo as a string.
     
     Args:
@@ -274,10 +303,12 @@ class ContactsClient(gdata.client.GDClient):
          containing the photo link's URL. If the contact entry does not 
          contain a photo link, the image will not be fetched and this method
          will return None.
+      file_or_path: (optional) a file path or file-like object. If given, the
+         image is written to it a chunk at a time by self.download_to instead
+         of being returned, and the number of bytes written is returned.
+      kwargs: Other parameters to pass to self.download_to(), such as
+         chunk_size, progress, and digest.
     """
-    # TODO: add the ability to write out the binary image data to a file, 
-    # reading and writing a chunk at a time to avoid potentially using up 
-    # large amounts of memory.
     url = None
     if isinstance(contact_entry_or_url, gdata.contacts.data.ContactEntry):
       photo_link = contact_entry_or_url.GetPhotoLink()
@@ -285,10 +316,11 @@ class ContactsClient(gdata.client.GDClient):
         url = photo_link.href
     else:
       url = contact_entry_or_url
-    if url:
-      return self.Get(url, desired_class=str)
-    else:
+    if not url:
       return None
+    if file_or_path is not None:
+      return self.download_to(url, file_or_path, **kwargs)
+    return self.Get(url, desired_class=str)
 
   GetPhoto = get_photo
 
@@ -362,6 +394,9 @@ class ContactsClient(gdata.client.GDClient):
 
   def execute_batch(self, batch_feed, url, desired_class=None):
     """Sends a batch request feed to the server.
+
+    To send more operations than the server accepts in one request, use
+    batch, which splits them into several requests.
     
     Args:
       batch_feed: gdata.contacts.ContactFeed A feed containing batch
@@ -438,6 +473,7 @@ class ContactsQuery(gdata.client.Query):
     self.orderby = orderby
     self.sortorder = sortorder
     self.showdeleted = showdeleted
+    self.requirealldeleted = requirealldeleted
 
   def modify_request(self, http_request):
     if self.group:
@@ -448,6 +484,9 @@ class ContactsQuery(gdata.client.Query):
       gdata.client._add_query_param('sortorder', self.sortorder, http_request)
     if self.showdeleted:
       gdata.client._add_query_param('showdeleted', self.showdeleted, http_request)
+    if self.requirealldeleted:
+      gdata.client._add_query_param('requirealldeleted',
+                                    self.requirealldeleted, http_request)
     gdata.client.Query.modify_request(self, http_request)
 
   ModifyRequest = modify_request
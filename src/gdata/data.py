@@ -921,6 +921,17 @@ class RecurrenceException(atom.core.XmlElement):
   original_event = OriginalEvent
 
 
+class EventStatus(atom.core.XmlElement):
+  """The gd:eventStatus element.
+
+  The status of an event, one of CANCELED_EVENT, CONFIRMED_EVENT or
+  TENTATIVE_EVENT. Deleted events are listed as canceled when a feed is
+  requested with updated-min.
+  """
+  _qname = GDATA_TEMPLATE % 'eventStatus'
+  value = 'value'
+
+
 class Reminder(atom.core.XmlElement):
   """The gd:reminder element.
 
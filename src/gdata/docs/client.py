@@ -26,6 +26,7 @@ import atom.http_core
 import gdata.client
 import gdata.docs.data
 import gdata.gauth
+import gdata.sync
 
 
 # Feed URI templates
@@ -84,26 +85,26 @@ class DocsClient(gdata.client.GDClient):
   def _download_file(self, uri, file_path, auth_token=None, **kwargs):
     """Downloads a file to disk from the specified URI.
 
-    Note: to download a file in memory, use the GetFileContent() method.
+    The file is streamed to disk a chunk at a time by
+    gdata.client.GDClient.download_to, so large files and exports are not
+    held in memory. Note: to download a file in memory, use the
+    GetFileContent() method.
 
     Args:
       uri: str The full URL to download the file from.
       file_path: str The full path to save the file to.
       auth_token: (optional) gdata.gauth.ClientLoginToken, AuthSubToken, or
           OAuthToken which authorizes this client to edit the user's data.
-      kwargs: Other parameters to pass to self.get_file_content().
+      kwargs: Other parameters to pass to self.download_to(), such as
+          chunk_size, progress, and digest.
+
+    Returns:
+      The number of bytes written.
 
     Raises:
       gdata.client.RequestError: on error response from server.
     """
-    f = open(file_path, 'wb')
-    try:
-      f.write(self.get_file_content(uri, auth_token=auth_token, **kwargs))
-    except gdata.client.RequestError, e:
-      f.close()
-      raise e
-    f.flush()
-    f.close()
+    return self.download_to(uri, file_path, auth_token=auth_token, **kwargs)
 
   _DownloadFile = _download_file
 
@@ -171,36 +172,83 @@ class DocsClient(gdata.client.GDClient):
 
   GetDoc = get_doc
 
+  def iter_everything(self, uri=None, auth_token=None, checkpoint=None,
+                      **kwargs):
+    """Yields each entry of the user's entire doc list.
+
+    Entries are yielded as each page of the feed arrives, and a page is
+    released once its entries have been used, so even very large doc lists
+    are read in constant memory.
+
+    Args:
+      uri: str (optional) A URI to query the doclist feed with.
+      auth_token: (optional) gdata.gauth.ClientLoginToken, AuthSubToken, or
+          OAuthToken which authorizes this client to edit the user's data.
+      checkpoint: (optional) A gdata.sync.FileCheckpoint which records the
+          next page to read, so that an interrupted listing resumes there.
+      kwargs: Other parameters to pass to self.iter_entries(), such as
+          prefetch or a query for the first page. limit sets the number of
+          entries in each page.
+
+    Returns:
+      A generator of gdata.docs.data.DocsEntry objects.
+    """
+    if uri is None:
+      uri = DOCLIST_FEED_URI
+
+    if isinstance(uri, (str, unicode)):
+      uri = atom.http_core.Uri.parse_uri(uri)
+    limit = kwargs.pop('limit', None)
+    if limit is not None and not 'max-results' in uri.query:
+      uri.query['max-results'] = limit
+
+    # Later pages are fetched while earlier ones are being parsed.
+    return self.iter_entries(uri, desired_class=gdata.docs.data.DocList,
+                             auth_token=auth_token, checkpoint=checkpoint,
+                             **kwargs)
+
+  IterEverything = iter_everything
+
   def get_everything(self, uri=None, auth_token=None, **kwargs):
     """Retrieves the user's entire doc list.
 
     The method makes multiple HTTP requests (by following the feed's next links)
-    in order to fetch the user's entire document list.
+    in order to fetch the user's entire document list. Use iter_everything
+    to avoid holding every entry in memory at once.
 
     Args:
       uri: str (optional) A URI to query the doclist feed with.
       auth_token: (optional) gdata.gauth.ClientLoginToken, AuthSubToken, or
           OAuthToken which authorizes this client to edit the user's data.
-      kwargs: Other parameters to pass to self.GetDocList().
+      kwargs: Other parameters to pass to self.iter_everything().
 
     Returns:
       A list of gdata.docs.data.DocsEntry objects representing the retrieved
       entries.
     """
-    if uri is None:
-      uri = DOCLIST_FEED_URI
+    return list(self.iter_everything(uri, auth_token=auth_token, **kwargs))
 
-    feed = self.GetDocList(uri=uri, auth_token=auth_token, **kwargs)
-    entries = feed.entry
+  GetEverything = get_everything
 
-    while feed.GetNextLink() is not None:
-      feed = self.GetDocList(
-          feed.GetNextLink().href, auth_token=auth_token, **kwargs)
-      entries.extend(feed.entry)
+  def get_doclist_sync(self, store=None, uri=None, limit=None):
+    """Creates a gdata.sync.FeedSync which mirrors the user's doc list.
 
-    return entries
+    Each sync after the first fetches only the items changed since the one
+    before, including deleted items so that they are removed from the
+    mirror.
 
-  GetEverything = get_everything
+    Args:
+      store: (optional) A gdata.sync.FileStore or MemoryStore in which the
+             mirror is kept between syncs.
+      uri: str (optional) A URI to query the doclist feed with.
+      limit: int (optional) The number of entries in each page.
+    """
+    query = DocsQuery(show_deleted='true', max_results=limit)
+    return gdata.sync.FeedSync(self, uri or DOCLIST_FEED_URI,
+                               gdata.docs.data.DocList, query=query,
+                               store=store)
+
+  GetDoclistSync = get_doclist_sync
 
   def get_acl_permissions(self, resource_id, auth_token=None, **kwargs):
     """Retrieves a the ACL sharing permissions for a document.
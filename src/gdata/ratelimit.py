@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Limits the rate of requests sent to Google Data servers.
+
+A RateLimiter keeps a token bucket for each server host and user, so that
+requests made with one user's credentials do not use up another user's
+share. When the server signals that a quota has been exceeded (with a 503,
+a 429, or a 403 whose message mentions a quota or rate limit), the rate for
+that host and user is cut in half, and any Retry-After delay is respected.
+Each successful response raises the rate a little, up to max_rate, so the
+rate settles just below the point at which the server starts to throttle.
+
+A RateLimiter may be shared by any number of clients and threads:
+
+  limiter = gdata.ratelimit.RateLimiter(rate=5)
+  for client in clients:
+    client.rate_limiter = limiter
+
+Works with gdata.client.GDClient and the version one
+gdata.service.GDataService.
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import hashlib
+import re
+import StringIO
+import threading
+import time
+
+
+# Messages in 403 responses which mean that a quota has been exceeded.
+QUOTA_EXCEEDED = re.compile(r'quota|rate ?limit', re.IGNORECASE)
+# Statuses which always mean that requests should be slowed down.
+THROTTLED_STATUSES = (429, 503)
+
+
+class _Bucket(object):
+
+  def __init__(self, rate, burst, now):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    # When tokens was last brought up to date. May be in the future while
+    # requests are paused.
+    self.updated = now
+
+  def refill(self, now):
+    elapsed = now - self.updated
+    if elapsed > 0:
+      self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+      self.updated = now
+
+
+class RateLimiter(object):
+  """Adaptive token buckets for each (host, user) pair.
+
+  Rates are in requests per second. Up to burst requests may be sent at
+  once after a quiet period; after that, requests are spaced out to the
+  current rate. The rate is adjusted with additive increase and
+  multiplicative decrease.
+  """
+
+  def __init__(self, rate=5.0, burst=None, min_rate=0.1, max_rate=None,
+               backoff=0.5, increase=None):
+    """Creates a limiter. All hosts and users start at the same rate.
+
+    Args:
+      rate: float The initial number of requests per second.
+      burst: int (optional) The number of requests which may be sent at once.
+             Defaults to rate (and at least 1).
+      min_rate: float The lowest rate to back off to.
+      max_rate: float (optional) The highest rate to increase to. By default
+                the rate keeps rising until the server throttles requests.
+      backoff: float The rate is multiplied by this after a throttled
+               response.
+      increase: float (optional) The rate is raised by this after each
+                successful response. Defaults to a tenth of rate.
+    """
+    self.rate = float(rate)
+    self.burst = burst or max(1, int(rate))
+    self.min_rate = min_rate
+    self.max_rate = max_rate
+    self.backoff = backoff
+    self.increase = increase or self.rate / 10
+    self._buckets = {}
+    self._lock = threading.Lock()
+    self._clock = time.time
+    self._sleep = time.sleep
+
+  def acquire(self, key):
+    """Waits until a request may be sent for key.
+
+    Requests are served in the order in which they call acquire, each
+    reserving a token even if it has to wait for it.
+
+    Returns:
+      The number of seconds spent waiting.
+    """
+    self._lock.acquire()
+    try:
+      bucket = self._get_bucket(key)
+      now = self._clock()
+      bucket.refill(now)
+      bucket.tokens -= 1
+      wait = max(bucket.updated - now, 0)
+      if bucket.tokens < 0:
+        wait += -bucket.tokens / bucket.rate
+    finally:
+      self._lock.release()
+    if wait > 0:
+      self._sleep(wait)
+    return wait
+
+  Acquire = acquire
+
+  def throttled(self, key, retry_after=None):
+    """Slows down requests for key after the server throttled one.
+
+    Args:
+      retry_after: float (optional) The number of seconds the server asked
+                   clients to wait before trying again.
+    """
+    self._lock.acquire()
+    try:
+      bucket = self._get_bucket(key)
+      now = self._clock()
+      bucket.refill(now)
+      bucket.rate = max(self.min_rate, bucket.rate * self.backoff)
+      # Requests which were allowed to burst ahead wait for the new rate.
+      bucket.tokens = min(bucket.tokens, 0)
+      if retry_after:
+        bucket.updated = max(bucket.updated, now + retry_after)
+    finally:
+      self._lock.release()
+
+  Throttled = throttled
+
+  def succeeded(self, key):
+    """Speeds up requests for key after a successful response."""
+    self._lock.acquire()
+    try:
+      bucket = self._get_bucket(key)
+      bucket.rate += self.increase
+      if self.max_rate is not None:
+        bucket.rate = min(bucket.rate, self.max_rate)
+    finally:
+      self._lock.release()
+
+  Succeeded = succeeded
+
+  def get_rate(self, key):
+    """Returns the current rate for key in requests per second."""
+    self._lock.acquire()
+    try:
+      return self._get_bucket(key).rate
+    finally:
+      self._lock.release()
+
+  GetRate = get_rate
+
+  def response_received(self, key, response):
+    """Adjusts the rate for key based on a response from the server.
+
+    The body of a 403 response is read to see whether it reports an
+    exceeded quota, so the response returned in that case is a copy which
+    can be read again.
+
+    Returns:
+      The response, or an equivalent one if its body has been read.
+    """
+    status = getattr(response, 'status', None)
+    if status in THROTTLED_STATUSES:
+      self.throttled(key, get_retry_after(response))
+    elif status == 403:
+      body = response.read()
+      if QUOTA_EXCEEDED.search(body or ''):
+        self.throttled(key, get_retry_after(response))
+      return _ReadResponse(response, body)
+    elif status is not None and status < 400:
+      self.succeeded(key)
+    return response
+
+  ResponseReceived = response_received
+
+  def _get_bucket(self, key):
+    bucket = self._buckets.get(key)
+    if bucket is None:
+      bucket = _Bucket(self.rate, self.burst, self._clock())
+      self._buckets[key] = bucket
+    return bucket
+
+
+def request_key(host, auth_token=None, uri=None):
+  """Identifies the host and user which a request counts against.
+
+  The user is taken from the two legged OAuth requestor ID in the URL or
+  auth token if there is one, and otherwise from the auth token's secret
+  string. The string is hashed so that it is not kept in the key.
+
+  Args:
+    host: str The server which the request is sent to.
+    auth_token: (optional) The token which authorizes the request.
+    uri: atom.http_core.Uri (optional) The URL of the request.
+  """
+  user = None
+  query = getattr(uri, 'query', None)
+  if query and 'xoauth_requestor_id' in query:
+    user = query['xoauth_requestor_id']
+  elif auth_token is not None:
+    for name in ('requestor_id', 'token_string', 'token', 'access_token'):
+      user = getattr(auth_token, name, None)
+      if user:
+        break
+    else:
+      if hasattr(auth_token, 'get_token_string'):
+        user = auth_token.get_token_string()
+  # Every source of the user is hashed in the same way, so that requests
+  # for one user share a bucket however the user was found.
+  if isinstance(user, unicode):
+    user = user.encode('utf-8')
+  if user:
+    user = hashlib.sha1(user).hexdigest()
+  return (host, user)
+
+
+RequestKey = request_key
+
+
+def get_retry_after(response):
+  """Reads a Retry-After header given in seconds, or returns None."""
+  getheader = getattr(response, 'getheader', None)
+  if getheader is None:
+    return None
+  value = getheader('Retry-After') or getheader('retry-after')
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    # The header may also be an HTTP date, which is not used by Google
+    # servers.
+    return None
+
+
+GetRetryAfter = get_retry_after
+
+
+class _ReadResponse(object):
+  """A response whose body has already been read into a string."""
+
+  def __init__(self, response, body):
+    self._response = response
+    self._body = StringIO.StringIO(body or '')
+
+  def read(self, amt=None):
+    if amt is None:
+      return self._body.read()
+    return self._body.read(amt)
+
+  def __getattr__(self, name):
+    return getattr(self._response, name)
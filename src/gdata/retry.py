@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Retries requests which failed because of a temporary server problem.
+
+Set the retry_policy member of a gdata.client.GDClient to retry requests
+which fail with a 5xx or 429 response, or with a network error:
+
+  client.retry_policy = gdata.retry.RetryPolicy(max_retries=3)
+
+Only requests which can safely be sent twice are retried. GET, HEAD and
+OPTIONS requests always are. PUT, DELETE and PATCH requests are retried
+only if they are conditional on an entry's ETag (an If-Match header other
+than '*'), so that if the first attempt did reach the server, the retry
+fails with 412 Precondition Failed instead of overwriting a change made in
+the meantime. POST requests are never retried.
+
+Waits between attempts grow exponentially with random jitter, and a
+Retry-After header from the server is used in place of the computed wait.
+All policies share a RetryBudget (unless given their own) which allows
+retries for only a fraction of requests, so that when a server is failing
+the clients do not multiply the load on it.
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import httplib
+import os
+import random
+import socket
+import threading
+import time
+import gdata.ratelimit
+
+
+# Methods which do not change anything on the server.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Methods which are retried if they carry an If-Match ETag.
+CONDITIONAL_METHODS = ('PUT', 'DELETE', 'PATCH')
+# Response statuses which mean that the request may succeed if sent again.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Exceptions raised by HTTP clients when the connection fails.
+NETWORK_ERRORS = (socket.error, httplib.HTTPException)
+
+
+class RetryBudget(object):
+  """Limits retries to a fraction of the requests made.
+
+  Each request deposits ratio tokens and each retry withdraws a whole one.
+  To allow retries when few requests are being made, min_per_second tokens
+  are also added each second. No more than max_tokens are saved up.
+  """
+
+  def __init__(self, ratio=0.1, min_per_second=1.0, max_tokens=10):
+    self.ratio = ratio
+    self.min_per_second = min_per_second
+    self.max_tokens = max_tokens
+    self.tokens = float(max_tokens)
+    self._lock = threading.Lock()
+    self._clock = time.time
+    self._updated = self._clock()
+
+  def request_started(self):
+    """Records a first attempt at a request."""
+    self._lock.acquire()
+    try:
+      self._refill()
+      self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+    finally:
+      self._lock.release()
+
+  RequestStarted = request_started
+
+  def withdraw(self):
+    """Returns True if a retry is allowed, and counts it against the budget.
+    """
+    self._lock.acquire()
+    try:
+      self._refill()
+      if self.tokens >= 1:
+        self.tokens -= 1
+        return True
+      return False
+    finally:
+      self._lock.release()
+
+  Withdraw = withdraw
+
+  def _refill(self):
+    now = self._clock()
+    elapsed = now - self._updated
+    if elapsed > 0:
+      self.tokens = min(self.max_tokens,
+                        self.tokens + elapsed * self.min_per_second)
+    self._updated = now
+
+
+# The budget shared by all policies which are not given one.
+DEFAULT_BUDGET = RetryBudget()
+
+
+class RetryPolicy(object):
+  """Decides whether and when to send a failed request again."""
+
+  def __init__(self, max_retries=3, initial_delay=0.5, max_delay=30,
+               backoff=2, max_retry_after=120, statuses=RETRY_STATUSES,
+               budget=None):
+    """Creates a policy which may be used by any number of clients.
+
+    Args:
+      max_retries: int The most times a request is sent again.
+      initial_delay: float The longest wait in seconds before the first
+                     retry. Each wait is a random time up to the limit for
+                     that attempt.
+      max_delay: float The limit on the computed wait in seconds.
+      backoff: float The limit is multiplied by this after each retry.
+      max_retry_after: float Requests are not retried if the server asks
+                       for a longer wait than this in a Retry-After header.
+      statuses: sequence of int The response statuses to retry.
+      budget: RetryBudget (optional) Defaults to DEFAULT_BUDGET.
+    """
+    self.max_retries = max_retries
+    self.initial_delay = initial_delay
+    self.max_delay = max_delay
+    self.backoff = backoff
+    self.max_retry_after = max_retry_after
+    self.statuses = statuses
+    self.budget = budget or DEFAULT_BUDGET
+    self._random = random.random
+    self._sleep = time.sleep
+
+  def get_delay(self, http_request, attempt, response=None, error=None):
+    """Returns the seconds to wait before a retry, or None to not retry.
+
+    A retry which is allowed is counted against the budget.
+
+    Args:
+      http_request: atom.http_core.HttpRequest The request which failed.
+      attempt: int The number of retries already made, 0 after the first
+               attempt.
+      response: The server's response, if there was one.
+      error: Exception The network error, if there was no response.
+    """
+    if attempt >= self.max_retries or not is_idempotent(http_request):
+      return None
+    retry_after = None
+    if response is not None:
+      if response.status not in self.statuses:
+        return None
+      retry_after = gdata.ratelimit.get_retry_after(response)
+      if retry_after is not None and retry_after > self.max_retry_after:
+        return None
+    elif not isinstance(error, NETWORK_ERRORS):
+      return None
+    if not self.budget.withdraw():
+      return None
+    if retry_after is not None:
+      return retry_after
+    return self._get_backoff_delay(attempt)
+
+  GetDelay = get_delay
+
+  def get_backoff(self, attempt):
+    """Returns the seconds to wait before retrying work, or None to give up.
+
+    Used for retries which are not of a single request, such as sending the
+    failed operations of a batch again. A retry which is allowed is counted
+    against the budget.
+
+    Args:
+      attempt: int The number of retries already made.
+    """
+    if attempt >= self.max_retries or not self.budget.withdraw():
+      return None
+    return self._get_backoff_delay(attempt)
+
+  GetBackoff = get_backoff
+
+  def _get_backoff_delay(self, attempt):
+    limit = min(self.max_delay, self.initial_delay * self.backoff ** attempt)
+    return limit * self._random()
+
+  def wait(self, seconds):
+    self._sleep(seconds)
+
+  Wait = wait
+
+
+def is_idempotent(http_request):
+  """Returns True if sending the request twice has the same effect as once.
+
+  A method given in an X-HTTP-Method-Override header is used in place of
+  the request's method.
+  """
+  method = (http_request.headers.get('X-HTTP-Method-Override')
+            or http_request.method or 'GET').upper()
+  if method in SAFE_METHODS:
+    return True
+  if method in CONDITIONAL_METHODS:
+    etag = http_request.headers.get('If-Match')
+    return bool(etag) and etag != '*'
+  return False
+
+
+IsIdempotent = is_idempotent
+
+
+def is_idempotent_operation(entry):
+  """Returns True if a batch operation has the same effect if applied twice.
+
+  Queries are safe to repeat. Updates and deletes are too if the entry
+  carries an ETag other than '*', which the server checks as it would an
+  If-Match header. Inserts, and entries without an operation (which the
+  server treats as inserts), are not.
+  """
+  operation = getattr(entry, 'batch_operation', None)
+  operation_type = (operation is not None and operation.type or
+                    'insert').lower()
+  if operation_type == 'query':
+    return True
+  if operation_type in ('update', 'delete'):
+    etag = getattr(entry, 'etag', None)
+    return bool(etag) and etag != '*'
+  return False
+
+
+IsIdempotentOperation = is_idempotent_operation
+
+
+class RequestBody(object):
+  """Remembers where each part of a request body starts, to send it again.
+
+  Strings and iterables which produce a new iterator each time (such as an
+  atom.core.XmlWriter) can be sent any number of times. File-like objects
+  are sought back to where they were when the RequestBody was made. A file
+  which has been closed or cannot seek, such as the file handle of a
+  gdata.data.MediaSource, is opened again by name if it is a regular file.
+  Other parts, such as generators, cannot be sent again. Files opened
+  again are closed by close, which should be called once the request is
+  finished.
+  """
+
+  def __init__(self, http_request):
+    self.http_request = http_request
+    self.rewindable = True
+    # (index, position, path) for each file in the body.
+    self._files = []
+    # The files which rewind has opened.
+    self._opened = []
+    for i, part in enumerate(http_request._body_parts):
+      if isinstance(part, (str, unicode)):
+        continue
+      elif hasattr(part, 'read'):
+        try:
+          position = part.tell()
+        except (AttributeError, EnvironmentError, ValueError):
+          position = None
+        path = _get_file_path(part)
+        if position is None and path is None:
+          self.rewindable = False
+        self._files.append((i, position, path))
+      elif not hasattr(part, '__iter__') or iter(part) is part:
+        self.rewindable = False
+
+  def rewind(self):
+    """Prepares the body to be sent again.
+
+    Returns:
+      False if the body cannot be sent again.
+    """
+    if not self.rewindable:
+      return False
+    parts = self.http_request._body_parts
+    for i, position, path in self._files:
+      part = parts[i]
+      if position is not None and not getattr(part, 'closed', False):
+        try:
+          part.seek(position)
+          continue
+        except (AttributeError, EnvironmentError, ValueError):
+          pass
+      if path is None:
+        return False
+      try:
+        reopened = open(path, 'rb')
+      except EnvironmentError:
+        return False
+      self._opened.append(reopened)
+      if position:
+        reopened.seek(position)
+      if part in self._opened:
+        # Opened by an earlier rewind, and no longer needed.
+        part.close()
+      parts[i] = reopened
+    return True
+
+  Rewind = rewind
+
+  def close(self):
+    """Closes the files which rewind opened."""
+    for opened in self._opened:
+      opened.close()
+    self._opened = []
+
+  Close = close
+
+
+def _get_file_path(part):
+  name = getattr(part, 'name', None)
+  if isinstance(name, basestring) and os.path.isfile(name):
+    return name
+  return None
@@ -76,10 +76,12 @@ except ImportError:
 import atom.service
 import gdata
 import atom
+import atom.http_core
 import atom.http_interface
 import atom.token_store
 import gdata.auth
 import gdata.gauth
+import gdata.ratelimit
 
 
 AUTH_SERVER_HOST = 'https://www.google.com'
@@ -195,6 +197,10 @@ class GDataService(atom.service.AtomService):
   auth_token = None
   # The tokens dict is deprecated in favor of the token_store.
   tokens = None
+  # A gdata.ratelimit.RateLimiter which spaces out requests to each host
+  # for each user, and slows down when the server reports that a quota
+  # has been exceeded.
+  rate_limiter = None
 
   def __init__(self, email=None, password=None, account_type='HOSTED_OR_GOOGLE',
                service=None, auth_service_url=None, source=None, server=None, 
@@ -324,15 +330,46 @@ class GDataService(atom.service.AtomService):
       yield next_feed
       next = next_feed.GetNextLink()
 
-  def _GetElementGeneratorFromLinkFinder(self, link_finder, func,
-                                        num_retries=DEFAULT_NUM_RETRIES,
-                                        delay=DEFAULT_DELAY,
-                                        backoff=DEFAULT_BACKOFF):
-    for element in self.GetGeneratorFromLinkFinder(link_finder, func,
-                                                   num_retries=num_retries,
-                                                   delay=delay,
-                                                   backoff=backoff).entry:
-      yield element
+  def GetEntryGeneratorFromLinkFinder(self, link_finder, func,
+                                      num_retries=DEFAULT_NUM_RETRIES,
+                                      delay=DEFAULT_DELAY,
+                                      backoff=DEFAULT_BACKOFF,
+                                      checkpoint=None):
+    """Yields each entry of a feed page and of all of the pages after it.
+
+    Each page is fetched only when the entries of the page before have been
+    used, and is released once its own entries have been yielded, so only
+    one page is held in memory at a time.
+
+    Args:
+      link_finder: The first page of the feed.
+      func: function which converts the XML of a page into a feed object,
+          such as gdata.apps.UserFeedFromString.
+      checkpoint: gdata.sync.FileCheckpoint (optional) Where the URL of the
+          next page is saved once every entry of a page has been used. It
+          is cleared after the last page. To resume, fetch the saved URL
+          and pass that page as the link_finder.
+
+    Returns:
+      A generator of the entries.
+    """
+    feed = link_finder
+    del link_finder
+    while True:
+      next = feed.GetNextLink()
+      for entry in feed.entry:
+        yield entry
+      feed = None
+      if next is None:
+        break
+      if checkpoint is not None:
+        checkpoint.save(next.href)
+      feed = func(str(self.GetWithRetries(
+          next.href, num_retries=num_retries, delay=delay, backoff=backoff)))
+    if checkpoint is not None:
+      checkpoint.clear()
+
+  _GetElementGeneratorFromLinkFinder = GetEntryGeneratorFromLinkFinder
 
   def GetOAuthInputParameters(self):
     return self._oauth_input_params
@@ -949,6 +986,30 @@ class GDataService(atom.service.AtomService):
       raise RequestError, {'status': response.status,
           'body': result_body}
 
+  def request(self, operation, url, data=None, headers=None,
+      url_params=None):
+    """Makes an HTTP request, waiting for the rate_limiter if one is set.
+
+    See atom.service.AtomService.request.
+    """
+    limiter = self.rate_limiter
+    if limiter is None:
+      return atom.service.AtomService.request(self, operation, url,
+          data=data, headers=headers, url_params=url_params)
+    if isinstance(url, (str, unicode)) and not url.startswith('http'):
+      full_url = 'http://%s%s' % (self.server, url)
+    else:
+      full_url = str(url)
+    uri = atom.http_core.Uri.parse_uri(full_url)
+    if url_params:
+      uri.query.update(url_params)
+    limit_key = gdata.ratelimit.request_key(uri.host,
+        self.current_token or self.token_store.find_token(full_url), uri)
+    limiter.acquire(limit_key)
+    response = atom.service.AtomService.request(self, operation, url,
+        data=data, headers=headers, url_params=url_params)
+    return limiter.response_received(limit_key, response)
+
   def GetWithRetries(self, uri, extra_headers=None, redirects_remaining=4, 
       encoding='UTF-8', converter=None, num_retries=DEFAULT_NUM_RETRIES,
       delay=DEFAULT_DELAY, backoff=DEFAULT_BACKOFF, logger=None):
@@ -435,12 +435,20 @@ class SitesClient(gdata.client.GDClient):
 
   UploadAttachment = upload_attachment
 
-  def download_attachment(self, uri_or_entry, file_path):
+  def download_attachment(self, uri_or_entry, file_path, **kwargs):
     """Downloads an attachment file to disk.
 
+    The attachment is streamed to disk a chunk at a time rather than read
+    into memory first.
+
     Args:
       uri_or_entry: string The full URL to download the file from.
       file_path: string The full path to save the file to.
+      kwargs: Other parameters to pass to self.download_to(), such as
+          chunk_size, progress, and digest.
+
+    Returns:
+      The number of bytes written.
 
     Raises:
       gdata.client.RequestError: on error response from server.
@@ -449,13 +457,6 @@ class SitesClient(gdata.client.GDClient):
     if isinstance(uri_or_entry, gdata.sites.data.ContentEntry):
       uri = uri_or_entry.content.src
 
-    f = open(file_path, 'wb')
-    try:
-      f.write(self._get_file_content(uri))
-    except gdata.client.RequestError, e:
-      f.close()
-      raise e
-    f.flush()
-    f.close()
+    return self.download_to(uri, file_path, **kwargs)
 
   DownloadAttachment = download_attachment
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Keeps a local copy of a feed up to date by fetching only what changed.
+
+A FeedSync holds a mirror of the entries in a feed, keyed by their atom:id,
+and a watermark: the time at which the feed was last fetched. Each call to
+sync requests only the entries updated since the watermark (using the
+updated-min query parameter), follows every next link, and applies the
+changes to the mirror. Entries which the server reports as deleted (with a
+gd:deleted element, or as canceled events) are removed.
+
+  contacts = client.get_contacts_sync(
+      store=gdata.sync.FileStore('/var/lib/myapp/sync'))
+  result = contacts.sync()
+  for entry in result.updated:
+    ...
+  for entry_id in result.deleted:
+    ...
+
+The watermark and mirror are saved to the store after each successful sync,
+so that the next run (possibly in another process) continues from there. If
+a sync fails part way, nothing is saved and the next sync fetches the same
+changes again.
+
+gdata.contacts.client.ContactsClient.get_contacts_sync and
+gdata.docs.client.DocsClient.get_doclist_sync return FeedSyncs set up for
+those feeds. For a Google Calendar event feed, create one directly:
+
+  events = gdata.sync.FeedSync(
+      client, event_feed_url, gdata.calendar.data.CalendarEventFeed,
+      query=gdata.sync.SyncQuery(showdeleted='true'))
+
+A FileCheckpoint lets a single long read of a feed, such as listing every
+document in a large account, be resumed after it is interrupted:
+
+  for entry in client.iter_everything(
+      checkpoint=gdata.sync.FileCheckpoint('/var/lib/myapp/crawl')):
+    ...
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import copy
+import hashlib
+import os
+import tempfile
+import threading
+import atom.core
+import atom.data
+import gdata.client
+import gdata.data
+
+
+def is_deleted(entry):
+  """Returns True if the entry is a tombstone for a deleted entry.
+
+  Deleted contacts and documents contain a gd:deleted element, and deleted
+  Calendar events have a gd:eventStatus of canceled.
+  """
+  if entry.get_elements('deleted', gdata.GDATA_NAMESPACE):
+    return True
+  status = getattr(entry, 'event_status', None)
+  return status is not None and status.value == gdata.data.CANCELED_EVENT
+
+
+IsDeleted = is_deleted
+
+
+def get_entry_key(entry):
+  """Returns the atom:id of an entry, which identifies it in the mirror."""
+  if entry.id is None:
+    return None
+  return entry.id.text
+
+
+GetEntryKey = get_entry_key
+
+
+class SyncQuery(gdata.client.Query):
+  """A gdata.client.Query which adds any other URL parameters given.
+
+  Used for feeds which do not have their own Query class, to ask for
+  deleted entries to be included:
+
+    gdata.sync.SyncQuery(showdeleted='true', max_results=100)
+  """
+
+  def __init__(self, **kwargs):
+    query_args = {}
+    for name in ('text_query', 'categories', 'author', 'alt', 'updated_min',
+                 'updated_max', 'pretty_print', 'published_min',
+                 'published_max', 'start_index', 'max_results', 'strict'):
+      if name in kwargs:
+        query_args[name] = kwargs.pop(name)
+    gdata.client.Query.__init__(self, **query_args)
+    self.params = kwargs
+
+  def modify_request(self, http_request):
+    for name, value in self.params.iteritems():
+      gdata.client._add_query_param(name, value, http_request)
+    gdata.client.Query.modify_request(self, http_request)
+
+  ModifyRequest = modify_request
+
+
+class SyncState(object):
+  """The watermark and the mirrored entries of one feed.
+
+  Attributes:
+    watermark: str The RFC 3339 time of the last sync, or None if the feed
+               has never been fetched.
+    entries: dict Maps each entry's key to the entry.
+  """
+
+  def __init__(self, watermark=None, entries=None):
+    self.watermark = watermark
+    self.entries = entries or {}
+
+
+class SyncResult(object):
+  """The changes found by one sync.
+
+  Attributes:
+    updated: list The entries which were added or changed.
+    deleted: list The keys of the entries which were removed.
+    full: bool True if the whole feed was fetched, because it had not been
+          synced before or the server could no longer list the changes.
+  """
+
+  def __init__(self, full=False):
+    self.updated = []
+    self.deleted = []
+    self.full = full
+
+
+class MemoryStore(object):
+  """Keeps SyncStates for the life of the process."""
+
+  def __init__(self):
+    self._states = {}
+
+  def load(self, feed_uri, desired_class, get_key=None):
+    return self._states.get(feed_uri)
+
+  def save(self, feed_uri, state):
+    self._states[feed_uri] = state
+
+
+class FileStore(object):
+  """Saves each feed's SyncState as an Atom feed document in a directory.
+
+  The feed's updated element holds the watermark. Files are written to a
+  temporary name and renamed, so a sync which is interrupted while saving
+  leaves the previous state in place.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  def load(self, feed_uri, desired_class, get_key=get_entry_key):
+    try:
+      state_file = open(self._get_path(feed_uri), 'rb')
+    except EnvironmentError:
+      return None
+    try:
+      feed = atom.core.parse(state_file, desired_class)
+    finally:
+      state_file.close()
+    if feed.id is None or feed.id.text != feed_uri:
+      # Another feed URI with the same hash.
+      return None
+    state = SyncState(feed.updated is not None and feed.updated.text or None)
+    for entry in feed.entry:
+      state.entries[get_key(entry)] = entry
+    return state
+
+  def save(self, feed_uri, state):
+    feed = atom.data.Feed(id=atom.data.Id(text=feed_uri))
+    if state.watermark:
+      feed.updated = atom.data.Updated(text=state.watermark)
+    feed.entry = state.entries.values()
+    handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    state_file = os.fdopen(handle, 'wb')
+    try:
+      for chunk in atom.core.XmlWriter(feed):
+        state_file.write(chunk)
+    finally:
+      state_file.close()
+    os.rename(temp_path, self._get_path(feed_uri))
+
+  def _get_path(self, feed_uri):
+    return os.path.join(self.directory,
+                        hashlib.sha1(feed_uri).hexdigest() + '.xml')
+
+
+class FileCheckpoint(object):
+  """Remembers in a file how far a long read of a feed has got.
+
+  Pass one to gdata.client.GDClient.iter_entries (or the streaming methods
+  built on it) to have the URL of the next unread page saved after each
+  page. If the process stops, the next run with the same file starts from
+  that page instead of the beginning of the feed.
+  """
+
+  def __init__(self, path):
+    self.path = path
+
+  def load(self):
+    """Returns the saved URL, or None if there is no unfinished read."""
+    try:
+      checkpoint_file = open(self.path, 'rb')
+    except EnvironmentError:
+      return None
+    try:
+      return checkpoint_file.read().strip() or None
+    finally:
+      checkpoint_file.close()
+
+  Load = load
+
+  def save(self, uri):
+    handle, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+    checkpoint_file = os.fdopen(handle, 'wb')
+    try:
+      checkpoint_file.write(str(uri))
+    finally:
+      checkpoint_file.close()
+    os.rename(temp_path, self.path)
+
+  Save = save
+
+  def clear(self):
+    try:
+      os.remove(self.path)
+    except EnvironmentError:
+      pass
+
+  Clear = clear
+
+
+class FeedSync(object):
+  """Mirrors one feed, fetching only the entries changed since the last sync.
+  """
+
+  def __init__(self, client, feed_uri, desired_class=gdata.data.GDFeed,
+               query=None, store=None, is_deleted=is_deleted,
+               get_key=get_entry_key):
+    """Creates a FeedSync. The saved state, if any, is loaded on first use.
+
+    Args:
+      client: gdata.client.GDClient The client used to fetch the feed.
+      feed_uri: str The URL of the feed.
+      desired_class: The class of the feed, such as
+                     gdata.contacts.data.ContactsFeed.
+      query: gdata.client.Query (optional) Extra parameters for each
+             request, usually to ask for deleted entries to be included.
+             Its updated_min is set to the watermark for each sync.
+      store: (optional) Where the state is kept between syncs, a FileStore
+             or MemoryStore. Defaults to a new MemoryStore.
+      is_deleted: function (optional) Returns True for deleted entries.
+      get_key: function (optional) Returns the key for an entry. Defaults
+               to its atom:id.
+    """
+    self.client = client
+    self.feed_uri = str(feed_uri)
+    self.desired_class = desired_class
+    self.query = query
+    self.store = store or MemoryStore()
+    self.is_deleted = is_deleted
+    self.get_key = get_key
+    self._state = None
+    self._lock = threading.Lock()
+
+  def get_state(self):
+    """Returns the SyncState, loading it from the store if necessary."""
+    if self._state is None:
+      state = self.store.load(self.feed_uri, self.desired_class,
+                              self.get_key)
+      self._state = state or SyncState()
+    return self._state
+
+  GetState = get_state
+
+  def get_watermark(self):
+    return self.get_state().watermark
+
+  GetWatermark = get_watermark
+
+  def get_entries(self):
+    """Returns the mirrored entries as a dict keyed by atom:id."""
+    return self.get_state().entries
+
+  GetEntries = get_entries
+
+  def sync(self, auth_token=None, **kwargs):
+    """Fetches the changes since the last sync and applies them.
+
+    Only one sync runs at a time for each FeedSync.
+
+    Args:
+      auth_token: (optional) The token which authorizes the requests.
+      kwargs: Other parameters to pass to the client's get_feed. Those
+              which modify the request are only used for the first page.
+
+    Returns:
+      A SyncResult listing the changes.
+    """
+    self._lock.acquire()
+    try:
+      state = self.get_state()
+      if state.watermark is None:
+        return self._sync(state, None, auth_token, kwargs)
+      try:
+        return self._sync(state, state.watermark, auth_token, kwargs)
+      except gdata.client.RequestError, error:
+        # With requirealldeleted, Google Contacts replies 410 Gone when it
+        # no longer has the tombstones for all deletions since updated-min.
+        if error.status != 410:
+          raise
+        return self._sync(state, None, auth_token, kwargs)
+    finally:
+      self._lock.release()
+
+  Sync = sync
+
+  def _sync(self, state, updated_min, auth_token, kwargs):
+    result = SyncResult(full=updated_min is None)
+    entries = state.entries.copy()
+    seen = set()
+    latest = None
+    query = None
+    if self.query is not None:
+      query = copy.copy(self.query)
+      query.updated_min = updated_min
+    elif updated_min is not None:
+      query = gdata.client.Query(updated_min=updated_min)
+    feed = self.client.get_feed(self.feed_uri, auth_token=auth_token,
+                                desired_class=self.desired_class,
+                                query=query, **kwargs)
+    # Arguments which modify the request are only used for the first page,
+    # since the next links already carry its parameters.
+    page_kwargs = {}
+    for name, value in kwargs.iteritems():
+      if not hasattr(value, 'modify_request'):
+        page_kwargs[name] = value
+    # The server's time when the first page was made. Changes made while the
+    # later pages are fetched are fetched again next time, which is harmless.
+    watermark = feed.updated is not None and feed.updated.text or None
+    while True:
+      for entry in feed.entry:
+        key = self.get_key(entry)
+        if key is None:
+          continue
+        if self.is_deleted(entry):
+          if entries.pop(key, None) is not None:
+            result.deleted.append(key)
+        else:
+          entries[key] = entry
+          seen.add(key)
+          result.updated.append(entry)
+        if (entry.updated is not None and entry.updated.text
+            and (latest is None or entry.updated.text > latest)):
+          latest = entry.updated.text
+      next_link = feed.find_next_link()
+      if next_link is None:
+        break
+      feed = self.client.get_feed(next_link, auth_token=auth_token,
+                                  desired_class=self.desired_class,
+                                  **page_kwargs)
+    if result.full:
+      # Entries which were not listed at all have been deleted.
+      for key in entries.keys():
+        if key not in seen:
+          del entries[key]
+          result.deleted.append(key)
+    # Without a feed time, the latest entry time is used instead.
+    new_state = SyncState(watermark or latest or state.watermark, entries)
+    self.store.save(self.feed_uri, new_state)
+    self._state = new_state
+    return result
@@ -26,9 +26,13 @@ import unittest
 import atom_tests.core_test
 import atom_tests.data_test
 import atom_tests.http_core_test
+import atom_tests.executor_test
+import atom_tests.aio_test
+import atom_tests.observer_test
 import atom_tests.auth_test
 import atom_tests.mock_http_core_test
 import atom_tests.client_test
+import gdata_tests.cache_test
 import gdata_tests.client_test
 import gdata_tests.core_test
 import gdata_tests.data_test
@@ -36,6 +40,9 @@ import gdata_tests.data_smoke_test
 import gdata_tests.client_smoke_test
 import gdata_tests.live_client_test
 import gdata_tests.gauth_test
+import gdata_tests.ratelimit_test
+import gdata_tests.retry_test
+import gdata_tests.sync_test
 import gdata_tests.blogger.data_test
 import gdata_tests.blogger.live_client_test
 import gdata_tests.maps.data_test
@@ -60,9 +67,13 @@ def suite():
       atom_tests.core_test.suite(),
       atom_tests.data_test.suite(),
       atom_tests.http_core_test.suite(),
+      atom_tests.executor_test.suite(),
+      atom_tests.aio_test.suite(),
+      atom_tests.observer_test.suite(),
       atom_tests.auth_test.suite(),
       atom_tests.mock_http_core_test.suite(),
       atom_tests.client_test.suite(),
+      gdata_tests.cache_test.suite(),
       gdata_tests.client_test.suite(),
       gdata_tests.core_test.suite(),
       gdata_tests.data_test.suite(),
@@ -70,6 +81,9 @@ def suite():
       gdata_tests.client_smoke_test.suite(),
       gdata_tests.live_client_test.suite(),
       gdata_tests.gauth_test.suite(),
+      gdata_tests.ratelimit_test.suite(),
+      gdata_tests.retry_test.suite(),
+      gdata_tests.sync_test.suite(),
       gdata_tests.blogger.data_test.suite(),
       gdata_tests.blogger.live_client_test.suite(),
       gdata_tests.maps.data_test.suite(),
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import unittest
+import BaseHTTPServer
+import SocketServer
+import threading
+import time
+import zlib
+import atom.aio
+import atom.executor
+import atom.http_core
+import gdata.cache
+import gdata.client
+import gdata.data
+import gdata.ratelimit
+import gdata.retry
+
+
+FEED = ('<feed xmlns="http://www.w3.org/2005/Atom"><id>%s</id>'
+        '<entry><id>e</id></entry></feed>')
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def setup(self):
+    BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+    self.server.count_connection()
+
+  def do_GET(self):
+    if self.path.startswith('/feeds/'):
+      self.respond(FEED % self.path, 'application/atom+xml')
+    elif self.path == '/cached':
+      if self.headers.get('If-None-Match') == 'W/"1"':
+        self.send_response(304)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+      else:
+        self.send_response(200)
+        body = FEED % 'cached'
+        self.send_header('ETag', 'W/"1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    elif self.path == '/missing':
+      self.respond('Not here', status=404)
+    elif self.path.startswith('/moved') and 'gsessionid' not in self.path:
+      self.send_response(302)
+      self.send_header('location', 'http://example.com/x?gsessionid=abc')
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+    elif self.path.startswith('/moved') and 'gsessionid=abc' in self.path:
+      self.respond(FEED % 'moved', 'application/atom+xml')
+    elif self.path == '/chunked':
+      self.send_response(200)
+      self.send_header('Transfer-Encoding', 'chunked')
+      self.end_headers()
+      for chunk in ('first ', 'second ', 'third'):
+        self.wfile.write('%x\r\n%s\r\n' % (len(chunk), chunk))
+      self.wfile.write('0\r\n\r\n')
+    elif self.path == '/until-close':
+      self.wfile.write('HTTP/1.0 200 OK\r\nX-Test: yes\r\n\r\nall of it')
+      self.close_connection = 1
+    elif self.path == '/gzip':
+      compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+      body = compressor.compress('hello ' * 1000) + compressor.flush()
+      self.send_response(200)
+      self.send_header('Content-Encoding', 'gzip')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    elif self.path == '/slow':
+      time.sleep(1)
+      self.respond('slow')
+    else:
+      self.respond('hello %s' % self.path)
+      if self.path == '/drop':
+        self.close_connection = 1
+
+  def do_POST(self):
+    if self.headers.get('Transfer-Encoding') == 'chunked':
+      body = []
+      while True:
+        size = int(self.rfile.readline(), 16)
+        body.append(self.rfile.read(size))
+        self.rfile.readline()
+        if not size:
+          break
+      body = ''.join(body)
+    else:
+      body = self.rfile.read(int(self.headers['Content-Length']))
+    self.respond(body, self.headers.get('Content-Type', 'text/plain'),
+                 status=201)
+
+  def respond(self, body, content_type='text/plain', status=200):
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+  def __init__(self):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+    self.connections = 0
+    self.lock = threading.Lock()
+
+  def count_connection(self):
+    self.lock.acquire()
+    self.connections += 1
+    self.lock.release()
+
+  def handle_error(self, request, client_address):
+    pass
+
+
+class AsyncTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.server = Server()
+    self.thread = threading.Thread(target=self.server.serve_forever,
+                                   args=(0.05,))
+    self.thread.setDaemon(True)
+    self.thread.start()
+    self.url = 'http://127.0.0.1:%i' % self.server.server_address[1]
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class AsyncHttpClientTest(AsyncTestCase):
+
+  def setUp(self):
+    AsyncTestCase.setUp(self)
+    self.client = atom.aio.AsyncHttpClient(max_per_host=4)
+
+  def tearDown(self):
+    self.client.close()
+    AsyncTestCase.tearDown(self)
+
+  def get(self, path):
+    return self.client.request(
+        atom.http_core.HttpRequest(self.url + path, 'GET'))
+
+  def test_many_requests(self):
+    futures = [self.get('/%i' % i) for i in range(50)]
+    self.assert_(not futures[0].done())
+    self.client.run()
+    for i, future in enumerate(futures):
+      response = future.result()
+      self.assertEqual(response.status, 200)
+      self.assertEqual(response.getheader('content-type'), 'text/plain')
+      self.assertEqual(response.read(), 'hello /%i' % i)
+    self.assert_(self.server.connections <= 4)
+
+  def test_response_framing(self):
+    chunked = self.get('/chunked')
+    until_close = self.get('/until-close')
+    self.client.run([chunked, until_close])
+    self.assertEqual(chunked.result().read(), 'first second third')
+    self.assertEqual(until_close.result().read(), 'all of it')
+    self.assertEqual(until_close.result().getheader('X-Test'), 'yes')
+
+  def test_post(self):
+    request = atom.http_core.HttpRequest(self.url + '/', 'POST')
+    request.add_body_part('<entry/>', 'application/atom+xml')
+    def generate():
+      for i in range(100):
+        yield '%i,' % i
+    chunked = atom.http_core.HttpRequest(self.url + '/', 'POST')
+    chunked.add_body_part(generate(), 'text/csv')
+    futures = [self.client.request(request), self.client.request(chunked)]
+    self.client.run()
+    self.assertEqual(futures[0].result().status, 201)
+    self.assertEqual(futures[0].result().read(), '<entry/>')
+    self.assertEqual(futures[1].result().read(),
+                     ''.join(['%i,' % i for i in range(100)]))
+
+  def test_connection_reuse_and_stale_connection(self):
+    first = self.get('/drop')
+    self.client.run()
+    self.assertEqual(first.result().read(), 'hello /drop')
+    # Give the server time to close its end of the connection.
+    time.sleep(0.05)
+    second = self.get('/again')
+    self.client.run()
+    third = self.get('/third')
+    self.client.run()
+    self.assertEqual(second.result().read(), 'hello /again')
+    self.assertEqual(third.result().read(), 'hello /third')
+    self.assertEqual(self.server.connections, 2)
+
+  def test_timeout(self):
+    self.client.timeout = 0.2
+    slow = self.get('/slow')
+    fast = self.get('/fast')
+    self.client.run()
+    self.assertRaises(atom.aio.Timeout, slow.result)
+    self.assertEqual(fast.result().read(), 'hello /fast')
+
+  def test_connection_refused(self):
+    self.server.server_close()
+    future = self.get('/refused')
+    self.client.run()
+    self.assertRaises(Exception, future.result)
+
+  def test_compressed_response(self):
+    self.client.compress_responses = True
+    future = self.get('/gzip')
+    self.client.run()
+    self.assertEqual(future.result().read(), 'hello ' * 1000)
+    self.assertEqual(self.client.transfer_stats.decoded_bytes, 6000)
+
+
+class AsyncGDClientTest(AsyncTestCase):
+
+  def setUp(self):
+    AsyncTestCase.setUp(self)
+    self.client = gdata.client.AsyncGDClient()
+    self.client.api_version = '2'
+
+  def tearDown(self):
+    self.client.http_client.close()
+    AsyncTestCase.tearDown(self)
+
+  def test_get_feeds(self):
+    futures = [self.client.get_feed(self.url + '/feeds/%i' % i)
+               for i in range(20)]
+    missing = self.client.get_feed(self.url + '/missing')
+    self.client.run()
+    for i, future in enumerate(futures):
+      feed = future.result()
+      self.assert_(isinstance(feed, gdata.data.GDFeed))
+      self.assertEqual(feed.id.text, '/feeds/%i' % i)
+      self.assertEqual(feed.entry[0].id.text, 'e')
+    self.assertRaises(gdata.client.RequestError, missing.result)
+    self.assertEqual(missing.exception().status, 404)
+
+  def test_query_and_redirect(self):
+    query = gdata.client.Query(max_results=5)
+    future = self.client.get_feed(self.url + '/moved', query=query)
+    self.client.run([future])
+    # The redirect was followed with the gsessionid from the Location, and
+    # the query was applied to both requests.
+    self.assertEqual(future.result().id.text, 'moved')
+
+  def test_post(self):
+    entry = gdata.data.GDEntry(id=atom.data.Id(text='posted'))
+    future = self.client.post(entry, self.url + '/')
+    self.client.run()
+    self.assert_(isinstance(future.result(), gdata.data.GDEntry))
+    self.assertEqual(future.result().id.text, 'posted')
+
+  def test_response_cache(self):
+    self.client.response_cache = gdata.cache.ResponseCache()
+    first = self.client.get_feed(self.url + '/cached')
+    self.client.run([first])
+    self.assertEqual(first.result().id.text, 'cached')
+    second = self.client.get_feed(self.url + '/cached')
+    self.client.run([second])
+    # The server replied 304, so the cached feed is used.
+    self.assert_(second.result() is first.result())
+
+  def test_waiting_members_are_rejected(self):
+    self.client.retry_policy = gdata.retry.RetryPolicy()
+    self.assertRaises(gdata.client.Error, self.client.get_feed,
+                      self.url + '/feeds/a')
+    self.client.retry_policy = None
+    self.client.rate_limiter = gdata.ratelimit.RateLimiter()
+    self.assertRaises(gdata.client.Error, self.client.get_feed,
+                      self.url + '/feeds/a')
+
+  def test_map_requests(self):
+    uris = [self.url + '/feeds/a', self.url + '/missing',
+            self.url + '/feeds/b']
+    results = list(self.client.map_requests(uris))
+    self.assertEqual(results[0].id.text, '/feeds/a')
+    self.assert_(isinstance(results[1], gdata.client.RequestError))
+    self.assertEqual(results[2].id.text, '/feeds/b')
+
+
+def suite():
+  return unittest.TestSuite((
+      unittest.makeSuite(AsyncHttpClientTest, 'test'),
+      unittest.makeSuite(AsyncGDClientTest, 'test')))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,6 +22,10 @@ __author__ = 'j.s@google.com (Jeff Scudder)'
 
 
 import unittest
+import StringIO
+import gc
+import os
+import warnings
 try:
   from xml.etree import cElementTree as ElementTree
 except ImportError:
@@ -138,6 +142,23 @@ class XmlElementTest(unittest.TestCase):
     self.assert_(rules2[2]['tag'] == 'tag')
     self.assert_(rules2[2]['{http://new_ns}attr'] == 'versioned_attr')
     
+  def testGetPlan(self):
+    plan1 = atom.core._get_plan(Example, 1)
+    self.assert_(plan1 is atom.core._get_plan(Example, 1))
+    self.assertEqual(plan1.qname, '{http://example.com}foo')
+    self.assertEqual(sorted(plan1.child_handlers.keys()),
+                     ['foo', '{http://example.com/1}child'])
+    self.assertEqual(plan1.attribute_members,
+                     {'tag': 'tag', 'attr': 'versioned_attr'})
+    self.assertEqual(sorted(plan1.members),
+        [('child', False), ('foos', True), ('tag', False),
+         ('versioned_attr', False)])
+    plan2 = atom.core._get_plan(Example, 2)
+    self.assert_(plan1 is not plan2)
+    self.assert_('{http://example.com/2}child' in plan2.child_handlers)
+    self.assert_(('{http://new_ns}attr', 'http://new_ns', 'attr',
+                  'versioned_attr') in plan2.attributes)
+    
   def testGetElements(self):
     e = Example()
     e.child = Child()
@@ -437,9 +458,410 @@ class CharacterEncodingTest(unittest.TestCase):
     self.assert_(x.to_string(encoding='UTF-16').startswith('<x a="&#948;"'))
 
 
+class LazyParseTest(unittest.TestCase):
+
+  def testMembersConvertedOnAccess(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer, lazy=True)
+    self.assert_(isinstance(outer, Outer))
+    self.assert_('innards' not in outer.__dict__)
+    self.assert_('_other_elements' not in outer.__dict__)
+    self.assertEqual(len(outer.innards), 3)
+    self.assert_('innards' in outer.__dict__)
+    self.assert_(isinstance(outer.innards[0], Inner))
+    # Children are also parsed lazily.
+    self.assert_('_other_elements' not in outer.innards[2].__dict__)
+    self.assertEqual(outer.innards[0].my_x, '123')
+    self.assertEqual(len(outer.innards[2].get_elements('nested')), 2)
+    self.assertEqual(outer.get_elements('other')[0].get_attributes(
+        'z', 'http://example.com/xml/2')[0].value, 'true')
+
+  def testToStringMatchesEagerParse(self):
+    eager = atom.core.parse(SAMPLE_XML, Outer)
+    lazy = atom.core.parse(SAMPLE_XML, Outer, lazy=True)
+    self.assertEqual(lazy.to_string(), eager.to_string())
+    lazy = atom.core.parse(SAMPLE_XML, lazy=True)
+    self.assertEqual(lazy.to_string(),
+                     atom.core.parse(SAMPLE_XML).to_string())
+
+  def testSetBeforeAccess(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer, lazy=True)
+    outer.innards = []
+    self.assertEqual(outer.innards, [])
+    self.assertEqual(len(ElementTree.fromstring(outer.to_string())), 1)
+
+  def testClassMembersUnchanged(self):
+    lazy_class = type(atom.core.parse(SAMPLE_XML, Outer, lazy=True))
+    self.assertEqual(lazy_class.__name__, 'Outer')
+    self.assertEqual(lazy_class.innards, [Inner])
+    self.assertEqual(lazy_class._get_rules(1), Outer._get_rules(1))
+    self.assert_(atom.core._get_lazy_class(lazy_class) is lazy_class)
+    # The lazy class may also be used in a normal parse.
+    outer = atom.core.parse(SAMPLE_XML, lazy_class)
+    self.assertEqual(len(outer.innards), 3)
+
+
+class CompactParseTest(unittest.TestCase):
+
+  def testToStringMatchesEagerParse(self):
+    eager = atom.core.parse(SAMPLE_XML, Outer)
+    compact = atom.core.parse(SAMPLE_XML, Outer, compact=True)
+    self.assertEqual(compact.to_string(), eager.to_string())
+    compact = atom.core.parse(SAMPLE_XML, compact=True)
+    self.assertEqual(compact.to_string(),
+                     atom.core.parse(SAMPLE_XML).to_string())
+
+  def testMembersUseSlots(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer, compact=True)
+    self.assert_(isinstance(outer, Outer))
+    # No instance dictionary is allocated for a compact element.
+    self.assert_(not [ref for ref in gc.get_referents(outer)
+                      if isinstance(ref, dict)])
+    # Children are also compact.
+    self.assert_(type(outer.innards[0]) is atom.core._get_compact_class(Inner))
+    self.assert_(isinstance(outer.innards[0], Inner))
+    self.assertEqual(outer.innards[0].my_x, '123')
+    self.assertEqual(len(outer.innards[2].get_elements('nested')), 2)
+
+  def testExtensionsAttachOnChange(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer, compact=True)
+    inner = outer.innards[0]
+    self.assertEqual(inner.extension_elements, [])
+    inner.extension_elements.append(Inner(my_x='1'))
+    inner.extension_attributes['extra'] = 'yes'
+    self.assertEqual(len(inner.extension_elements), 1)
+    tree = ElementTree.fromstring(inner.to_string())
+    self.assertEqual(tree.get('extra'), 'yes')
+    self.assertEqual(len(tree), 1)
+
+  def testLazyAndCompactConflict(self):
+    self.assertRaises(ValueError, atom.core.parse, SAMPLE_XML, Outer,
+                      lazy=True, compact=True)
+
+
+class CountingStream(object):
+  """A file-like object which records the size of each read."""
+
+  def __init__(self, data):
+    self.data = StringIO.StringIO(data)
+    self.reads = []
+
+  def read(self, amt):
+    self.reads.append(amt)
+    return self.data.read(amt)
+
+
+class StreamParseTest(unittest.TestCase):
+
+  def testParseFileLike(self):
+    stream = CountingStream(SAMPLE_XML)
+    outer = atom.core.parse(stream, Outer)
+    self.assertEqual(outer.to_string(),
+                     atom.core.parse(SAMPLE_XML, Outer).to_string())
+    self.assertEqual(stream.reads, [atom.core.STREAM_READ_SIZE] * 2)
+
+  def testParseInBlocks(self):
+    old_size = atom.core.STREAM_READ_SIZE
+    atom.core.STREAM_READ_SIZE = 7
+    try:
+      stream = CountingStream(SAMPLE_XML)
+      outer = atom.core.parse(stream, Outer, fields='innards')
+    finally:
+      atom.core.STREAM_READ_SIZE = old_size
+    # One read for each block of 7 bytes, then one which finds the end.
+    self.assertEqual(len(stream.reads), (len(SAMPLE_XML) + 6) / 7 + 1)
+    self.assertEqual(len(outer.innards), 3)
+    self.assertEqual(outer.innards[1].my_x, '234')
+
+
+class XmlBackendTest(unittest.TestCase):
+
+  def setUp(self):
+    self.original = atom.core.get_xml_backend()
+
+  def tearDown(self):
+    atom.core._xml_backend = self.original
+
+  def testSelectBackend(self):
+    atom.core.set_xml_backend('expat')
+    self.assertEqual(atom.core.get_xml_backend().name, 'expat')
+    atom.core.set_xml_backend('etree')
+    self.assertEqual(atom.core.get_xml_backend().name, 'etree')
+    self.assertRaises(ValueError, atom.core.set_xml_backend, 'sax')
+    try:
+      atom.core.set_xml_backend('lxml')
+      self.assertEqual(atom.core.get_xml_backend().name, 'lxml')
+    except ImportError:
+      # lxml is not installed.
+      pass
+
+  def testBackendFromEnvironment(self):
+    original = os.environ.get(atom.core.XML_BACKEND_ENV)
+    try:
+      os.environ[atom.core.XML_BACKEND_ENV] = 'expat'
+      atom.core._set_default_xml_backend()
+      self.assertEqual(atom.core.get_xml_backend().name, 'expat')
+      os.environ[atom.core.XML_BACKEND_ENV] = 'sax'
+      caught = warnings.catch_warnings(record=True)
+      warned = caught.__enter__()
+      try:
+        warnings.simplefilter('always')
+        atom.core._set_default_xml_backend()
+      finally:
+        caught.__exit__()
+      self.assertEqual(atom.core.get_xml_backend().name, 'etree')
+      self.assertEqual(len(warned), 1)
+      self.assert_(issubclass(warned[0].category, RuntimeWarning))
+    finally:
+      if original is None:
+        del os.environ[atom.core.XML_BACKEND_ENV]
+      else:
+        os.environ[atom.core.XML_BACKEND_ENV] = original
+
+  def testRegisterBackend(self):
+    parsed = []
+
+    class RecordingBackend(atom.core.ElementTreeBackend):
+      name = 'recording'
+
+      def fromstring(self, xml_string):
+        parsed.append(xml_string)
+        return atom.core.ElementTreeBackend.fromstring(self, xml_string)
+
+    atom.core.register_xml_backend('recording', RecordingBackend)
+    try:
+      atom.core.set_xml_backend('recording')
+      outer = atom.core.parse(SAMPLE_XML, Outer)
+    finally:
+      del atom.core._xml_backends['recording']
+    self.assertEqual(parsed, [SAMPLE_XML])
+    self.assertEqual(len(outer.innards), 3)
+
+  def testExpatMatchesElementTree(self):
+    options = [{}, {'compact': True}, {'fields': 'innards(my_x)'},
+               {'lazy': True}]
+    xml = SAMPLE_XML.replace('Some Test', 'Some <!-- note --> Test')
+    for parse_options in options:
+      atom.core.set_xml_backend('etree')
+      expected = atom.core.parse(xml, Outer, **parse_options)
+      atom.core.set_xml_backend('expat')
+      outer = atom.core.parse(xml, Outer, **parse_options)
+      self.assertEqual(type(outer), type(expected))
+      self.assertEqual(outer.to_string(), expected.to_string())
+    atom.core.set_xml_backend('expat')
+    outer = atom.core.parse(StringIO.StringIO(SAMPLE_XML), Outer)
+    self.assertEqual(outer.innards[2].get_elements('nested')[0].text,
+                     'Some Test')
+    self.assertEqual(outer.innards[1].extension_attributes['y'], 'abc')
+    self.assert_(atom.core.parse(SAMPLE_XML, Inner) is None)
+    self.assertEqual(atom.core.parse(u'<a>caf\xe9</a>').text, u'caf\xe9')
+    self.assertRaises(SyntaxError, atom.core.parse, '<outer>', Outer)
+
+
+class ElementIndexTest(unittest.TestCase):
+
+  def testIndexFollowsChanges(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer)
+    nested = outer.innards[2]
+    self.assert_(isinstance(nested._other_elements, atom.core._ElementList))
+    two = nested.get_elements('nested', 'http://example.com/xml/2')
+    self.assertEqual(len(two), 1)
+    self.assertEqual(two[0].text, 'Some Test')
+    added = atom.core.XmlElement(text='Added')
+    added._qname = '{http://example.com/xml/2}nested'
+    nested._other_elements.append(added)
+    self.assertEqual(nested.get_elements('nested', 'http://example.com/xml/2'),
+                     [two[0], added])
+    nested._other_elements.insert(0, added)
+    del nested._other_elements[-1]
+    self.assertEqual(nested.get_elements('nested', 'http://example.com/xml/2'),
+                     [added, two[0]])
+    nested._other_elements.remove(two[0])
+    self.assertEqual(nested.get_elements('nested', 'http://example.com/xml/2'),
+                     [added])
+    # Elements whose qname has changed are not returned.
+    added.namespace = 'http://example.com/xml/3'
+    self.assertEqual(nested.get_elements('nested', 'http://example.com/xml/2'),
+                     [])
+    # A plain list may also be used.
+    nested.extension_elements = [two[0]]
+    self.assertEqual(nested.get_elements('nested', 'http://example.com/xml/2'),
+                     [two[0]])
+
+  def testMembersAndOtherElements(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer)
+    extra = Inner(my_x='999')
+    outer.extension_elements.append(extra)
+    found = outer.get_elements('inner', 'http://example.com/xml/1')
+    self.assertEqual(found, outer.innards + [extra])
+    self.assertEqual(outer.get_elements('other', 'http://example.com/xml/1'),
+                     outer.get_elements('other'))
+
+  def testCompactAndLazy(self):
+    for options in ({'compact': True}, {'lazy': True}):
+      outer = atom.core.parse(SAMPLE_XML, Outer, **options)
+      self.assertEqual(len(outer.get_elements(
+          'other', 'http://example.com/xml/1')), 1)
+      inner = outer.innards[0]
+      self.assertEqual(inner.get_elements('x', 'http://example.com/xml/1'),
+                       [])
+      added = atom.core.XmlElement()
+      added._qname = '{http://example.com/xml/1}x'
+      inner.extension_elements.append(added)
+      self.assertEqual(inner.get_elements('x', 'http://example.com/xml/1'),
+                       [added])
+
+
+class FieldsTest(unittest.TestCase):
+
+  def testParseFields(self):
+    self.assertEqual(atom.core._parse_fields('id, entry(id,title(x)),link'),
+                     {'id': None, 'link': None,
+                      'entry': {'id': None, 'title': {'x': None}}})
+    self.assertEqual(atom.core._parse_fields(('id', 'entry(id)')),
+                     {'id': None, 'entry': {'id': None}})
+    self.assertRaises(ValueError, atom.core._parse_fields, 'entry(id')
+    self.assertRaises(ValueError, atom.core._parse_fields, 'id)')
+    self.assertRaises(ValueError, atom.core._parse_fields, '(id)')
+
+  def testOnlyFieldsAreConverted(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer, fields=())
+    self.assertEqual(outer.innards, [])
+    self.assertEqual(outer.extension_elements, [])
+    outer = atom.core.parse(SAMPLE_XML, Outer, fields=('innards',))
+    self.assertEqual(len(outer.innards), 3)
+    # Unknown elements are skipped but the children of a member are kept.
+    self.assertEqual(outer.extension_elements, [])
+    self.assertEqual(len(outer.innards[2].extension_elements), 2)
+    self.assertEqual(outer.innards[1].my_x, '234')
+    self.assertEqual(outer.innards[1].extension_attributes['y'], 'abc')
+
+  def testNestedFields(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer, fields='innards(my_x)')
+    self.assertEqual(len(outer.innards), 3)
+    self.assertEqual(outer.innards[0].my_x, '123')
+    self.assertEqual(outer.innards[2].extension_elements, [])
+    outer = atom.core.parse(SAMPLE_XML, Outer, fields='innards(my_x)',
+                            compact=True)
+    self.assertEqual(outer.innards[2].extension_elements, [])
+    self.assert_(isinstance(outer.innards[0], Inner))
+
+  def testUnknownField(self):
+    self.assertRaises(ValueError, atom.core.parse, SAMPLE_XML, Outer,
+                      fields='outards')
+    self.assertRaises(ValueError, atom.core.parse, SAMPLE_XML, Outer,
+                      fields='innards(nested)')
+    self.assertRaises(ValueError, atom.core.parse, SAMPLE_XML, Outer,
+                      fields='innards', lazy=True)
+
+
+class XmlWriterTest(unittest.TestCase):
+
+  def testMatchesElementTree(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer)
+    outer.extension_attributes['{http://example.com/xml/3}a'] = u'\xe9"\n'
+    outer.innards[0].text = 'Fish & <chips>'
+    for version in (1, 2):
+      expected = ElementTree.tostring(outer._to_tree(version))
+      writer = atom.core.XmlWriter(outer, version)
+      self.assertEqual(writer.to_string(), expected)
+      self.assertEqual(outer.to_string(version), expected)
+      self.assertEqual(''.join(writer), expected)
+      self.assertEqual(len(writer), len(expected))
+      stream = StringIO.StringIO()
+      writer.write_to(stream)
+      self.assertEqual(stream.getvalue(), expected)
+
+  def testChunks(self):
+    outer = atom.core.parse(SAMPLE_XML, Outer)
+    chunks = list(atom.core.XmlWriter(outer))
+    # The root start tag, each of the four children and the end tag.
+    self.assertEqual(len(chunks), 6)
+    self.assert_(chunks[0].startswith('<ns0:outer xmlns:ns0='))
+    self.assertEqual(chunks[1], '<ns0:inner x="123" />')
+    self.assertEqual(chunks[5], '</ns0:outer>')
+
+  def testElementWithoutQname(self):
+    element = atom.core.XmlElement(text='a < b')
+    self.assertEqual(element.to_string(), 'a &lt; b')
+    self.assertEqual(list(atom.core.XmlWriter(element)), ['a &lt; b'])
+    outer = Outer()
+    outer.extension_elements.append(element)
+    self.assertEqual(len(ElementTree.fromstring(outer.to_string())), 0)
+
+  def testUnserializableValue(self):
+    inner = Inner(my_x=5)
+    self.assertRaises(TypeError, inner.to_string)
+
+
+class TestEntry(atom.core.XmlElement):
+  _qname = '{http://example.com/feed}entry'
+  inner = Inner
+
+
+class TestTitle(atom.core.XmlElement):
+  _qname = '{http://example.com/feed}title'
+
+
+class TestFeed(atom.core.XmlElement):
+  _qname = '{http://example.com/feed}feed'
+  entry = [TestEntry]
+  title = TestTitle
+  version_attr = 'version'
+
+
+FEED_XML = ('<feed xmlns="http://example.com/feed" version="4">'
+              '<title>before</title>'
+              '<entry><inner xmlns="http://example.com/xml/1" x="1"/></entry>'
+              '<entry><inner xmlns="http://example.com/xml/1" x="2"/></entry>'
+              '<after>extension</after>'
+              '<entry><inner xmlns="http://example.com/xml/1" x="3"/></entry>'
+            '</feed>')
+
+
+class IterEntriesTest(unittest.TestCase):
+
+  def testYieldsTypedEntries(self):
+    entries = list(atom.core.iter_entries(FEED_XML, TestFeed))
+    self.assertEqual(len(entries), 3)
+    for entry in entries:
+      self.assert_(isinstance(entry, TestEntry))
+    self.assertEqual([e.inner.my_x for e in entries], ['1', '2', '3'])
+
+  def testFeedMetadataAvailable(self):
+    iterator = atom.core.iter_entries(StringIO.StringIO(FEED_XML), TestFeed)
+    first = iterator.next()
+    self.assertEqual(first.inner.my_x, '1')
+    # Members before the first entry are ready along with the first entry.
+    self.assert_(isinstance(iterator.feed, TestFeed))
+    self.assertEqual(iterator.feed.title.text, 'before')
+    self.assertEqual(iterator.feed.version_attr, '4')
+    self.assertEqual(iterator.feed.get_elements('after'), [])
+    remaining = list(iterator)
+    self.assertEqual(len(remaining), 2)
+    # Members after the entries are ready once iteration is complete.
+    self.assertEqual(iterator.feed.get_elements('after')[0].text,
+                     'extension')
+    self.assertEqual(iterator.feed.entry, [])
+    self.assertRaises(StopIteration, iterator.next)
+
+  def testMatchesParse(self):
+    feed = atom.core.parse(FEED_XML, TestFeed)
+    entries = list(atom.core.iter_entries(FEED_XML, TestFeed))
+    self.assertEqual([e.to_string() for e in feed.entry],
+                     [e.to_string() for e in entries])
+
+  def testWrongRootElement(self):
+    iterator = atom.core.iter_entries(SAMPLE_XML, TestFeed)
+    self.assertEqual(list(iterator), [])
+    self.assert_(iterator.feed is None)
+
+
 def suite():
   return conf.build_suite([XmlElementTest, UtilityFunctionTest, 
-                           CharacterEncodingTest])
+                           CharacterEncodingTest, LazyParseTest,
+                           CompactParseTest, StreamParseTest,
+                           XmlBackendTest, ElementIndexTest, FieldsTest,
+                           XmlWriterTest, IterEntriesTest])
 
 
 if __name__ == '__main__':
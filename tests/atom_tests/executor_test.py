@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import unittest
+import sys
+import threading
+import time
+import atom.executor
+
+
+class ConcurrencyCounter(object):
+  """Records the most calls running at once, overall and for each host."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.running = {}
+    self.peak = {}
+
+  def call(self, host, value, seconds=0.02):
+    self.lock.acquire()
+    self.running[host] = self.running.get(host, 0) + 1
+    self.running[None] = self.running.get(None, 0) + 1
+    for key in (host, None):
+      self.peak[key] = max(self.peak.get(key, 0), self.running[key])
+    self.lock.release()
+    time.sleep(seconds)
+    self.lock.acquire()
+    self.running[host] -= 1
+    self.running[None] -= 1
+    self.lock.release()
+    return value
+
+
+class RequestExecutorTest(unittest.TestCase):
+
+  def test_results_in_order(self):
+    executor = atom.executor.RequestExecutor(max_workers=4)
+    futures = [executor.submit('example.com', lambda x: x * 2, i)
+               for i in range(20)]
+    self.assertEqual([future.result() for future in futures],
+                     [i * 2 for i in range(20)])
+    executor.shutdown()
+    self.assert_(futures[0].done())
+
+  def test_exception_is_raised_by_result(self):
+    def fail(message):
+      raise ValueError(message)
+    executor = atom.executor.RequestExecutor()
+    bad = executor.submit(None, fail, 'bad')
+    good = executor.submit(None, len, 'good')
+    self.assertRaises(ValueError, bad.result)
+    self.assertEqual(str(bad.exception()), 'bad')
+    self.assertEqual(good.result(), 4)
+    self.assert_(good.exception() is None)
+    executor.shutdown()
+
+  def test_per_host_limit(self):
+    counter = ConcurrencyCounter()
+    executor = atom.executor.RequestExecutor(max_workers=6, max_per_host=2)
+    futures = []
+    for i in range(12):
+      host = ('a.example.com', 'b.example.com')[i % 2]
+      futures.append(executor.submit(host, counter.call, host, i))
+    self.assertEqual([future.result() for future in futures], range(12))
+    executor.shutdown()
+    self.assert_(counter.peak['a.example.com'] <= 2)
+    self.assert_(counter.peak['b.example.com'] <= 2)
+    self.assert_(counter.peak[None] <= 4)
+
+  def test_max_workers(self):
+    counter = ConcurrencyCounter()
+    executor = atom.executor.RequestExecutor(max_workers=3, max_per_host=10)
+    futures = [executor.submit('example.com', counter.call, 'example.com', i)
+               for i in range(9)]
+    for future in futures:
+      future.result()
+    executor.shutdown()
+    self.assert_(counter.peak[None] <= 3)
+    self.assert_(len(executor._threads) <= 3)
+
+  def test_cancel_pending(self):
+    release = threading.Event()
+    executor = atom.executor.RequestExecutor(max_workers=1)
+    started = executor.submit(None, release.wait)
+    waiting = executor.submit(None, len, 'never run')
+    time.sleep(0.01)
+    executor.shutdown(wait=False, cancel_pending=True)
+    self.assertRaises(atom.executor.Cancelled, waiting.result)
+    self.assertRaises(atom.executor.ExecutorShutdown, executor.submit,
+                      None, len, 'too late')
+    release.set()
+    started.result()
+    executor.shutdown()
+
+  def test_result_timeout(self):
+    release = threading.Event()
+    executor = atom.executor.RequestExecutor()
+    future = executor.submit(None, release.wait)
+    self.assertRaises(atom.executor.Timeout, future.result, 0.01)
+    release.set()
+    future.result()
+    executor.shutdown()
+
+
+class FutureTest(unittest.TestCase):
+
+  def test_done_callbacks(self):
+    future = atom.executor.Future()
+    called = []
+    future.add_done_callback(called.append)
+    future.add_done_callback(lambda f: 1 / 0)
+    future.add_done_callback(lambda f: called.append(f.result()))
+    self.assertEqual(called, [])
+    future._set_result('done')
+    self.assertEqual(called, [future, 'done'])
+    # Callbacks added later are called right away.
+    future.add_done_callback(called.append)
+    self.assertEqual(len(called), 3)
+
+  def test_chain(self):
+    first = atom.executor.Future()
+    second = atom.executor.Future()
+    chained = atom.executor.chain(first, lambda result: result + 1)
+    nested = atom.executor.chain(chained, lambda result: second)
+    first._set_result(1)
+    self.assertEqual(chained.result(), 2)
+    self.assert_(not nested.done())
+    second._set_result('inner')
+    self.assertEqual(nested.result(), 'inner')
+
+  def test_chain_exception(self):
+    first = atom.executor.Future()
+    calls = []
+    chained = atom.executor.chain(first, calls.append)
+    failing = atom.executor.chain(chained, lambda result: 1 / 0)
+    try:
+      raise ValueError('first')
+    except ValueError:
+      first._set_exc_info(sys.exc_info())
+    self.assertRaises(ValueError, chained.result)
+    self.assertEqual(calls, [])
+    self.assertRaises(ValueError, failing.result)
+    succeeded = atom.executor.Future()
+    failing = atom.executor.chain(succeeded, lambda result: 1 / 0)
+    succeeded._set_result(None)
+    self.assertRaises(ZeroDivisionError, failing.result)
+
+
+def suite():
+  return unittest.TestSuite((
+      unittest.makeSuite(RequestExecutorTest, 'test'),
+      unittest.makeSuite(FutureTest, 'test')))
+
+
+if __name__ == '__main__':
+  unittest.main()
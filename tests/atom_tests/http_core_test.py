@@ -22,8 +22,20 @@ __author__ = 'j.s@google.com (Jeff Scudder)'
 
 
 import unittest
+import atom.client
 import atom.http_core
+import atom.http
 import StringIO
+import tempfile
+import BaseHTTPServer
+import SocketServer
+import httplib
+import os
+import select
+import socket
+import ssl
+import threading
+import zlib
 
 
 class UriTest(unittest.TestCase):
@@ -100,6 +112,37 @@ class UriTest(unittest.TestCase):
     self.assert_(uri_string == 'http://www.google.com/?q=sippycode')
 
 
+class MockConnection(object):
+
+  def __init__(self):
+    self.sent = []
+    self.headers = []
+    self.host = 'example.com'
+
+  def putrequest(self, method, url):
+    self.request_line = (method, url)
+
+  def putheader(self, name, value):
+    self.headers.append((name, value))
+
+  def endheaders(self):
+    pass
+
+  def send(self, data):
+    self.sent.append(data)
+
+
+class CopyingConnection(MockConnection):
+
+  def __init__(self):
+    MockConnection.__init__(self)
+    self.types = []
+
+  def send(self, data):
+    self.types.append(type(data))
+    self.sent.append(str(data))
+
+
 class HttpRequestTest(unittest.TestCase):
 
   def test_request_with_one_body_part(self):
@@ -118,17 +161,89 @@ class HttpRequestTest(unittest.TestCase):
   def test_add_file_without_size(self):
     virtual_file = StringIO.StringIO('this is a test')
     request = atom.http_core.HttpRequest()
-    try:
-      request.add_body_part(virtual_file, 'text/plain')
-      self.fail('We should have gotten an UnknownSize error.')
-    except atom.http_core.UnknownSize:
-      pass
+    request.add_body_part(virtual_file, 'text/plain')
+    self.assert_(len(request._body_parts) == 1)
+    self.assert_(request.headers['Content-Type'] == 'text/plain')
+    self.assert_(request.headers['Transfer-Encoding'] == 'chunked')
+    self.assert_('Content-Length' not in request.headers)
+    request = atom.http_core.HttpRequest()
     request.add_body_part(virtual_file, 'text/plain', len('this is a test'))
     self.assert_(len(request._body_parts) == 1)
     self.assert_(request.headers['Content-Type'] == 'text/plain')
     self.assert_(request._body_parts[0].read() == 'this is a test')
     self.assert_(request.headers['Content-Length'] == str(len(
         'this is a test')))
+    self.assert_('Transfer-Encoding' not in request.headers)
+
+  def test_multipart_with_unknown_size(self):
+    request = atom.http_core.HttpRequest()
+    request.add_body_part('<entry/>', 'application/atom+xml')
+    self.assert_(request.headers['Content-Length'] == '8')
+    request.add_body_part(iter(['abc', 'def']), 'text/csv')
+    request.add_body_part('last', 'text/plain')
+    self.assert_('Content-Length' not in request.headers)
+    self.assert_(request.headers['Transfer-Encoding'] == 'chunked')
+    self.assert_(request.headers['Content-Type'].startswith(
+        'multipart/related'))
+    self.assertEqual(len(request._body_parts), 11)
+
+  def test_send_chunked_body(self):
+    def generate():
+      yield 'first'
+      yield ''
+      yield 'second part'
+    request = atom.http_core.HttpRequest(method='PUT',
+        uri=atom.http_core.Uri.parse_uri('http://example.com/upload'))
+    request.add_body_part(generate(), 'text/plain')
+    connection = MockConnection()
+    atom.http_core.HttpClient()._send_request(
+        connection, request.method, request.uri, request.headers,
+        request._body_parts)
+    self.assertEqual(''.join(connection.sent),
+                     '5\r\nfirst\r\nb\r\nsecond part\r\n0\r\n\r\n')
+    self.assert_(('Transfer-Encoding', 'chunked') in connection.headers)
+
+  def test_add_iterable_body_part(self):
+    request = atom.http_core.HttpRequest()
+    request.add_body_part(['this ', 'is ', 'a test'], 'text/plain', 14)
+    self.assert_(request.headers['Content-Length'] == '14')
+    connection = MockConnection()
+    # Each time the part is sent, the chunks are read again.
+    atom.http_core._send_data_part(request._body_parts[0], connection)
+    atom.http_core._send_data_part(request._body_parts[0], connection)
+    self.assertEqual(connection.sent, ['this ', 'is ', 'a test'] * 2)
+
+  def test_send_file_from_memory_map(self):
+    contents = ''.join([chr(i % 256) for i in xrange(1000)])
+    data = tempfile.TemporaryFile()
+    data.write(contents)
+    data.seek(10)
+    connection = CopyingConnection()
+    original_size = atom.http_core.SEND_BUFFER_SIZE
+    atom.http_core.SEND_BUFFER_SIZE = 300
+    try:
+      atom.http_core._send_data_part(data, connection)
+    finally:
+      atom.http_core.SEND_BUFFER_SIZE = original_size
+    # The file is sent from its current position using buffers over slices
+    # of the map.
+    self.assertEqual(connection.types, [buffer] * 4)
+    self.assertEqual([len(part) for part in connection.sent],
+                     [300, 300, 300, 90])
+    self.assertEqual(''.join(connection.sent), contents[10:])
+    self.assertEqual(data.tell(), 1000)
+    self.assertEqual(data.read(), '')
+    # A file which has been read to the end sends nothing.
+    connection = CopyingConnection()
+    atom.http_core._send_data_part(data, connection)
+    self.assertEqual(connection.sent, [])
+
+  def test_send_file_like_object(self):
+    connection = MockConnection()
+    self.assert_(not atom.http_core._send_file(StringIO.StringIO('abc'),
+                                               connection))
+    atom.http_core._send_data_part(StringIO.StringIO('abc'), connection)
+    self.assertEqual(connection.sent, ['abc'])
 
   def test_copy(self):
     request = atom.http_core.HttpRequest(
@@ -149,9 +264,585 @@ class HttpRequestTest(unittest.TestCase):
     self.assert_(request._body_parts != copied._body_parts)
 
 
+def gzip_compress(data):
+  compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  return compressor.compress(data) + compressor.flush()
+
+
+class DecodedResponseTest(unittest.TestCase):
+
+  def setUp(self):
+    self.body = ''.join(['<entry><id>%i</id></entry>' % i
+                         for i in xrange(5000)])
+
+  def make_response(self, body, encoding):
+    return atom.http_core.HttpResponse(200, 'OK',
+        {'Content-Encoding': encoding, 'Content-Length': str(len(body)),
+         'Content-Type': 'application/atom+xml'}, body)
+
+  def test_gzip(self):
+    compressed = gzip_compress(self.body)
+    stats = atom.http_core.TransferStats()
+    response = atom.http_core.decode_response(
+        self.make_response(compressed, 'gzip'), stats)
+    self.assert_(isinstance(response, atom.http_core.DecodedResponse))
+    self.assertEqual(response.read(), self.body)
+    self.assertEqual(response.read(), '')
+    self.assertEqual(stats.responses, 1)
+    self.assertEqual(stats.wire_bytes, len(compressed))
+    self.assertEqual(stats.decoded_bytes, len(self.body))
+    self.assert_(stats.compression_ratio() > 8)
+
+  def test_deflate(self):
+    for compressed in (zlib.compress(self.body),
+                       zlib.compress(self.body)[2:-4]):
+      response = atom.http_core.decode_response(
+          self.make_response(compressed, 'deflate'))
+      self.assertEqual(response.read(), self.body)
+
+  def test_read_in_blocks(self):
+    response = atom.http_core.decode_response(
+        self.make_response(gzip_compress(self.body), 'x-gzip'))
+    blocks = []
+    while True:
+      block = response.read(1000)
+      if not block:
+        break
+      self.assert_(len(block) <= 1000)
+      blocks.append(block)
+    self.assertEqual(''.join(blocks), self.body)
+    self.assertEqual(response.decoded_bytes, len(self.body))
+
+  def test_identity_is_not_wrapped(self):
+    response = self.make_response(self.body, 'identity')
+    self.assert_(atom.http_core.decode_response(response) is response)
+
+  def test_encoding_headers_are_hidden(self):
+    response = atom.http_core.decode_response(
+        self.make_response(gzip_compress(self.body), 'gzip'))
+    self.assert_(response.getheader('Content-Encoding') is None)
+    self.assert_(response.getheader('Content-Length') is None)
+    self.assertEqual(response.getheader('Content-Type'),
+                     'application/atom+xml')
+    self.assertEqual(response.getheaders(),
+                     {'Content-Type': 'application/atom+xml'})
+    self.assertEqual(response.status, 200)
+    # Decoding an already decoded response has no effect.
+    self.assert_(atom.http_core.decode_response(response) is response)
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def setup(self):
+    BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+    self.server.count_connection()
+
+  def do_GET(self):
+    if (self.path.endswith('/gzip') and
+        'gzip' in self.headers.get('Accept-Encoding', '')):
+      body = gzip_compress('hello ' * 1000)
+      self.send_response(200)
+      self.send_header('Content-Encoding', 'gzip')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+      return
+    self.respond('hello %s' % self.path)
+    # Drop the connection without telling the client, as a server does when
+    # a keep-alive connection has been idle for too long.
+    if self.path == '/drop':
+      self.close_connection = 1
+
+  def do_POST(self):
+    if self.headers.get('Transfer-Encoding') == 'chunked':
+      body = []
+      while True:
+        size = int(self.rfile.readline(), 16)
+        body.append(self.rfile.read(size))
+        self.rfile.readline()
+        if not size:
+          break
+      self.respond(''.join(body))
+    else:
+      self.respond(self.rfile.read(int(self.headers['Content-Length'])))
+
+  def do_DELETE(self):
+    self.send_response(200)
+    self.send_header('Content-Length', '0')
+    self.end_headers()
+
+  def respond(self, body):
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/plain')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class KeepAliveServer(SocketServer.ThreadingMixIn,
+                      BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+  def __init__(self):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                       KeepAliveHandler)
+    self.connections = 0
+    self.lock = threading.Lock()
+
+  def count_connection(self):
+    self.lock.acquire()
+    self.connections += 1
+    self.lock.release()
+
+  def handle_error(self, request, client_address):
+    # Clients closing idle connections are expected here.
+    pass
+
+
+class ResetConnection(object):
+  """A pooled connection which looks idle but was reset by the server."""
+
+  def __init__(self):
+    self.sock, self.peer = socket.socketpair()
+    self.host = '127.0.0.1'
+    self.closed = False
+
+  def putrequest(self, method, url):
+    pass
+
+  def putheader(self, name, value):
+    pass
+
+  def endheaders(self):
+    pass
+
+  def send(self, data):
+    pass
+
+  def getresponse(self):
+    raise httplib.BadStatusLine('')
+
+  def close(self):
+    self.closed = True
+    self.sock.close()
+    self.peer.close()
+
+
+class PooledHttpClientTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old_proxy = os.environ.pop('http_proxy', None)
+    self.server = KeepAliveServer()
+    self.thread = threading.Thread(target=self.server.serve_forever,
+                                   args=(0.05,))
+    self.thread.setDaemon(True)
+    self.thread.start()
+    self.url = 'http://127.0.0.1:%i' % self.server.server_address[1]
+    self.key = ('http', '127.0.0.1', self.server.server_address[1])
+    self.client = atom.http_core.PooledHttpClient()
+
+  def tearDown(self):
+    self.client.close()
+    self.server.shutdown()
+    self.server.server_close()
+    if self.old_proxy is not None:
+      os.environ['http_proxy'] = self.old_proxy
+
+  def get(self, path, client=None):
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(self.url + path), method='GET')
+    return (client or self.client).request(request)
+
+  def test_connection_is_reused(self):
+    for i in range(3):
+      response = self.get('/%i' % i)
+      self.assertEqual(response.status, 200)
+      self.assertEqual(response.read(), 'hello /%i' % i)
+      self.assertEqual(self.client.pool.count(self.key), 1)
+    self.assertEqual(self.server.connections, 1)
+
+  def test_connection_is_returned_after_blocks_are_read(self):
+    response = self.get('/blocks')
+    self.assertEqual(response.read(4), 'hell')
+    self.assertEqual(self.client.pool.count(), 0)
+    self.assertEqual(response.read(100), 'o /blocks')
+    self.assertEqual(self.client.pool.count(), 1)
+    self.assertEqual(response.read(100), '')
+    self.assertEqual(self.client.pool.count(), 1)
+
+  def test_unread_response_is_not_reused(self):
+    self.get('/unread')
+    self.assertEqual(self.get('/next').read(), 'hello /next')
+    self.assertEqual(self.server.connections, 2)
+
+  def test_empty_response_is_returned_immediately(self):
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(self.url + '/x'), method='DELETE')
+    self.assertEqual(self.client.request(request).status, 200)
+    self.assertEqual(self.client.pool.count(self.key), 1)
+
+  def test_closed_response_is_not_reused(self):
+    response = self.get('/closed')
+    response.close()
+    self.assertEqual(self.client.pool.count(), 0)
+
+  def test_stale_connection_is_discarded(self):
+    self.assertEqual(self.get('/drop').read(), 'hello /drop')
+    self.assertEqual(self.client.pool.count(self.key), 1)
+    # Wait for the server to finish closing the connection.
+    for i in range(100):
+      if atom.http_core._is_stale(self.client.pool._idle[self.key][0][0]):
+        break
+      threading.Event().wait(0.01)
+    self.assertEqual(self.get('/after').read(), 'hello /after')
+    self.assertEqual(self.server.connections, 2)
+
+  def test_idle_timeout(self):
+    client = atom.http_core.PooledHttpClient(idle_timeout=0)
+    self.get('/a', client).read()
+    self.assertEqual(client.pool.count(), 1)
+    self.get('/b', client).read()
+    self.assertEqual(self.server.connections, 2)
+    client.close()
+
+  def test_max_idle_per_host(self):
+    client = atom.http_core.PooledHttpClient(max_idle_per_host=2)
+    responses = [self.get('/%i' % i, client) for i in range(4)]
+    for response in responses:
+      response.read()
+    self.assertEqual(client.pool.count(self.key), 2)
+    client.close()
+    self.assertEqual(client.pool.count(), 0)
+
+  def test_idempotent_request_is_retried_on_reset(self):
+    reset = ResetConnection()
+    self.client.pool.put(self.key, reset)
+    self.assertEqual(self.get('/retry').read(), 'hello /retry')
+    self.assert_(reset.closed)
+    self.assertEqual(self.server.connections, 1)
+
+  def test_post_is_not_retried_on_reset(self):
+    reset = ResetConnection()
+    self.client.pool.put(self.key, reset)
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(self.url + '/'), method='POST')
+    request.add_body_part('posted', 'text/plain')
+    self.assertRaises(httplib.BadStatusLine, self.client.request, request)
+    self.assert_(reset.closed)
+    self.assertEqual(self.client.request(request).read(), 'posted')
+
+  def test_file_upload(self):
+    contents = 'file contents ' * 10000
+    data = tempfile.TemporaryFile()
+    data.write(contents)
+    data.seek(0)
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(self.url + '/'), method='POST')
+    request.add_body_part(data, 'text/plain', len(contents))
+    self.assertEqual(self.client.request(request).read(), contents)
+    data.seek(0)
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(self.url + '/'), method='POST')
+    request.add_body_part(data, 'text/plain')
+    self.assertEqual(self.client.request(request).read(), contents)
+
+  def test_chunked_upload(self):
+    def generate():
+      for i in range(1000):
+        yield '%i,' % i
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(self.url + '/'), method='POST')
+    request.add_body_part(generate(), 'text/csv')
+    response = self.client.request(request)
+    self.assertEqual(response.read(),
+                     ''.join(['%i,' % i for i in range(1000)]))
+    # The connection can be reused after a chunked request.
+    self.assertEqual(self.get('/next').read(), 'hello /next')
+    self.assertEqual(self.server.connections, 1)
+
+  def test_compressed_response(self):
+    self.client.compress_responses = True
+    response = self.get('/gzip')
+    self.assertEqual(response.read(100), 'hello ' * 16 + 'hell')
+    self.assertEqual(response.read(), 'o ' + 'hello ' * 983)
+    self.assertEqual(self.client.pool.count(self.key), 1)
+    self.assertEqual(self.client.transfer_stats.decoded_bytes, 6000)
+    self.assert_(self.client.transfer_stats.wire_bytes < 100)
+
+  def test_v1_compressed_response(self):
+    client = atom.http.HttpClient()
+    client.compress_responses = True
+    response = client.request('GET', self.url + '/gzip')
+    self.assertEqual(response.read(), 'hello ' * 1000)
+    self.assertEqual(client.transfer_stats.decoded_bytes, 6000)
+
+  def test_concurrent_requests(self):
+    errors = []
+    def fetch(thread):
+      try:
+        for i in range(10):
+          path = '/%i/%i' % (thread, i)
+          if self.get(path).read() != 'hello ' + path:
+            errors.append(path)
+      except Exception, e:
+        errors.append(e)
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(errors, [])
+    self.assert_(self.server.connections <= 8)
+    self.assert_(self.client.pool.count(self.key) <= 4)
+
+  def test_observed_requests(self):
+    class RecordingObserver(object):
+      def __init__(self):
+        self.events = []
+      def request_finished(self, event):
+        self.events.append(event)
+    observer = RecordingObserver()
+    client = atom.client.AtomPubClient(http_client=self.client)
+    client.observers = [observer]
+    client.request('GET', self.url + '/one').read()
+    request = atom.http_core.HttpRequest(method='POST')
+    request.add_body_part('posted', 'text/plain')
+    client.request(uri=self.url + '/two', http_request=request).read()
+    self.client.pool.put(self.key, ResetConnection())
+    client.request('GET', self.url + '/three').read()
+    first, second, third = observer.events
+    self.assertEqual(first.path, '/one')
+    self.assertEqual(first.status, 200)
+    self.assertEqual(first.reused_connection, False)
+    self.assert_(first.connect_time > 0)
+    self.assert_(first.first_byte_time > 0)
+    self.assertEqual(first.bytes_received, len('hello /one'))
+    self.assertEqual(second.reused_connection, True)
+    self.assertEqual(second.connect_time, 0.0)
+    self.assertEqual(second.bytes_sent, len('posted'))
+    self.assertEqual(second.bytes_received, len('posted'))
+    self.assertEqual(second.retries, 0)
+    self.assertEqual(third.retries, 1)
+    self.assertEqual(third.reused_connection, False)
+
+  def test_v1_adapter(self):
+    client = atom.http.PooledHttpClient()
+    for path in ('/one', '/two'):
+      response = client.request('GET', self.url + path)
+      self.assertEqual(response.read(), 'hello ' + path)
+    response = client.request('POST', self.url + '/', data=['a', 'b'],
+                              headers={'Content-Length': '2'})
+    self.assertEqual(response.read(), 'ab')
+    self.assertEqual(self.server.connections, 1)
+    client.close()
+
+
+# A self-signed certificate and key for localhost and 127.0.0.1.
+TEST_CERT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'test_server.pem')
+
+
+class TlsKeepAliveServer(KeepAliveServer):
+
+  def get_request(self):
+    sock, address = self.socket.accept()
+    # The handler writes each header separately, which would otherwise be
+    # held back by Nagle's algorithm.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return (ssl.wrap_socket(sock, server_side=True, certfile=TEST_CERT),
+            address)
+
+
+class ConnectHandler(SocketServer.StreamRequestHandler):
+  """Opens the tunnel asked for in a CONNECT request and relays its data."""
+
+  def handle(self):
+    request_line = self.rfile.readline()
+    headers = {}
+    line = self.rfile.readline()
+    while line.strip():
+      name, value = line.split(':', 1)
+      headers[name.strip()] = value.strip()
+      line = self.rfile.readline()
+    self.server.record(request_line.split(), headers)
+    if self.server.refuse:
+      self.wfile.write('HTTP/1.0 407 Proxy Authentication Required\r\n'
+                       'Proxy-Authenticate: Basic realm="test"\r\n\r\n')
+      return
+    host, port = request_line.split()[1].rsplit(':', 1)
+    upstream = socket.create_connection((host, int(port)))
+    # The response is written in pieces, as a slow proxy might send it.
+    self.wfile.write('HTTP/1.0 200 Connection established\r\n')
+    self.wfile.write('Proxy-Agent: test\r\n\r\n')
+    sockets = [self.connection, upstream]
+    for sock in sockets:
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+      while True:
+        for sock in select.select(sockets, [], [])[0]:
+          data = sock.recv(65536)
+          if not data:
+            return
+          if sock is upstream:
+            self.connection.sendall(data)
+          else:
+            upstream.sendall(data)
+    finally:
+      upstream.close()
+
+
+class ConnectProxy(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self):
+    SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), ConnectHandler)
+    self.requests = []
+    self.refuse = False
+    self.lock = threading.Lock()
+
+  def record(self, request_line, headers):
+    self.lock.acquire()
+    self.requests.append((request_line, headers))
+    self.lock.release()
+
+  def handle_error(self, request, client_address):
+    pass
+
+
+def start_server(server):
+  thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+  thread.setDaemon(True)
+  thread.start()
+  return server
+
+
+class ProxyTunnelTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old_environ = os.environ.copy()
+    for name in ('https_proxy', 'proxy_username', 'proxy_password',
+                 'proxy-username', 'proxy-password'):
+      os.environ.pop(name, None)
+    self.server = start_server(TlsKeepAliveServer())
+    self.proxy = start_server(ConnectProxy())
+    os.environ['https_proxy'] = 'http://127.0.0.1:%i' % (
+        self.proxy.server_address[1])
+    self.port = self.server.server_address[1]
+    self.url = 'https://localhost:%i' % self.port
+    self.context = ssl.create_default_context(cafile=TEST_CERT)
+    self.client = atom.http_core.ProxiedHttpClient()
+    self.client.ssl_context = self.context
+
+  def tearDown(self):
+    self.client.close()
+    for server in (self.server, self.proxy):
+      server.shutdown()
+      server.server_close()
+    os.environ.clear()
+    os.environ.update(self.old_environ)
+
+  def get(self, path, client=None, headers=None):
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(self.url + path), method='GET',
+        headers=headers)
+    return (client or self.client).request(request)
+
+  def test_tunnel_is_reused(self):
+    for i in range(3):
+      response = self.get('/%i' % i)
+      self.assertEqual(response.status, 200)
+      self.assertEqual(response.read(), 'hello /%i' % i)
+    self.assertEqual(len(self.proxy.requests), 1)
+    self.assertEqual(self.proxy.requests[0][0],
+                     ['CONNECT', 'localhost:%i' % self.port, 'HTTP/1.0'])
+    self.assertEqual(self.server.connections, 1)
+    self.assertEqual(self.client.tunnel_pool.count(
+        ('https', 'localhost', self.port, '127.0.0.1',
+         self.proxy.server_address[1])), 1)
+
+  def test_tunnels_are_kept_per_host(self):
+    # Python 2 cannot match a certificate to an IP address.
+    self.context.check_hostname = False
+    self.get('/a').read()
+    self.url = 'https://127.0.0.1:%i' % self.port
+    self.get('/b').read()
+    self.get('/c').read()
+    self.assertEqual(len(self.proxy.requests), 2)
+    self.assertEqual(self.client.tunnel_pool.count(), 2)
+
+  def test_unread_response_is_not_reused(self):
+    self.get('/a')
+    self.assertEqual(self.get('/b').read(), 'hello /b')
+    self.assertEqual(len(self.proxy.requests), 2)
+
+  def test_proxy_headers(self):
+    os.environ['proxy_username'] = 'user'
+    os.environ['proxy_password'] = 'secret'
+    self.get('/a', headers={'User-Agent': 'tester'}).read()
+    headers = self.proxy.requests[0][1]
+    self.assertEqual(headers['Proxy-Authorization'],
+                     'Basic dXNlcjpzZWNyZXQ=')
+    self.assertEqual(headers['User-Agent'], 'tester')
+
+  def test_proxy_error(self):
+    self.proxy.refuse = True
+    try:
+      self.get('/a')
+      self.fail('The proxy refused the tunnel, so ProxyError is expected.')
+    except atom.http_core.ProxyError, error:
+      self.assertEqual(error.status, 407)
+      self.assertEqual(error.reason, 'Proxy Authentication Required')
+
+  def test_server_certificate_is_checked(self):
+    self.client.ssl_context = None
+    self.assertRaises(ssl.SSLError, self.get, '/a')
+
+  def test_pooled_client(self):
+    client = atom.http_core.PooledHttpClient()
+    client.ssl_context = self.context
+    for path in ('/one', '/two'):
+      self.assertEqual(self.get(path, client).read(), 'hello ' + path)
+    self.assertEqual(len(self.proxy.requests), 1)
+    client.close()
+
+  def test_v1_client(self):
+    client = atom.http.ProxiedHttpClient()
+    client.tunnel_client.ssl_context = self.context
+    for path in ('/one', '/two'):
+      response = client.request('GET', self.url + path)
+      self.assertEqual(response.read(), 'hello ' + path)
+    self.assertEqual(len(self.proxy.requests), 1)
+    self.assertEqual(self.server.connections, 1)
+    client.close()
+
+  def test_connect_response_is_parsed(self):
+    sock, peer = socket.socketpair()
+    try:
+      peer.sendall('HTTP/1.1 200 OK\r\nVia: 1.1 proxy\r\n'
+                   'Proxy-Connection: keep-alive\r\n\r\ntls')
+      atom.http_core._connect_tunnel(sock, 'example.com', 443,
+                                     {'User-Agent': 'tester'})
+      self.assertEqual(peer.recv(100),
+                       'CONNECT example.com:443 HTTP/1.0\r\n'
+                       'User-Agent: tester\r\n\r\n')
+      # Data sent by the server after the proxy's response is left unread.
+      self.assertEqual(sock.recv(100), 'tls')
+    finally:
+      sock.close()
+      peer.close()
+
+
 def suite():
   return unittest.TestSuite((unittest.makeSuite(UriTest,'test'),
-                             unittest.makeSuite(HttpRequestTest,'test')))
+                             unittest.makeSuite(HttpRequestTest,'test'),
+                             unittest.makeSuite(DecodedResponseTest,'test'),
+                             unittest.makeSuite(PooledHttpClientTest,'test'),
+                             unittest.makeSuite(ProxyTunnelTest,'test')))
 
  
 if __name__ == '__main__':
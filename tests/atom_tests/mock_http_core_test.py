@@ -105,6 +105,17 @@ class MockHttpClientTest(unittest.TestCase):
     self.assert_(response.reason == 'OK')
     self.assert_(response.read() == 'Testing')
 
+  def test_read_recording_in_blocks(self):
+    request = atom.http_core.HttpRequest(method='GET')
+    atom.http_core.parse_uri('http://www.google.com/').modify_request(request)
+    self.client.add_response(request, 200, 'OK', body='Testing')
+    for i in xrange(2):
+      response = self.client.request(request)
+      self.assertEqual(response.read(4), 'Test')
+      self.assertEqual(response.read(4), 'ing')
+      self.assertEqual(response.read(4), '')
+      self.assertEqual(response.read(), 'Testing')
+
   def test_save_and_load_recordings(self):
     request = atom.http_core.HttpRequest(method='GET')
     atom.http_core.parse_uri('http://www.google.com/').modify_request(request)
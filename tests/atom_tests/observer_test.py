@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import unittest
+import socket
+import atom.client
+import atom.http_core
+import atom.mock_http_core
+import atom.observer
+
+
+class RecordingObserver(object):
+
+  def __init__(self):
+    self.events = []
+
+  def request_finished(self, event):
+    self.events.append(event)
+
+
+class FailingHttpClient(object):
+
+  def request(self, http_request):
+    raise socket.error('connection refused')
+
+
+class PathTemplateTest(unittest.TestCase):
+
+  def test_ids_are_replaced(self):
+    self.assertEqual(
+        atom.observer.path_template(
+            '/m8/feeds/contacts/liz%40gmail.com/full/3b9e5f0c8a8d4e2'),
+        '/m8/feeds/contacts/{id}/full/{id}')
+    self.assertEqual(
+        atom.observer.path_template(
+            '/feeds/default/private/full/document:12345'),
+        '/feeds/default/private/full/{id}')
+    self.assertEqual(
+        atom.observer.path_template('/calendar/feeds/default/2010/full'),
+        '/calendar/feeds/default/{id}/full')
+
+  def test_fixed_segments_are_kept(self):
+    self.assertEqual(
+        atom.observer.path_template('/feeds/oauth2/v3/private/full?q=1'),
+        '/feeds/oauth2/v3/private/full')
+    self.assertEqual(atom.observer.path_template(None), '/')
+
+
+class HistogramTest(unittest.TestCase):
+
+  def test_percentiles(self):
+    histogram = atom.observer.Histogram((1, 2, 5, 10))
+    for value in (0.5, 0.7, 1.5, 3, 3, 4, 8, 12):
+      histogram.add(value)
+    self.assertEqual(histogram.counts, [2, 1, 3, 1, 1])
+    self.assertEqual(histogram.count, 8)
+    self.assertEqual(histogram.percentile(25), 1)
+    self.assertEqual(histogram.percentile(50), 5)
+    self.assertEqual(histogram.percentile(90), 12)
+    self.assertEqual(histogram.mean(), 32.7 / 8)
+
+  def test_empty(self):
+    histogram = atom.observer.Histogram((1, 2))
+    self.assertEqual(histogram.percentile(50), None)
+    self.assertEqual(histogram.mean(), None)
+
+
+class ObserverTest(unittest.TestCase):
+
+  def setUp(self):
+    self.observer = RecordingObserver()
+    self.client = atom.client.AtomPubClient(host='example.com')
+    self.client.http_client = atom.mock_http_core.SettableHttpClient(
+        200, 'OK', 'hello world', {'Content-Length': '11'})
+
+  def test_no_observers(self):
+    response = self.client.request('GET', '/feeds/a')
+    self.assert_(isinstance(response, atom.http_core.HttpResponse))
+
+  def test_client_observer(self):
+    self.client.observers = [self.observer]
+    response = self.client.request('GET', '/feeds/entry/1234')
+    self.assertEqual(response.status, 200)
+    self.assertEqual(response.getheader('Content-Length'), '11')
+    # The event is only finished once the body has been read.
+    self.assertEqual(self.observer.events, [])
+    self.assertEqual(response.read(5), 'hello')
+    self.assertEqual(response.read(100), ' world')
+    self.assertEqual(response.read(100), '')
+    self.assertEqual(len(self.observer.events), 1)
+    event = self.observer.events[0]
+    self.assertEqual(event.method, 'GET')
+    self.assertEqual(event.host, 'example.com')
+    self.assertEqual(event.service, 'example.com')
+    self.assertEqual(event.path, '/feeds/entry/1234')
+    self.assertEqual(event.path_template, '/feeds/entry/{id}')
+    self.assertEqual(event.status, 200)
+    self.assertEqual(event.bytes_received, 11)
+    self.assertEqual(event.error, None)
+    # The mock client does not measure the connection.
+    self.assertEqual(event.connect_time, None)
+    self.assert_(event.first_byte_time >= 0)
+    self.assert_(event.transfer_time >= 0)
+    self.assert_(event.total_time >= event.transfer_time)
+
+  def test_global_observer(self):
+    atom.observer.add_observer(self.observer)
+    try:
+      self.client.request('GET', '/feeds/a').read()
+      other = atom.client.AtomPubClient(host='example.org')
+      other.http_client = atom.mock_http_core.EchoHttpClient()
+      other.request('GET', '/feeds/b').read()
+    finally:
+      atom.observer.remove_observer(self.observer)
+    self.client.request('GET', '/feeds/c').read()
+    self.assertEqual([event.path for event in self.observer.events],
+                     ['/feeds/a', '/feeds/b'])
+
+  def test_empty_response_finishes_at_once(self):
+    self.client.http_client.set_response(200, 'OK', '',
+                                         {'Content-Length': '0'})
+    self.client.observers = [self.observer]
+    self.client.request('DELETE', '/feeds/a')
+    self.assertEqual(len(self.observer.events), 1)
+    self.assertEqual(self.observer.events[0].bytes_received, 0)
+
+  def test_failed_request(self):
+    self.client.http_client = FailingHttpClient()
+    self.client.observers = [self.observer]
+    self.assertRaises(socket.error, self.client.request, 'GET', '/feeds/a')
+    event = self.observer.events[0]
+    self.assert_(isinstance(event.error, socket.error))
+    self.assertEqual(event.status, None)
+
+  def test_failing_observer_is_ignored(self):
+    class BrokenObserver(object):
+      def request_finished(self, event):
+        raise ValueError('broken')
+    self.client.observers = [BrokenObserver(), self.observer]
+    self.assertEqual(self.client.request('GET', '/a').read(), 'hello world')
+    self.assertEqual(len(self.observer.events), 1)
+
+
+class AggregatingObserverTest(unittest.TestCase):
+
+  def test_stats_per_endpoint(self):
+    aggregate = atom.observer.AggregatingObserver()
+    client = atom.client.AtomPubClient(host='example.com')
+    client.observers = [aggregate]
+    client.http_client = atom.mock_http_core.SettableHttpClient(
+        200, 'OK', 'abc', {})
+    for i in range(3):
+      client.http_client.set_response(200, 'OK', 'abc', {})
+      client.request('GET', '/feeds/entry/%i000' % i).read()
+    client.http_client.set_response(404, 'Not Found', 'missing', {})
+    client.request('GET', '/feeds/entry/9999').read()
+    client.http_client.set_response(201, 'Created', 'new', {})
+    client.request('POST', '/feeds').read()
+    stats = aggregate.get_stats()
+    self.assertEqual(len(stats), 2)
+    entries = stats[('example.com', 'GET', '/feeds/entry/{id}')]
+    self.assertEqual(entries.requests, 4)
+    self.assertEqual(entries.errors, 1)
+    self.assertEqual(entries.bytes_received, 16)
+    self.assertEqual(entries.total_time.count, 4)
+    self.assertEqual(entries.connect_time.count, 0)
+    self.assertEqual(stats[('example.com', 'POST', '/feeds')].requests, 1)
+    report = aggregate.report().split('\n')
+    self.assertEqual(len(report), 3)
+    self.assert_(report[0].startswith('service'))
+    self.assert_('/feeds/entry/{id}' in report[1])
+    aggregate.clear()
+    self.assertEqual(aggregate.get_stats(), {})
+
+
+def suite():
+  return unittest.TestSuite((unittest.makeSuite(PathTemplateTest, 'test'),
+                             unittest.makeSuite(HistogramTest, 'test'),
+                             unittest.makeSuite(ObserverTest, 'test'),
+                             unittest.makeSuite(AggregatingObserverTest,
+                                                'test')))
+
+
+if __name__ == '__main__':
+  unittest.main()
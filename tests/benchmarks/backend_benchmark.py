@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Compares the parse throughput of each atom.core XML backend.
+
+Every XML sample in gdata.test_data is parsed with each backend which can
+be loaded (see atom.core.set_xml_backend). Run from the tests directory
+with src on the PYTHONPATH:
+
+  PYTHONPATH=../src python benchmarks/backend_benchmark.py [iterations]
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import sys
+import atom.core
+import core_benchmark
+
+
+BACKENDS = ('etree', 'lxml', 'expat')
+
+
+def run(iterations=200):
+  samples = core_benchmark.load_samples()
+  total_bytes = sum([len(xml) for name, xml, target_class in samples])
+  megabytes = total_bytes * iterations / 1048576.0
+  print '%i samples, %i bytes, %i iterations' % (len(samples), total_bytes,
+                                                 iterations)
+  original = atom.core.get_xml_backend()
+  try:
+    for name in BACKENDS:
+      try:
+        atom.core.set_xml_backend(name)
+      except ImportError, error:
+        print '%-6s skipped: %s' % (name, error)
+        continue
+      seconds = 0.0
+      for sample_name, xml, target_class in samples:
+        seconds += core_benchmark.time_call(
+            lambda: atom.core.parse(xml, target_class), iterations)
+      print '%-6s %8.3f s  %8.2f MB/s' % (name, seconds, megabytes / seconds)
+  finally:
+    atom.core._xml_backend = original
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    run(int(sys.argv[1]))
+  else:
+    run()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Compares the memory held by normal and compact parses of a large feed.
+
+A synthetic gdata.contacts.data.ContactsFeed is parsed with and without
+compact=True, and the size of every object reachable from the resulting
+feed is added up using sys.getsizeof. Run from the tests directory with src
+on the PYTHONPATH:
+
+  PYTHONPATH=../src python benchmarks/compact_benchmark.py [contacts]
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import gc
+import sys
+import time
+import atom.core
+import gdata.contacts.data
+
+
+FEED_START = ('<feed xmlns="http://www.w3.org/2005/Atom" '
+              'xmlns:gd="http://schemas.google.com/g/2005" '
+              'xmlns:gContact="http://schemas.google.com/contact/2008" '
+              'xmlns:openSearch="http://a9.com/-/spec/opensearchrss/1.0/">'
+              '<id>http://www.google.com/m8/feeds/contacts/liz%%40gmail.com/'
+              'full</id><title>Contacts</title>'
+              '<openSearch:totalResults>%i</openSearch:totalResults>')
+
+
+CONTACT = ('<entry>'
+           '<id>http://www.google.com/m8/feeds/contacts/liz%%40gmail.com/'
+           'base/%(i)x</id>'
+           '<updated>2010-03-05T12:36:38.835Z</updated>'
+           '<category scheme="http://schemas.google.com/g/2005#kind" '
+           'term="http://schemas.google.com/contact/2008#contact"/>'
+           '<title>Contact %(i)i</title>'
+           '<link rel="self" type="application/atom+xml" href="http://www.'
+           'google.com/m8/feeds/contacts/liz%%40gmail.com/full/%(i)x"/>'
+           '<link rel="edit" type="application/atom+xml" href="http://www.'
+           'google.com/m8/feeds/contacts/liz%%40gmail.com/full/%(i)x/1"/>'
+           '<gd:name><gd:givenName>Given%(i)i</gd:givenName>'
+           '<gd:familyName>Family%(i)i</gd:familyName></gd:name>'
+           '<gd:email rel="http://schemas.google.com/g/2005#work" '
+           'address="c%(i)i@example.com" primary="true"/>'
+           '<gd:email rel="http://schemas.google.com/g/2005#home" '
+           'address="c%(i)i@example.net"/>'
+           '<gd:phoneNumber rel="http://schemas.google.com/g/2005#mobile">'
+           '555-%(i)04i</gd:phoneNumber>'
+           '<gd:organization rel="http://schemas.google.com/g/2005#work">'
+           '<gd:orgName>Example %(i)i</gd:orgName></gd:organization>'
+           '<gd:extendedProperty name="pet" value="hamster"/>'
+           '<gContact:groupMembershipInfo deleted="false" '
+           'href="http://google.com/m8/feeds/groups/liz%%40gmail.com/base/6"/>'
+           '</entry>')
+
+
+def build_feed(contacts):
+  parts = [FEED_START % contacts]
+  for i in xrange(contacts):
+    parts.append(CONTACT % {'i': i})
+  parts.append('</feed>')
+  return ''.join(parts)
+
+
+def retained_size(root):
+  """Adds up sys.getsizeof for all objects reachable from root.
+
+  Classes and modules are not followed. Python 2 has no tracemalloc, so
+  this walk is used to measure the memory held by the parsed objects.
+  """
+  seen = set()
+  pending = [root]
+  total = 0
+  count = 0
+  while pending:
+    obj = pending.pop()
+    if id(obj) in seen or isinstance(obj, (type, type(sys))):
+      continue
+    seen.add(id(obj))
+    total += sys.getsizeof(obj)
+    count += 1
+    pending.extend(gc.get_referents(obj))
+  return total, count
+
+
+def measure(xml, compact):
+  start = time.time()
+  feed = atom.core.parse(xml, gdata.contacts.data.ContactsFeed,
+                         compact=compact)
+  seconds = time.time() - start
+  size, count = retained_size(feed)
+  return feed, seconds, size, count
+
+
+def run(contacts=10000):
+  xml = build_feed(contacts)
+  print '%i contacts, %i bytes of XML' % (contacts, len(xml))
+  for compact in (False, True):
+    feed, seconds, size, count = measure(xml, compact)
+    print 'compact=%-5s parse %6.2f s  %9i bytes in %7i objects' % (
+        compact, seconds, size, count)
+    del feed
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    run(int(sys.argv[1]))
+  else:
+    run()
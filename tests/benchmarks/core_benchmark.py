@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Measures atom.core parse and serialize throughput.
+
+Every XML sample in gdata.test_data is parsed into the most specific generic
+class (gdata.data.GDFeed, gdata.data.GDEntry or atom.core.XmlElement) and
+converted back to a string. Run from the tests directory with src on the
+PYTHONPATH:
+
+  PYTHONPATH=../src python benchmarks/core_benchmark.py [iterations]
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import sys
+import time
+import atom.core
+import gdata.data
+from gdata import test_data
+
+
+FEED_TAG = '{http://www.w3.org/2005/Atom}feed'
+ENTRY_TAG = '{http://www.w3.org/2005/Atom}entry'
+
+
+def load_samples():
+  """Returns a list of (name, xml, target_class) for each usable sample."""
+  samples = []
+  for name in sorted(dir(test_data)):
+    xml = getattr(test_data, name)
+    if not name.isupper() or not isinstance(xml, str):
+      continue
+    try:
+      tree = atom.core.ElementTree.fromstring(xml.strip())
+    except Exception:
+      continue
+    if tree.tag == FEED_TAG:
+      target_class = gdata.data.GDFeed
+    elif tree.tag == ENTRY_TAG:
+      target_class = gdata.data.GDEntry
+    else:
+      target_class = atom.core.XmlElement
+    samples.append((name, xml.strip(), target_class))
+  return samples
+
+
+def time_call(function, iterations):
+  start = time.time()
+  for i in xrange(iterations):
+    function()
+  return time.time() - start
+
+
+def run(iterations=200):
+  samples = load_samples()
+  total_bytes = 0
+  parse_seconds = 0.0
+  serialize_seconds = 0.0
+  for name, xml, target_class in samples:
+    parsed = atom.core.parse(xml, target_class)
+    total_bytes += len(xml)
+    parse_seconds += time_call(
+        lambda: atom.core.parse(xml, target_class), iterations)
+    serialize_seconds += time_call(parsed.to_string, iterations)
+  megabytes = total_bytes * iterations / 1048576.0
+  print '%i samples, %i bytes, %i iterations' % (len(samples), total_bytes,
+                                                 iterations)
+  print 'parse:     %8.3f s  %8.2f MB/s' % (parse_seconds,
+                                            megabytes / parse_seconds)
+  print 'serialize: %8.3f s  %8.2f MB/s' % (serialize_seconds,
+                                            megabytes / serialize_seconds)
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    run(int(sys.argv[1]))
+  else:
+    run()
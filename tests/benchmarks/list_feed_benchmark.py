@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Measures reading and writing every cell of a wide spreadsheet list feed.
+
+A synthetic gdata.spreadsheets.data.ListsFeed is parsed, then every value
+in every row is read with ListEntry.get_value and changed with
+ListEntry.set_value. Run from the tests directory with src on the
+PYTHONPATH:
+
+  PYTHONPATH=../src python benchmarks/list_feed_benchmark.py [rows] [columns]
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import sys
+import time
+import atom.core
+import gdata.spreadsheets.data
+
+
+FEED_START = ('<feed xmlns="http://www.w3.org/2005/Atom" '
+              'xmlns:gsx="http://schemas.google.com/spreadsheets/2006/'
+              'extended"><title>Sheet 1</title>')
+
+
+def build_feed(rows, columns):
+  parts = [FEED_START]
+  for row in xrange(rows):
+    parts.append('<entry><id>http://spreadsheets.google.com/feeds/list/key/'
+                 'od6/private/full/r%i</id><title>Row %i</title>' % (row, row))
+    for column in xrange(columns):
+      parts.append('<gsx:col%i>%i</gsx:col%i>' % (column, row * column,
+                                                  column))
+    parts.append('</entry>')
+  parts.append('</feed>')
+  return ''.join(parts)
+
+
+def run(rows=50, columns=200):
+  xml = build_feed(rows, columns)
+  feed = atom.core.parse(xml, gdata.spreadsheets.data.ListsFeed)
+  names = ['col%i' % column for column in xrange(columns)]
+  start = time.time()
+  for entry in feed.entry:
+    for name in names:
+      entry.get_value(name)
+  read_seconds = time.time() - start
+  start = time.time()
+  for entry in feed.entry:
+    for name in names:
+      entry.set_value(name, 'x')
+  write_seconds = time.time() - start
+  cells = rows * columns
+  print '%i rows, %i columns' % (rows, columns)
+  print 'get_value: %8.3f s  %10.0f cells/s' % (read_seconds,
+                                                cells / read_seconds)
+  print 'set_value: %8.3f s  %10.0f cells/s' % (write_seconds,
+                                                cells / write_seconds)
+
+
+if __name__ == '__main__':
+  run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Measures HTTPS requests per second through a CONNECT proxy.
+
+Uses the stand-in proxy and TLS server from atom_tests.http_core_test on
+the loopback interface. Requests are made once with a new tunnel for each
+request, as atom.http_core.ProxiedHttpClient used to do, and once with the
+tunnels reused. Run from the tests directory with src and the tests
+directory on the PYTHONPATH:
+
+  PYTHONPATH=../src:. python benchmarks/proxy_benchmark.py [requests]
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import os
+import ssl
+import sys
+import time
+import atom.http_core
+from atom_tests import http_core_test
+
+
+def measure(client, url, requests, reuse):
+  start = time.time()
+  for i in xrange(requests):
+    request = atom.http_core.HttpRequest(
+        uri=atom.http_core.Uri.parse_uri(url), method='GET')
+    client.request(request).read()
+    if not reuse:
+      client.close()
+  return requests / (time.time() - start)
+
+
+def run(requests=500):
+  server = http_core_test.start_server(http_core_test.TlsKeepAliveServer())
+  proxy = http_core_test.start_server(http_core_test.ConnectProxy())
+  os.environ['https_proxy'] = 'http://127.0.0.1:%i' % proxy.server_address[1]
+  url = 'https://localhost:%i/feed' % server.server_address[1]
+  client = atom.http_core.ProxiedHttpClient()
+  client.ssl_context = ssl.create_default_context(
+      cafile=http_core_test.TEST_CERT)
+  try:
+    for reuse in (False, True):
+      proxy.requests = []
+      rate = measure(client, url, requests, reuse)
+      print 'reuse=%-5s %7.1f requests/s  %4i CONNECTs' % (
+          reuse, rate, len(proxy.requests))
+  finally:
+    client.close()
+    server.shutdown()
+    proxy.shutdown()
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    run(int(sys.argv[1]))
+  else:
+    run()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+"""Measures file upload throughput and CPU use of atom.http_core.HttpClient.
+
+A temporary file is uploaded to a server on the loopback interface which
+discards the request bodies. The server runs in a separate process so that
+only the client's CPU time is counted. Each upload is made twice: once with
+a file-like object which only has a read method, and once with the file
+itself, which atom.http_core sends from a memory map. Run from the tests
+directory with src on the PYTHONPATH:
+
+  PYTHONPATH=../src python benchmarks/upload_benchmark.py [megabytes]
+"""
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import os
+import socket
+import sys
+import tempfile
+import time
+import atom.http_core
+
+
+class ReadOnlyFile(object):
+  """Hides everything but read, so the file is sent in read() chunks."""
+
+  def __init__(self, data):
+    self.data = data
+
+  def read(self, size=-1):
+    return self.data.read(size)
+
+
+def serve(listener):
+  """Reads requests and discards their bodies until the client hangs up."""
+  buf = bytearray(1024 * 1024)
+  while True:
+    connection, address = listener.accept()
+    stream = connection.makefile('rb', 0)
+    while True:
+      length = None
+      line = stream.readline()
+      if not line:
+        break
+      while line not in ('\r\n', '\n', ''):
+        name, sep, value = line.partition(':')
+        if name.lower() == 'content-length':
+          length = int(value)
+        line = stream.readline()
+      while length:
+        received = connection.recv_into(buf, min(length, len(buf)))
+        if not received:
+          break
+        length -= received
+      connection.sendall('HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+    connection.close()
+
+
+def upload(port, data, size):
+  request = atom.http_core.HttpRequest(
+      uri=atom.http_core.Uri(scheme='http', host='127.0.0.1', port=port,
+                             path='/upload'), method='PUT')
+  request.add_body_part(data, 'application/octet-stream', size)
+  cpu_start = sum(os.times()[:2])
+  start = time.time()
+  response = atom.http_core.HttpClient().request(request)
+  response.read()
+  return time.time() - start, sum(os.times()[:2]) - cpu_start
+
+
+def run(megabytes=256):
+  size = megabytes * 1024 * 1024
+  data = tempfile.TemporaryFile()
+  block = os.urandom(1024 * 1024)
+  for i in xrange(megabytes):
+    data.write(block)
+  data.flush()
+  listener = socket.socket()
+  listener.bind(('127.0.0.1', 0))
+  listener.listen(5)
+  port = listener.getsockname()[1]
+  child = os.fork()
+  if child == 0:
+    try:
+      serve(listener)
+    finally:
+      os._exit(0)
+  listener.close()
+  print '%i MB upload over loopback' % megabytes
+  try:
+    for name, wrap in (('read() chunks', ReadOnlyFile), ('mmap', None)):
+      data.seek(0)
+      if wrap is not None:
+        body = wrap(data)
+      else:
+        body = data
+      seconds, cpu = upload(port, body, size)
+      print '%-14s %8.1f MB/s  %6.2f CPU s/GB' % (
+          name, megabytes / seconds, cpu * 1024 / megabytes)
+  finally:
+    os.kill(child, 15)
+    os.waitpid(child, 0)
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    run(int(sys.argv[1]))
+  else:
+    run()
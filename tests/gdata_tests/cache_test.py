@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import unittest
+import os
+import shutil
+import tempfile
+import atom.mock_http_core
+import gdata.cache
+import gdata.client
+import gdata.data
+import gdata.gauth
+
+
+FEED = ('<feed xmlns="http://www.w3.org/2005/Atom">'
+        '<title>%s</title><entry><id>1</id></entry></feed>')
+
+
+class RecordingHttpClient(object):
+  """Replies with the next response in a list and records the headers sent.
+  """
+
+  def __init__(self, *replies):
+    self.replies = list(replies)
+    self.headers = []
+
+  def request(self, http_request):
+    self.headers.append(http_request.headers.copy())
+    status, body, headers = self.replies.pop(0)
+    return atom.mock_http_core.MockHttpResponse(status, 'reason', headers,
+                                                body)
+
+
+def make_cached(body, etag='"e"'):
+  return gdata.cache.CachedResponse(etag, None, body)
+
+
+class MemoryCacheTest(unittest.TestCase):
+
+  def test_least_recently_used_are_evicted(self):
+    cache = gdata.cache.MemoryCache(max_bytes=10)
+    cache.put('a', make_cached('1234'))
+    cache.put('b', make_cached('1234'))
+    self.assertEqual(cache.get('a').body, '1234')
+    cache.put('c', make_cached('1234'))
+    self.assertEqual(cache.get('b'), None)
+    self.assertEqual(cache.get('a').body, '1234')
+    self.assertEqual(cache.size, 8)
+    self.assertEqual(len(cache), 2)
+
+  def test_replace_and_too_large(self):
+    cache = gdata.cache.MemoryCache(max_bytes=10)
+    cache.put('a', make_cached('1234'))
+    cache.put('a', make_cached('123456'))
+    self.assertEqual(cache.size, 6)
+    cache.put('b', make_cached('x' * 11))
+    self.assertEqual(cache.get('b'), None)
+    cache.delete('a')
+    self.assertEqual(cache.size, 0)
+
+
+class DiskCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_round_trip(self):
+    cache = gdata.cache.DiskCache(os.path.join(self.directory, 'cache'))
+    key = ('user', 'example.com', None, '/feeds', (), '2')
+    cache.put(key, gdata.cache.CachedResponse(
+        '"abc"', 'Sat, 29 Oct 1994 19:43:31 GMT', 'body\nwith lines'))
+    cached = cache.get(key)
+    self.assertEqual(cached.etag, '"abc"')
+    self.assertEqual(cached.last_modified, 'Sat, 29 Oct 1994 19:43:31 GMT')
+    self.assertEqual(cached.body, 'body\nwith lines')
+    self.assertEqual(cache.get(('other',)), None)
+    cache.delete(key)
+    self.assertEqual(cache.get(key), None)
+
+  def test_oldest_files_are_evicted(self):
+    cache = gdata.cache.DiskCache(self.directory, max_bytes=300)
+    for i in range(3):
+      cache.put(i, make_cached('x' * 80))
+      path = cache._get_path(i)
+      os.utime(path, (1000 + i, 1000 + i))
+    self.assertEqual(cache.get(0).body, 'x' * 80)
+    # Reading the first file makes the second the least recently used.
+    cache.put(3, make_cached('x' * 80))
+    self.assertEqual(cache.get(1), None)
+    self.assertNotEqual(cache.get(0), None)
+    self.assertNotEqual(cache.get(3), None)
+
+
+class ClientCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.client = gdata.client.GDClient(host='example.com')
+    self.client.api_version = '2'
+    self.client.response_cache = gdata.cache.ResponseCache()
+
+  def test_not_modified_returns_cached_feed(self):
+    self.client.http_client = RecordingHttpClient(
+        (200, FEED % 'first', {'ETag': 'W/"1"'}),
+        (304, '', {}))
+    feed = self.client.get_feed('/feeds/a')
+    self.assertEqual(feed.title.text, 'first')
+    self.assert_(self.client.get_feed('/feeds/a') is feed)
+    sent = self.client.http_client.headers
+    self.assert_('If-None-Match' not in sent[0])
+    self.assertEqual(sent[1]['If-None-Match'], 'W/"1"')
+
+  def test_changed_feed_replaces_cached(self):
+    self.client.http_client = RecordingHttpClient(
+        (200, FEED % 'first', {'ETag': 'W/"1"'}),
+        (200, FEED % 'second', {'ETag': 'W/"2"'}),
+        (304, '', {}))
+    self.client.get_feed('/feeds/a')
+    self.assertEqual(self.client.get_feed('/feeds/a').title.text, 'second')
+    self.assertEqual(self.client.get_feed('/feeds/a').title.text, 'second')
+    self.assertEqual(self.client.http_client.headers[2]['If-None-Match'],
+                     'W/"2"')
+
+  def test_last_modified(self):
+    self.client.http_client = RecordingHttpClient(
+        (200, FEED % 'first', {'Last-Modified': 'Mon, 01 Nov 2010 00:00:00'}),
+        (304, '', {}))
+    self.client.get_feed('/feeds/a')
+    self.client.get_feed('/feeds/a')
+    self.assertEqual(
+        self.client.http_client.headers[1]['If-Modified-Since'],
+        'Mon, 01 Nov 2010 00:00:00')
+
+  def test_keys(self):
+    self.client.http_client = RecordingHttpClient(
+        *[(200, FEED % 'first', {'ETag': 'W/"1"'})] * 4)
+    self.client.get_feed('/feeds/a')
+    # A different URL, user, or API version is a different response.
+    self.client.get_feed('/feeds/a?max-results=5')
+    self.client.get_feed('/feeds/a',
+                         auth_token=gdata.gauth.ClientLoginToken('x'))
+    self.client.api_version = '3'
+    self.client.get_feed('/feeds/a')
+    for headers in self.client.http_client.headers:
+      self.assert_('If-None-Match' not in headers)
+
+  def test_query_parameters_are_in_key(self):
+    self.client.http_client = RecordingHttpClient(
+        (200, FEED % 'alpha', {'ETag': 'W/"a"'}),
+        (200, FEED % 'beta', {'ETag': 'W/"b"'}),
+        (304, '', {}))
+    self.client.get_feed('/feeds/a',
+                         query=gdata.client.Query(text_query='alpha'))
+    beta = self.client.get_feed('/feeds/a',
+                                query=gdata.client.Query(text_query='beta'))
+    self.assertEqual(beta.title.text, 'beta')
+    sent = self.client.http_client.headers
+    self.assert_('If-None-Match' not in sent[1])
+    alpha = self.client.get_feed('/feeds/a',
+                                 query=gdata.client.Query(text_query='alpha'))
+    self.assertEqual(alpha.title.text, 'alpha')
+    self.assertEqual(sent[2]['If-None-Match'], 'W/"a"')
+
+  def test_responses_without_validators_are_not_cached(self):
+    self.client.http_client = RecordingHttpClient(
+        (200, FEED % 'first', {}), (200, FEED % 'second', {}))
+    self.client.get_feed('/feeds/a')
+    self.client.get_feed('/feeds/a')
+    self.assert_('If-None-Match' not in self.client.http_client.headers[1])
+
+  def test_explicit_etag_raises_not_modified(self):
+    self.client.http_client = RecordingHttpClient((304, '', {}))
+    self.assertRaises(gdata.client.NotModified, self.client.get_entry,
+                      '/feeds/a/1', etag='W/"1"')
+
+  def test_disk_tier(self):
+    directory = tempfile.mkdtemp()
+    try:
+      self.client.response_cache = gdata.cache.ResponseCache(
+          directory=directory)
+      self.client.http_client = RecordingHttpClient(
+          (200, FEED % 'first', {'ETag': 'W/"1"'}))
+      self.client.get_feed('/feeds/a')
+      # A new cache, as in another process, finds the response on disk.
+      self.client.response_cache = gdata.cache.ResponseCache(
+          directory=directory)
+      self.client.http_client = RecordingHttpClient((304, '', {}))
+      feed = self.client.get_feed('/feeds/a')
+      self.assertEqual(feed.title.text, 'first')
+      self.assert_(isinstance(feed, gdata.data.GDFeed))
+    finally:
+      shutil.rmtree(directory)
+
+
+def suite():
+  return unittest.TestSuite((unittest.makeSuite(MemoryCacheTest, 'test'),
+                             unittest.makeSuite(DiskCacheTest, 'test'),
+                             unittest.makeSuite(ClientCacheTest, 'test')))
+
+
+if __name__ == '__main__':
+  unittest.main()
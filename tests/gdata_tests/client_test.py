@@ -25,8 +25,22 @@ import unittest
 import gdata.client
 import gdata.gauth
 import gdata.data
+import gdata.retry
+import gdata.sync
+import atom.core
+import atom.data
+import atom.http_core
 import atom.mock_http_core
+import atom.observer
+import hashlib
+import os
+import shutil
+import socket
 import StringIO
+import tempfile
+import threading
+import time
+import zlib
 
 
 class ClientLoginTest(unittest.TestCase):
@@ -267,6 +281,25 @@ class RequestTest(unittest.TestCase):
     except gdata.client.RedirectError, err:
       self.assert_(str(err).startswith('Too many redirects from server'))
 
+  def test_observed_redirect(self):
+    client = gdata.client.GDClient()
+    client.auth_service = 'cl'
+    client.observers = [atom.observer.AggregatingObserver()]
+    client.http_client = atom.mock_http_core.MockHttpClient()
+    client.http_client.add_response(
+        atom.http_core.HttpRequest('http://example.com/1', 'GET'), 302,
+        None, {'Location': 'http://example.com/1?gsessionid=12'},
+        body='moved')
+    client.http_client.add_response(
+        atom.http_core.HttpRequest('http://example.com/1?gsessionid=12',
+                                   'GET'), 200, 'OK', body='Done')
+    self.assertEqual(client.request('GET', 'http://example.com/1').read(),
+                     'Done')
+    stats = client.observers[0].get_stats()[('cl', 'GET', '/1')]
+    self.assertEqual(stats.requests, 2)
+    self.assertEqual(stats.redirects, 1)
+    self.assertEqual(stats.bytes_received, len('moved') + len('Done'))
+
   def test_lowercase_location(self):
     client = gdata.client.GDClient()
     client.http_client = atom.mock_http_core.MockHttpClient()
@@ -286,6 +319,51 @@ class RequestTest(unittest.TestCase):
     self.assertEqual(response.reason, 'OK')
     self.assertEqual(response.read(), 'Done')
 
+  def test_gsessionid_does_not_change_uri(self):
+    client = gdata.client.GDClient()
+    client.http_client = atom.mock_http_core.EchoHttpClient()
+    client.request('GET', 'http://example.com/1?gsessionid=12')
+    shared_uri = atom.http_core.Uri.parse_uri('http://example.com/2')
+    response = client.request('GET', shared_uri)
+    self.assertEqual(response.getheader('Echo-Uri'), '/2?gsessionid=12')
+    self.assert_('gsessionid' not in shared_uri.query)
+
+  def test_map_requests(self):
+    client = gdata.client.GDClient()
+    client.http_client = atom.mock_http_core.MockHttpClient()
+    uris = ['http://example.com/feeds/%i' % i for i in range(10)]
+    for i, uri in enumerate(uris):
+      if i == 3:
+        client.http_client.add_response(
+            atom.http_core.HttpRequest(uri, 'GET'), 404, 'Not Found',
+            body='missing')
+      else:
+        client.http_client.add_response(
+            atom.http_core.HttpRequest(uri, 'GET'), 200, 'OK',
+            body=('<feed xmlns="http://www.w3.org/2005/Atom">'
+                  '<id>%i</id></feed>' % i))
+    results = list(client.map_requests(uris, max_workers=4, max_per_host=2))
+    self.assertEqual(len(results), 10)
+    self.assert_(isinstance(results[3], gdata.client.RequestError))
+    self.assertEqual(results[3].status, 404)
+    for i, feed in enumerate(results):
+      if i != 3:
+        self.assert_(isinstance(feed, gdata.data.GDFeed))
+        self.assertEqual(feed.id.text, str(i))
+
+  def test_map_requests_with_function(self):
+    client = gdata.client.GDClient()
+    def fetch(uri, suffix):
+      if uri.path == '/bad':
+        raise ValueError('not a gdata.client.Error')
+      return uri.path + suffix
+    results = client.map_requests(['http://a.com/x', '/y'], function=fetch,
+                                  suffix='!')
+    self.assertEqual(list(results), ['/x!', '/y!'])
+    results = client.map_requests(['http://a.com/bad'], function=fetch,
+                                  suffix='!')
+    self.assertRaises(ValueError, list, results)
+
   def test_exercise_exceptions(self):
     # TODO
     pass
@@ -308,6 +386,140 @@ class RequestTest(unittest.TestCase):
     result = client.post(test_entry, 'http://example.com', desired_class=TestClass)
     self.assert_(isinstance(result, TestClass))
 
+  def test_get_feed_fields(self):
+    client = gdata.client.GDClient()
+    client.http_client = atom.mock_http_core.MockHttpClient()
+    client.http_client.add_response(
+        atom.http_core.HttpRequest('http://example.com/feed', 'GET'),
+        200, 'OK',
+        body=('<feed xmlns="http://www.w3.org/2005/Atom"><id>f</id>'
+              '<title>t</title><entry><id>e</id><title>t</title></entry>'
+              '</feed>'))
+    feed = client.get_feed('http://example.com/feed', fields='entry(id)')
+    self.assert_(feed.id is None)
+    self.assert_(feed.title is None)
+    self.assertEqual(feed.entry[0].id.text, 'e')
+    self.assert_(feed.entry[0].title is None)
+
+  def test_post_feed_streams_body(self):
+    client = gdata.client.GDClient()
+    client.http_client = atom.mock_http_core.EchoHttpClient()
+    feed = gdata.data.BatchFeed()
+    for i in xrange(3):
+      feed.add_insert(gdata.data.BatchEntry(
+          id=atom.data.Id(text='entry %i' % i)))
+    result = client.post(feed, 'http://example.com/batch')
+    self.assert_(isinstance(result, gdata.data.BatchFeed))
+    self.assertEqual(len(result.entry), 3)
+    self.assertEqual(result.entry[2].id.text, 'entry 2')
+    self.assertEqual(result.entry[2].batch_operation.type, 'insert')
+
+  def test_compressed_response(self):
+    xml = ('<feed xmlns="http://www.w3.org/2005/Atom"><id>f</id>%s</feed>' %
+           ''.join(['<entry><id>%i</id></entry>' % i for i in xrange(500)]))
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    compressed = compressor.compress(xml) + compressor.flush()
+
+    class GzipHttpClient(atom.http_core.HttpClient):
+      def _http_request(self, method, uri, headers=None, body_parts=None):
+        self.accept_encoding = headers.get('Accept-Encoding')
+        return atom.http_core.HttpResponse(200, 'OK',
+            {'Content-Encoding': 'gzip',
+             'Content-Length': str(len(compressed))}, compressed)
+
+    client = gdata.client.GDClient()
+    client.http_client = GzipHttpClient()
+    client.http_client.compress_responses = True
+    feed = client.get_feed('http://example.com/feed')
+    self.assertEqual(client.http_client.accept_encoding, 'gzip, deflate')
+    self.assertEqual(len(feed.entry), 500)
+    self.assertEqual(feed.entry[499].id.text, '499')
+    stats = client.http_client.transfer_stats
+    self.assertEqual(stats.responses, 1)
+    self.assertEqual(stats.wire_bytes, len(compressed))
+    self.assertEqual(stats.decoded_bytes, len(xml))
+
+  def test_download_to(self):
+    body = ''.join([chr(i % 256) for i in xrange(10000)])
+    client = gdata.client.GDClient()
+    client.http_client = atom.mock_http_core.SettableHttpClient(
+        200, 'OK', body, {'Content-Length': str(len(body))})
+    calls = []
+    digest = hashlib.md5()
+    destination = StringIO.StringIO()
+    written = client.download_to(
+        'http://example.com/file', destination, chunk_size=4096,
+        progress=lambda done, total: calls.append((done, total)),
+        digest=digest)
+    self.assertEqual(written, 10000)
+    self.assertEqual(destination.getvalue(), body)
+    self.assertEqual(calls, [(4096, 10000), (8192, 10000), (10000, 10000)])
+    self.assertEqual(digest.hexdigest(), hashlib.md5(body).hexdigest())
+    # A file object which was passed in is left open.
+    self.assertFalse(destination.closed)
+
+    # Download to a file path.
+    path = tempfile.mktemp()
+    client.http_client.set_response(200, 'OK', body, {})
+    calls = []
+    try:
+      client.download_to(
+          'http://example.com/file', path, chunk_size=3000,
+          progress=lambda done, total: calls.append((done, total)))
+      self.assertEqual(open(path, 'rb').read(), body)
+      self.assertEqual(calls[-1], (10000, None))
+      self.assertEqual(len(calls), 4)
+    finally:
+      os.remove(path)
+
+  def test_download_to_error(self):
+    path = tempfile.mktemp()
+    client = gdata.client.GDClient()
+    client.http_client = atom.mock_http_core.SettableHttpClient(
+        404, 'Not Found', 'missing', {})
+    self.assertRaises(gdata.client.RequestError, client.download_to,
+                      'http://example.com/file', path)
+    # The destination is not created for an error response.
+    self.assertFalse(os.path.exists(path))
+
+    class FailingBody(object):
+      def __init__(self):
+        self.reads = 0
+      def read(self, amt=None):
+        self.reads += 1
+        if self.reads > 2:
+          raise IOError('connection lost')
+        return 'x' * amt
+
+    client.http_client.set_response(200, 'OK', FailingBody(), {})
+    self.assertRaises(IOError, client.download_to,
+                      'http://example.com/file', path, chunk_size=10)
+    # A partially written file is removed.
+    self.assertFalse(os.path.exists(path))
+
+  def test_download_to_closes_response(self):
+    closed = []
+
+    class ClosingResponse(atom.mock_http_core.MockHttpResponse):
+      def close(self):
+        closed.append(True)
+
+    class ClosingHttpClient(object):
+      def request(self, http_request):
+        return ClosingResponse(200, 'OK', {}, 'data')
+
+    class FailingFile(object):
+      def write(self, data):
+        raise IOError('disk full')
+
+    client = gdata.client.GDClient()
+    client.http_client = ClosingHttpClient()
+    self.assertRaises(IOError, client.download_to,
+                      'http://example.com/file', FailingFile())
+    self.assertEqual(closed, [True])
+    client.download_to('http://example.com/file', StringIO.StringIO())
+    self.assertEqual(closed, [True, True])
+
 
 class QueryTest(unittest.TestCase):
 
@@ -342,13 +554,321 @@ class VersionConversionTest(unittest.TestCase):
     self.assertEquals(gdata.client.get_xml_version('10.4'), 10)
 
 
+class PagedFeedHttpClient(object):
+  """Serves a feed of total entries, page_size at a time.
+
+  With opensearch False, the feed does not give its total size and its next
+  links use opaque start-key tokens instead of start-index.
+  """
+
+  def __init__(self, total, page_size, opensearch=True, delay=0):
+    self.total = total
+    self.page_size = page_size
+    self.opensearch = opensearch
+    self.delay = delay
+    self.requested = []
+    self.running = 0
+    self.max_running = 0
+    self.lock = threading.Lock()
+    # The start of a page which fails with a server error.
+    self.fail_at = None
+
+  def request(self, http_request):
+    query = http_request.uri.query
+    if 'start-key' in query:
+      start = int(query['start-key'][len('key'):])
+    else:
+      start = int(query.get('start-index', 1))
+    self.lock.acquire()
+    self.requested.append(start)
+    self.running += 1
+    self.max_running = max(self.max_running, self.running)
+    self.lock.release()
+    try:
+      time.sleep(self.delay)
+    finally:
+      self.lock.acquire()
+      self.running -= 1
+      self.lock.release()
+    if start == self.fail_at:
+      return atom.mock_http_core.MockHttpResponse(500, 'Error', {}, 'failed')
+    xml = ['<feed xmlns="http://www.w3.org/2005/Atom" '
+           'xmlns:openSearch="http://a9.com/-/spec/opensearch/1.1/">']
+    if self.opensearch:
+      xml.append('<openSearch:totalResults>%i</openSearch:totalResults>'
+                 '<openSearch:startIndex>%i</openSearch:startIndex>' % (
+                     self.total, start))
+    end = min(start + self.page_size, self.total + 1)
+    if end <= self.total:
+      if self.opensearch:
+        next_query = 'start-index=%i&amp;max-results=%i' % (
+            end, self.page_size)
+      else:
+        next_query = 'start-key=key%i' % end
+      xml.append('<link rel="next" href="http://example.com/feed?%s"/>' %
+                 next_query)
+    for i in range(start, end):
+      xml.append('<entry><id>%i</id></entry>' % i)
+    xml.append('</feed>')
+    return atom.mock_http_core.MockHttpResponse(200, 'OK', {}, ''.join(xml))
+
+
+class IterEntriesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.client = gdata.client.GDClient(host='example.com')
+    self.client.api_version = '2'
+
+  def entry_ids(self, **kwargs):
+    return [int(entry.id.text) for entry in self.client.iter_entries(
+        'http://example.com/feed', **kwargs)]
+
+  def test_computed_pages(self):
+    self.client.http_client = PagedFeedHttpClient(23, 5, delay=0.02)
+    self.assertEqual(self.entry_ids(prefetch=3), range(1, 24))
+    http_client = self.client.http_client
+    self.assertEqual(sorted(http_client.requested), [1, 6, 11, 16, 21])
+    self.assert_(1 < http_client.max_running <= 3)
+
+  def test_next_links(self):
+    self.client.http_client = PagedFeedHttpClient(12, 5, opensearch=False)
+    self.assertEqual(self.entry_ids(), range(1, 13))
+    self.assertEqual(self.client.http_client.requested, [1, 6, 11])
+
+  def test_no_prefetch(self):
+    self.client.http_client = PagedFeedHttpClient(12, 5)
+    entries = self.client.iter_entries('http://example.com/feed', prefetch=0)
+    entries.next()
+    self.assertEqual(self.client.http_client.requested, [1])
+    self.assertEqual(len(list(entries)), 11)
+    self.assertEqual(self.client.http_client.requested, [1, 6, 11])
+
+  def test_feed_grows(self):
+    self.client.http_client = PagedFeedHttpClient(12, 5)
+    # The last computed page is only requested once the second is read.
+    entries = self.client.iter_entries('http://example.com/feed', prefetch=1)
+    entries.next()
+    # Entries added after the first page are found through next links.
+    self.client.http_client.total = 17
+    self.assertEqual(len(list(entries)), 16)
+
+  def test_feed_shrinks(self):
+    self.client.http_client = PagedFeedHttpClient(30, 5)
+    entries = self.client.iter_entries('http://example.com/feed', prefetch=1)
+    entries.next()
+    self.client.http_client.total = 12
+    self.assertEqual(len(list(entries)), 11)
+
+  def test_single_page(self):
+    self.client.http_client = PagedFeedHttpClient(3, 5)
+    self.assertEqual(self.entry_ids(), [1, 2, 3])
+
+  def test_error(self):
+    self.client.http_client = PagedFeedHttpClient(17, 5)
+    self.client.http_client.fail_at = 11
+    entries = self.client.iter_entries('http://example.com/feed')
+    # The entries before the failed page are yielded.
+    self.assertEqual(len([entries.next() for i in range(10)]), 10)
+    self.assertRaises(gdata.client.RequestError, entries.next)
+
+  def test_query_is_only_used_for_first_page(self):
+    self.client.http_client = PagedFeedHttpClient(5, 2)
+    entries = self.client.iter_entries(
+        'http://example.com/feed',
+        query=gdata.client.Query(start_index=1, max_results=2))
+    self.assertEqual([int(entry.id.text) for entry in entries],
+                     range(1, 6))
+    self.assertEqual(sorted(self.client.http_client.requested), [1, 3, 5])
+
+  def test_checkpoint(self):
+    directory = tempfile.mkdtemp()
+    try:
+      path = os.path.join(directory, 'checkpoint')
+      checkpoint = gdata.sync.FileCheckpoint(path)
+      self.client.http_client = PagedFeedHttpClient(17, 5)
+      self.client.http_client.fail_at = 11
+      entries = self.client.iter_entries('http://example.com/feed',
+                                         checkpoint=checkpoint)
+      self.assertEqual(len([entries.next() for i in range(10)]), 10)
+      self.assertRaises(gdata.client.RequestError, entries.next)
+      self.assertEqual(atom.http_core.Uri.parse_uri(
+          checkpoint.load()).query['start-index'], '11')
+      # A new crawl resumes at the page which failed.
+      self.client.http_client = PagedFeedHttpClient(17, 5)
+      self.assertEqual(self.entry_ids(checkpoint=checkpoint), range(11, 18))
+      self.assertEqual(sorted(self.client.http_client.requested), [11, 16])
+      self.assertFalse(os.path.exists(path))
+      self.assertEqual(os.listdir(directory), [])
+    finally:
+      shutil.rmtree(directory)
+
+
+class BatchHttpClient(object):
+  """Answers batch feeds, recording the batch ids in each request.
+
+  Operations succeed unless a status is queued for their id in statuses.
+  """
+
+  def __init__(self):
+    self.requests = []
+    self.statuses = {}
+    # The number of operations processed before the batch is interrupted.
+    self.interrupt_after = None
+    # Statuses (or exceptions to raise) for whole requests, used before any
+    # operation is processed.
+    self.request_statuses = []
+    # Batch ids for which no result is sent, without batch:interrupted.
+    self.omit = set()
+    self.lock = threading.Lock()
+
+  def request(self, http_request):
+    body = []
+    for part in http_request._body_parts:
+      if isinstance(part, str):
+        body.append(part)
+      else:
+        body.extend(part)
+    feed = atom.core.parse(''.join(body), gdata.data.BatchFeed)
+    ids = [entry.batch_id.text for entry in feed.entry]
+    self.lock.acquire()
+    try:
+      self.requests.append(ids)
+      if self.request_statuses:
+        status = self.request_statuses.pop(0)
+        if isinstance(status, Exception):
+          raise status
+        return atom.mock_http_core.MockHttpResponse(status, 'Error', {},
+                                                    'failed')
+      xml = ['<feed xmlns="http://www.w3.org/2005/Atom" '
+             'xmlns:batch="http://schemas.google.com/gdata/batch">']
+      if self.interrupt_after is not None and len(ids) > self.interrupt_after:
+        ids = ids[:self.interrupt_after]
+        xml.append('<batch:interrupted reason="Time limit" parsed="%i"/>' %
+                   len(feed.entry))
+      for batch_id in ids:
+        if batch_id in self.omit:
+          continue
+        codes = self.statuses.get(batch_id) or [201]
+        code = codes.pop(0)
+        xml.append('<entry><batch:id>%s</batch:id>'
+                   '<batch:status code="%i" reason="r"/></entry>' % (
+                       batch_id, code))
+      xml.append('</feed>')
+    finally:
+      self.lock.release()
+    return atom.mock_http_core.MockHttpResponse(200, 'OK', {}, ''.join(xml))
+
+
+class BatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.client = gdata.client.GDClient(host='example.com')
+    self.client.http_client = BatchHttpClient()
+    policy = gdata.retry.RetryPolicy(budget=gdata.retry.RetryBudget())
+    policy.waits = []
+    policy._sleep = policy.waits.append
+    self.client.retry_policy = policy
+
+  def operations(self, count):
+    feed = gdata.data.BatchFeed()
+    for i in range(count):
+      feed.add_insert(gdata.data.BatchEntry())
+    return feed
+
+  def codes(self, results):
+    return [int(answer.batch_status.code) for answer in results.values()]
+
+  def test_operations_are_split(self):
+    results = self.client.batch(self.operations(250),
+                                'http://example.com/feed/batch',
+                                max_batch_size=100, max_workers=2)
+    self.assertEqual(results.keys(), [str(i) for i in range(250)])
+    self.assertEqual(self.codes(results), [201] * 250)
+    self.assertEqual(sorted(len(ids) for ids in
+                            self.client.http_client.requests),
+                     [50, 100, 100])
+    self.assertEqual(self.client.retry_policy.waits, [])
+
+  def test_failed_operations_are_retried(self):
+    self.client.http_client.statuses = {'1': [503], '2': [409]}
+    results = self.client.batch(self.operations(4),
+                                'http://example.com/feed/batch')
+    self.assertEqual(self.codes(results), [201, 201, 409, 201])
+    self.assertEqual(self.client.http_client.requests,
+                     [['0', '1', '2', '3'], ['1']])
+    self.assertEqual(len(self.client.retry_policy.waits), 1)
+
+  def test_interrupted_batch(self):
+    self.client.http_client.interrupt_after = 3
+    results = self.client.batch(self.operations(5),
+                                'http://example.com/feed/batch')
+    self.assertEqual(self.codes(results), [201] * 5)
+    self.assertEqual(self.client.http_client.requests,
+                     [['0', '1', '2', '3', '4'], ['3', '4']])
+
+  def test_gives_up(self):
+    self.client.http_client.interrupt_after = 1
+    self.client.http_client.statuses = {'0': [503] * 5}
+    results = self.client.batch(self.operations(2),
+                                'http://example.com/feed/batch')
+    self.assertEqual(results['0'].batch_status.code, '503')
+    self.assert_(isinstance(results['1'],
+                            gdata.client.BatchOperationNotProcessed))
+    self.assertEqual(str(results['1']), 'Time limit')
+    self.assertEqual(len(self.client.http_client.requests), 4)
+
+  def test_failed_requests(self):
+    self.client.http_client.request_statuses = [503, 400]
+    feed = gdata.data.BatchFeed()
+    feed.add_query('http://example.com/feed/1')
+    feed.add_update(gdata.data.BatchEntry(etag='"v1"'))
+    feed.add_update(gdata.data.BatchEntry(etag='*'))
+    feed.add_delete('http://example.com/feed/2')
+    feed.add_insert(gdata.data.BatchEntry())
+    results = self.client.batch(feed, 'http://example.com/feed/batch')
+    # Only the operations which are safe to repeat are sent again.
+    self.assertEqual(self.client.http_client.requests,
+                     [['0', '1', '2', '3', '4'], ['0', '1']])
+    self.assertEqual([error.status for error in results.values()],
+                     [400, 400, 503, 503, 503])
+
+  def test_inserts_are_not_sent_twice(self):
+    self.client.http_client.request_statuses = [socket.error('reset')]
+    results = self.client.batch(self.operations(3),
+                                'http://example.com/feed/batch')
+    self.assertEqual(len(self.client.http_client.requests), 1)
+    for error in results.values():
+      self.assert_(isinstance(error, socket.error))
+
+  def test_missing_results_are_not_retried(self):
+    self.client.http_client.omit = set(['1'])
+    results = self.client.batch(self.operations(3),
+                                'http://example.com/feed/batch')
+    self.assertEqual(len(self.client.http_client.requests), 1)
+    self.assert_(isinstance(results['1'],
+                            gdata.client.BatchOperationNotProcessed))
+    self.assertEqual(results['2'].batch_status.code, '201')
+
+  def test_batch_ids(self):
+    entries = [gdata.data.BatchEntry(batch_id=gdata.data.BatchId(text='a')),
+               gdata.data.BatchEntry()]
+    results = self.client.batch(entries, 'http://example.com/feed/batch')
+    self.assertEqual(results.keys(), ['a', '1'])
+    entries.append(gdata.data.BatchEntry(
+        batch_id=gdata.data.BatchId(text='a')))
+    self.assertRaises(gdata.client.Error, self.client.batch, entries,
+                      'http://example.com/feed/batch')
+
+
 def suite():
   return unittest.TestSuite((unittest.makeSuite(ClientLoginTest, 'test'),
                              unittest.makeSuite(AuthSubTest, 'test'),
                              unittest.makeSuite(OAuthTest, 'test'),
                              unittest.makeSuite(RequestTest, 'test'),
                              unittest.makeSuite(VersionConversionTest, 'test'),
-                             unittest.makeSuite(QueryTest, 'test')))
+                             unittest.makeSuite(QueryTest, 'test'),
+                             unittest.makeSuite(IterEntriesTest, 'test'),
+                             unittest.makeSuite(BatchTest, 'test')))
 
 
 if __name__ == '__main__':
@@ -121,6 +121,36 @@ class GDataEntryTest(unittest.TestCase):
         'http://www.w3.org/2005/Atom')[0].text != feed.get_generator())
     self.assertEqual(feed.get_generator(), 'GoogleBase')
 
+  def testLazyParse(self):
+    eager = parse(test_data.GBASE_FEED, gdata.data.GDFeed)
+    lazy = atom.core.parse(test_data.GBASE_FEED, gdata.data.GDFeed, lazy=True)
+    self.assert_(isinstance(lazy, gdata.data.GDFeed))
+    self.assertEqual(lazy.total_results.text, eager.total_results.text)
+    self.assertEqual(lazy.entry[0].id.text, eager.entry[0].id.text)
+    self.assert_('content' not in lazy.entry[1].__dict__)
+    self.assertEqual(lazy.to_string(), eager.to_string())
+
+  def testParseFields(self):
+    feed = atom.core.parse(test_data.GBASE_FEED, gdata.data.GDFeed,
+                           fields='id,link,entry(id,updated)')
+    self.assert_(feed.find_next_link() is not None)
+    self.assert_(feed.total_results is None)
+    self.assertEqual(len(feed.entry), 3)
+    self.assert_(feed.entry[0].id.text.startswith('http://'))
+    self.assert_(feed.entry[0].updated.text is not None)
+    self.assert_(feed.entry[0].content is None)
+    self.assertEqual(feed.entry[0].extension_elements, [])
+
+  def testIterEntries(self):
+    iterator = atom.core.iter_entries(test_data.GBASE_FEED,
+                                      gdata.data.GDFeed)
+    entries = list(iterator)
+    self.assertEqual(len(entries), 3)
+    self.assert_(isinstance(entries[0], gdata.data.GDEntry))
+    self.assertEqual(iterator.feed.total_results.text, '2171885')
+    self.assert_(iterator.feed.find_next_link() is not None)
+    self.assertEqual(iterator.feed.entry, [])
+
   def testAllowsEmptyId(self):
     entry = gdata.data.GDEntry()
     try:
@@ -175,6 +205,16 @@ class GDataFeedTest(unittest.TestCase):
     self.assert_(len(test_feed.get_elements('totalResults',
         'http://a9.com/-/spec/opensearchrss/1.0/')) > 0)
 
+  def testIterEntries(self):
+    iterator = atom.core.iter_entries(test_data.GBASE_FEED,
+                                      gdata.data.GDFeed)
+    entries = list(iterator)
+    self.assertEqual(len(entries), 3)
+    self.assert_(isinstance(entries[0], gdata.data.GDEntry))
+    self.assertEqual(iterator.feed.total_results.text, '2171885')
+    self.assert_(iterator.feed.find_next_link() is not None)
+    self.assertEqual(iterator.feed.entry, [])
+
   def testAllowsEmptyId(self):
     feed = gdata.data.GDFeed()
     try:
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import unittest
+import hashlib
+import threading
+import time
+import atom.http
+import atom.http_core
+import atom.mock_http_core
+import gdata.client
+import gdata.gauth
+import gdata.ratelimit
+import gdata.service
+
+
+class FakeClock(object):
+  """Stands in for time.time and time.sleep so that tests do not wait."""
+
+  def __init__(self):
+    self.now = 1000.0
+    self.sleeps = []
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+
+def make_limiter(**kwargs):
+  limiter = gdata.ratelimit.RateLimiter(**kwargs)
+  clock = FakeClock()
+  limiter._clock = clock.time
+  limiter._sleep = clock.sleep
+  return limiter, clock
+
+
+KEY = ('example.com', None)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+  def test_burst_then_rate(self):
+    limiter, clock = make_limiter(rate=2, burst=3)
+    self.assertEqual([limiter.acquire(KEY) for i in range(3)], [0, 0, 0])
+    self.assertEqual(limiter.acquire(KEY), 0.5)
+    self.assertEqual(limiter.acquire(KEY), 0.5)
+    # After a quiet period the bucket fills up again, but no further than
+    # burst.
+    clock.now += 60
+    self.assertEqual([limiter.acquire(KEY) for i in range(4)], [0, 0, 0, 0.5])
+
+  def test_waiting_requests_are_queued(self):
+    limiter, clock = make_limiter(rate=1, burst=1)
+    # Sleeping is disabled, so each caller reserves the next free slot.
+    limiter._sleep = lambda seconds: None
+    self.assertEqual([limiter.acquire(KEY) for i in range(4)],
+                     [0, 1.0, 2.0, 3.0])
+
+  def test_keys_are_independent(self):
+    limiter, clock = make_limiter(rate=1, burst=1)
+    self.assertEqual(limiter.acquire(KEY), 0)
+    self.assertEqual(limiter.acquire(('example.com', 'other user')), 0)
+    self.assertEqual(limiter.acquire(('example.org', None)), 0)
+    self.assertEqual(limiter.acquire(KEY), 1.0)
+
+  def test_throttled_halves_rate(self):
+    limiter, clock = make_limiter(rate=4, burst=4, min_rate=1.5)
+    limiter.acquire(KEY)
+    limiter.throttled(KEY)
+    self.assertEqual(limiter.get_rate(KEY), 2.0)
+    # The remaining burst is dropped.
+    self.assertEqual(limiter.acquire(KEY), 0.5)
+    limiter.throttled(KEY)
+    self.assertEqual(limiter.get_rate(KEY), 1.5)
+    self.assertEqual(limiter.get_rate(('example.org', None)), 4.0)
+
+  def test_retry_after_pauses(self):
+    limiter, clock = make_limiter(rate=10, burst=10)
+    limiter.throttled(KEY, 30)
+    self.assertEqual(limiter.acquire(KEY), 30.0 + 1 / 5.0)
+    self.assertEqual(clock.now, 1030.2)
+
+  def test_succeeded_increases_rate(self):
+    limiter, clock = make_limiter(rate=2, increase=0.5, max_rate=3)
+    limiter.succeeded(KEY)
+    self.assertEqual(limiter.get_rate(KEY), 2.5)
+    limiter.succeeded(KEY)
+    limiter.succeeded(KEY)
+    self.assertEqual(limiter.get_rate(KEY), 3)
+
+  def test_shared_between_threads(self):
+    limiter = gdata.ratelimit.RateLimiter(rate=100, burst=1)
+    def make_requests():
+      for i in range(3):
+        limiter.acquire(KEY)
+    threads = [threading.Thread(target=make_requests) for i in range(5)]
+    start = time.time()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    # 15 requests at 100 per second, of which the first is sent at once.
+    self.assert_(time.time() - start >= 0.13)
+
+
+class ResponseReceivedTest(unittest.TestCase):
+
+  def setUp(self):
+    self.limiter, self.clock = make_limiter(rate=4, burst=1, increase=1)
+
+  def response(self, status, body='', headers=None):
+    return atom.mock_http_core.MockHttpResponse(status, 'reason',
+                                                headers or {}, body)
+
+  def test_success(self):
+    response = self.response(200, 'ok')
+    self.assert_(self.limiter.response_received(KEY, response) is response)
+    self.assertEqual(self.limiter.get_rate(KEY), 5)
+
+  def test_service_unavailable(self):
+    self.limiter.response_received(
+        KEY, self.response(503, 'busy', {'Retry-After': '2'}))
+    self.assertEqual(self.limiter.get_rate(KEY), 2)
+    self.assertEqual(self.limiter.acquire(KEY), 2.5)
+
+  def test_quota_exceeded(self):
+    response = self.limiter.response_received(KEY, self.response(
+        403, '<errors><error><code>quotaExceeded</code></error></errors>'))
+    self.assertEqual(self.limiter.get_rate(KEY), 2)
+    self.assertEqual(response.status, 403)
+    # The body is still available to the caller.
+    self.assertEqual(response.read(8), '<errors>')
+    self.assert_(response.read().endswith('</errors>'))
+
+  def test_forbidden(self):
+    response = self.limiter.response_received(
+        KEY, self.response(403, 'Token invalid'))
+    self.assertEqual(self.limiter.get_rate(KEY), 4)
+    self.assertEqual(response.read(), 'Token invalid')
+
+  def test_other_errors_leave_rate(self):
+    self.limiter.response_received(KEY, self.response(404, 'missing'))
+    self.limiter.response_received(KEY, self.response(500, 'error'))
+    self.assertEqual(self.limiter.get_rate(KEY), 4)
+
+
+class RequestKeyTest(unittest.TestCase):
+
+  def test_no_token(self):
+    self.assertEqual(gdata.ratelimit.request_key('example.com'),
+                     ('example.com', None))
+
+  def test_token_is_hashed(self):
+    token = gdata.gauth.ClientLoginToken('secret')
+    key = gdata.ratelimit.request_key('example.com', token)
+    self.assertEqual(key, ('example.com', hashlib.sha1('secret').hexdigest()))
+    other = gdata.ratelimit.request_key(
+        'example.com', gdata.gauth.ClientLoginToken('other'))
+    self.assertNotEqual(key, other)
+
+  def test_requestor_id(self):
+    uri = atom.http_core.Uri.parse_uri(
+        'http://example.com/feeds?xoauth_requestor_id=liz%40example.com')
+    key = gdata.ratelimit.request_key('example.com', None, uri)
+    self.assertEqual(
+        key, ('example.com', hashlib.sha1('liz@example.com').hexdigest()))
+
+  def test_requestor_id_from_token_or_url(self):
+    token = gdata.gauth.TwoLeggedOAuthHmacToken('key', 'secret',
+                                                'alice@example.com')
+    first_page = atom.http_core.Uri.parse_uri('http://example.com/feed')
+    next_page = atom.http_core.Uri.parse_uri(
+        'http://example.com/feed?xoauth_requestor_id=alice%40example.com'
+        '&start-index=26')
+    self.assertEqual(
+        gdata.ratelimit.request_key('example.com', token, first_page),
+        gdata.ratelimit.request_key('example.com', token, next_page))
+
+
+class ClientRateLimitTest(unittest.TestCase):
+
+  def setUp(self):
+    self.limiter, self.clock = make_limiter(rate=1, burst=1)
+    self.client = gdata.client.GDClient()
+    self.client.rate_limiter = self.limiter
+    self.client.http_client = atom.mock_http_core.SettableHttpClient(
+        200, 'OK', 'hello', {})
+    self.key = ('example.com', None)
+
+  def test_requests_are_spaced(self):
+    for i in range(3):
+      self.client.request('GET', 'http://example.com/feeds').read()
+    # Each successful response raises the rate, shortening the next wait.
+    self.assertEqual(len(self.clock.sleeps), 2)
+    self.assert_(1.0 > self.clock.sleeps[0] > self.clock.sleeps[1])
+    self.assertAlmostEqual(self.limiter.get_rate(self.key), 1.3)
+
+  def test_quota_error(self):
+    self.client.http_client.set_response(
+        403, 'Forbidden', 'Quota exceeded', {'Retry-After': '5'})
+    try:
+      self.client.request('GET', 'http://example.com/feeds')
+      self.fail('Expected a RequestError')
+    except gdata.client.RequestError, error:
+      self.assertEqual(error.status, 403)
+      self.assertEqual(error.body, 'Quota exceeded')
+    self.assertEqual(self.limiter.get_rate(self.key), 0.5)
+    self.client.http_client.set_response(200, 'OK', 'hello', {})
+    self.client.request('GET', 'http://example.com/feeds')
+    self.assertEqual(self.clock.sleeps, [7.0])
+
+  def test_users_are_separate(self):
+    self.client.request('GET', 'http://example.com/feeds',
+        auth_token=gdata.gauth.ClientLoginToken('a'))
+    self.client.request('GET', 'http://example.com/feeds',
+        auth_token=gdata.gauth.ClientLoginToken('b'))
+    self.assertEqual(self.clock.sleeps, [])
+
+
+class ServiceRateLimitTest(unittest.TestCase):
+
+  def test_service_unavailable(self):
+    limiter, clock = make_limiter(rate=2)
+    service = gdata.service.GDataService(server='example.com')
+    service.rate_limiter = limiter
+    service.http_client = atom.http.HttpClient()
+    service.http_client.v2_http_client = (
+        atom.mock_http_core.SettableHttpClient(503, 'Unavailable', 'busy',
+                                               {'Retry-After': '10'}))
+    self.assertRaises(gdata.service.RequestError, service.Get, '/feeds')
+    self.assertEqual(limiter.get_rate(('example.com', None)), 1.0)
+    service.http_client.v2_http_client.set_response(200, 'OK', 'text', {})
+    self.assertEqual(service.Get('/feeds', converter=str), 'text')
+    self.assertEqual(clock.sleeps, [10.0 + 1.0])
+
+
+def suite():
+  return unittest.TestSuite((unittest.makeSuite(RateLimiterTest, 'test'),
+                             unittest.makeSuite(ResponseReceivedTest, 'test'),
+                             unittest.makeSuite(RequestKeyTest, 'test'),
+                             unittest.makeSuite(ClientRateLimitTest, 'test'),
+                             unittest.makeSuite(ServiceRateLimitTest, 'test')))
+
+
+if __name__ == '__main__':
+  unittest.main()
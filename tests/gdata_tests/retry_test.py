@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import unittest
+import os
+import socket
+import StringIO
+import tempfile
+import atom.core
+import atom.data
+import atom.http_core
+import atom.mock_http_core
+import gdata.client
+import gdata.data
+import gdata.retry
+
+
+class SequenceHttpClient(object):
+  """Replies to each request with the next response or error in a list.
+
+  The body of each request is read and recorded.
+  """
+
+  def __init__(self, *replies):
+    self.replies = list(replies)
+    self.bodies = []
+
+  def request(self, http_request):
+    body = []
+    for part in http_request._body_parts:
+      if isinstance(part, str):
+        body.append(part)
+      elif hasattr(part, 'read'):
+        body.append(part.read())
+      else:
+        body.extend(part)
+    self.bodies.append(''.join(body))
+    reply = self.replies.pop(0)
+    if isinstance(reply, Exception):
+      raise reply
+    status, body, headers = reply
+    return atom.mock_http_core.MockHttpResponse(status, 'reason', headers,
+                                                body)
+
+
+class ClosingHttpClient(SequenceHttpClient):
+  """Closes each file in a request body once it has been read, as
+  gdata.data.MediaSource file handles may be, and can then delete it."""
+
+  def __init__(self, *replies):
+    SequenceHttpClient.__init__(self, *replies)
+    self.remove_files = False
+
+  def request(self, http_request):
+    try:
+      return SequenceHttpClient.request(self, http_request)
+    finally:
+      for part in http_request._body_parts:
+        if hasattr(part, 'read'):
+          part.close()
+          if self.remove_files:
+            os.remove(part.name)
+
+
+def make_policy(**kwargs):
+  kwargs.setdefault('budget', gdata.retry.RetryBudget())
+  policy = gdata.retry.RetryPolicy(**kwargs)
+  policy.waits = []
+  policy._sleep = policy.waits.append
+  policy._random = lambda: 0.5
+  return policy
+
+
+class IdempotencyTest(unittest.TestCase):
+
+  def check(self, method, headers, expected):
+    http_request = atom.http_core.HttpRequest(method=method, headers=headers)
+    self.assertEqual(gdata.retry.is_idempotent(http_request), expected)
+
+  def test_methods(self):
+    self.check('GET', {}, True)
+    self.check('HEAD', {}, True)
+    self.check('POST', {}, False)
+    self.check('PUT', {}, False)
+    self.check('DELETE', {}, False)
+
+  def test_etags(self):
+    self.check('PUT', {'If-Match': 'W/"CUUEQX47eCp7ImA9WxRVEkQ."'}, True)
+    self.check('DELETE', {'If-Match': '"abc"'}, True)
+    self.check('PUT', {'If-Match': '*'}, False)
+    self.check('POST', {'If-Match': '"abc"'}, False)
+
+  def test_method_override(self):
+    self.check('POST', {'X-HTTP-Method-Override': 'PATCH',
+                        'If-Match': '"abc"'}, True)
+    self.check('POST', {'X-HTTP-Method-Override': 'PATCH'}, False)
+
+  def test_batch_operations(self):
+    def check(operation, etag, expected):
+      entry = gdata.data.BatchEntry(etag=etag)
+      if operation is not None:
+        entry.batch_operation = gdata.data.BatchOperation(type=operation)
+      self.assertEqual(gdata.retry.is_idempotent_operation(entry), expected)
+    check('query', None, True)
+    check('update', '"abc"', True)
+    check('delete', '"abc"', True)
+    check('delete', None, False)
+    check('update', '*', False)
+    check('insert', '"abc"', False)
+    check(None, None, False)
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.request = atom.http_core.HttpRequest(method='GET')
+
+  def response(self, status, headers=None):
+    return atom.mock_http_core.MockHttpResponse(status, 'reason',
+                                                headers or {}, '')
+
+  def test_backoff(self):
+    policy = make_policy(initial_delay=1, backoff=2, max_delay=3)
+    delays = [policy.get_delay(self.request, attempt, self.response(503))
+              for attempt in range(3)]
+    self.assertEqual(delays, [0.5, 1.0, 1.5])
+    self.assertEqual(policy.get_delay(self.request, 3, self.response(503)),
+                     None)
+
+  def test_statuses(self):
+    policy = make_policy()
+    self.assertEqual(policy.get_delay(self.request, 0, self.response(404)),
+                     None)
+    self.assertEqual(policy.get_delay(self.request, 0, self.response(403)),
+                     None)
+    self.assertNotEqual(
+        policy.get_delay(self.request, 0, self.response(502)), None)
+
+  def test_errors(self):
+    policy = make_policy()
+    self.assertNotEqual(policy.get_delay(
+        self.request, 0, error=socket.error('reset')), None)
+    self.assertEqual(policy.get_delay(
+        self.request, 0, error=ValueError('bug')), None)
+
+  def test_retry_after(self):
+    policy = make_policy(max_retry_after=60)
+    self.assertEqual(policy.get_delay(
+        self.request, 0, self.response(503, {'Retry-After': '20'})), 20.0)
+    self.assertEqual(policy.get_delay(
+        self.request, 0, self.response(503, {'Retry-After': '300'})), None)
+
+  def test_budget(self):
+    budget = gdata.retry.RetryBudget(ratio=0.5, min_per_second=0,
+                                     max_tokens=2)
+    now = [100.0]
+    budget._clock = lambda: now[0]
+    policy = make_policy(budget=budget)
+    response = self.response(500)
+    self.assertNotEqual(policy.get_delay(self.request, 0, response), None)
+    self.assertNotEqual(policy.get_delay(self.request, 0, response), None)
+    self.assertEqual(policy.get_delay(self.request, 0, response), None)
+    # Two more requests earn one more retry.
+    budget.request_started()
+    budget.request_started()
+    self.assertNotEqual(policy.get_delay(self.request, 0, response), None)
+    self.assertEqual(policy.get_delay(self.request, 0, response), None)
+    # Tokens are also added over time.
+    budget.min_per_second = 1
+    now[0] += 1
+    self.assertNotEqual(policy.get_delay(self.request, 0, response), None)
+
+  def test_backoff_without_request(self):
+    policy = make_policy(initial_delay=1, backoff=2, max_retries=2)
+    self.assertEqual(policy.get_backoff(0), 0.5)
+    self.assertEqual(policy.get_backoff(1), 1.0)
+    self.assertEqual(policy.get_backoff(2), None)
+
+
+class RequestBodyTest(unittest.TestCase):
+
+  def test_strings_and_writers(self):
+    http_request = atom.http_core.HttpRequest()
+    http_request.add_body_part('abc', 'text/plain')
+    http_request.add_body_part(atom.core.XmlWriter(atom.data.Entry()),
+                               'application/atom+xml')
+    body = gdata.retry.RequestBody(http_request)
+    self.assert_(body.rewindable)
+    self.assert_(body.rewind())
+
+  def test_generator(self):
+    http_request = atom.http_core.HttpRequest()
+    http_request.add_body_part((chunk for chunk in ['a', 'b']), 'text/plain')
+    self.assertFalse(gdata.retry.RequestBody(http_request).rewind())
+
+  def test_seek(self):
+    data = StringIO.StringIO('xyz0123')
+    data.read(3)
+    http_request = atom.http_core.HttpRequest()
+    http_request.add_body_part(data, 'text/plain', 4)
+    body = gdata.retry.RequestBody(http_request)
+    self.assertEqual(data.read(), '0123')
+    self.assert_(body.rewind())
+    self.assertEqual(data.read(), '0123')
+
+  def test_reopen(self):
+    handle, path = tempfile.mkstemp()
+    try:
+      os.write(handle, 'media data')
+      os.close(handle)
+      media = gdata.data.MediaSource(file_path=path, content_type='text/plain')
+      http_request = atom.http_core.HttpRequest()
+      media.modify_request(http_request)
+      body = gdata.retry.RequestBody(http_request)
+      media.file_handle.read()
+      media.file_handle.close()
+      self.assert_(body.rewind())
+      reopened = http_request._body_parts[0]
+      self.assert_(reopened is not media.file_handle)
+      self.assertEqual(reopened.read(), 'media data')
+      # A file opened by an earlier rewind is closed when it is replaced.
+      reopened.close()
+      self.assert_(body.rewind())
+      again = http_request._body_parts[0]
+      self.assertEqual(again.read(), 'media data')
+      body.close()
+      self.assert_(again.closed)
+    finally:
+      os.remove(path)
+
+
+class ClientRetryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.policy = make_policy()
+    self.client = gdata.client.GDClient(host='example.com')
+    self.client.retry_policy = self.policy
+
+  def test_get_is_retried(self):
+    self.client.http_client = SequenceHttpClient(
+        (503, 'busy', {}), socket.error('reset'), (200, 'done', {}))
+    response = self.client.request('GET', '/feeds/a')
+    self.assertEqual(response.read(), 'done')
+    self.assertEqual(self.policy.waits, [0.25, 0.5])
+
+  def test_gives_up(self):
+    self.client.http_client = SequenceHttpClient(*[(500, 'error', {})] * 4)
+    try:
+      self.client.request('GET', '/feeds/a')
+      self.fail('Expected a RequestError')
+    except gdata.client.RequestError, error:
+      self.assertEqual(error.status, 500)
+      self.assertEqual(error.body, 'error')
+    self.assertEqual(len(self.policy.waits), 3)
+
+  def test_post_is_not_retried(self):
+    self.client.http_client = SequenceHttpClient((503, 'busy', {}))
+    self.assertRaises(gdata.client.RequestError, self.client.post,
+                      atom.data.Entry(), '/feeds/a')
+    self.assertEqual(self.policy.waits, [])
+
+  def test_conditional_update_is_retried(self):
+    entry = gdata.data.GDEntry(etag='"abc"')
+    entry.link.append(atom.data.Link(rel='edit',
+                                     href='http://example.com/feeds/a/1'))
+    self.client.http_client = SequenceHttpClient(
+        (503, 'busy', {'Retry-After': '2'}),
+        (200, entry.to_string(), {}))
+    updated = self.client.update(entry)
+    self.assert_(isinstance(updated, gdata.data.GDEntry))
+    self.assertEqual(self.policy.waits, [2.0])
+    bodies = self.client.http_client.bodies
+    self.assertEqual(len(bodies), 2)
+    self.assertEqual(bodies[0], bodies[1])
+
+  def test_media_body_is_sent_again(self):
+    media = gdata.data.MediaSource(StringIO.StringIO('0123456789'),
+                                   'text/plain', 10)
+    self.client.http_client = SequenceHttpClient(
+        socket.error('reset'), (200, 'ok', {}))
+    self.client.request('PUT', '/media/1', media_source=media,
+                        http_request=atom.http_core.HttpRequest(
+                            headers={'If-Match': '"v1"'}))
+    self.assertEqual(self.client.http_client.bodies,
+                     ['0123456789', '0123456789'])
+
+  def test_closed_file_is_reopened(self):
+    handle, path = tempfile.mkstemp()
+    try:
+      os.write(handle, 'media data')
+      os.close(handle)
+      media = gdata.data.MediaSource(file_path=path, content_type='text/plain')
+      self.client.http_client = ClosingHttpClient(
+          socket.error('reset'), (200, 'ok', {}))
+      http_request = atom.http_core.HttpRequest(headers={'If-Match': '"v1"'})
+      self.client.request('PUT', '/media/1', media_source=media,
+                          http_request=http_request)
+      self.assertEqual(len(self.policy.waits), 1)
+      self.assertEqual(self.client.http_client.bodies,
+                       ['media data', 'media data'])
+    finally:
+      os.remove(path)
+
+  def test_failed_rewind_does_not_spend_budget(self):
+    handle, path = tempfile.mkstemp()
+    os.write(handle, 'media data')
+    os.close(handle)
+    media = gdata.data.MediaSource(file_path=path, content_type='text/plain')
+    tokens = self.policy.budget.tokens
+    self.client.http_client = ClosingHttpClient(socket.error('reset'))
+    self.client.http_client.remove_files = True
+    self.assertRaises(socket.error, self.client.request, 'PUT', '/media/1',
+                      media_source=media, http_request=atom.http_core.HttpRequest(
+                          headers={'If-Match': '"v1"'}))
+    self.assertEqual(self.policy.waits, [])
+    self.assert_(self.policy.budget.tokens >= tokens)
+
+  def test_unrewindable_body_is_not_retried(self):
+    http_request = atom.http_core.HttpRequest(headers={'If-Match': '"v1"'})
+    http_request.add_body_part((chunk for chunk in ['a', 'b']), 'text/plain')
+    self.client.http_client = SequenceHttpClient(socket.error('reset'))
+    self.assertRaises(socket.error, self.client.request, 'PUT', '/a',
+                      http_request=http_request)
+    self.assertEqual(self.policy.waits, [])
+
+
+def suite():
+  return unittest.TestSuite((unittest.makeSuite(IdempotencyTest, 'test'),
+                             unittest.makeSuite(RetryPolicyTest, 'test'),
+                             unittest.makeSuite(RequestBodyTest, 'test'),
+                             unittest.makeSuite(ClientRetryTest, 'test')))
+
+
+if __name__ == '__main__':
+  unittest.main()
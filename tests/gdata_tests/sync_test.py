@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+#
+#    Copyright (C) 2010 Google Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+# This module is used for version 2 of the Google Data APIs.
+
+
+__author__ = 'j.s@google.com (Jeff Scudder)'
+
+
+import unittest
+import os
+import shutil
+import tempfile
+import atom.core
+import atom.mock_http_core
+import gdata.apps.service
+import gdata.calendar.data
+import gdata.client
+import gdata.contacts.client
+import gdata.contacts.data
+import gdata.docs.client
+import gdata.sync
+
+
+CONTACTS_URI = 'http://www.google.com/m8/feeds/contacts/default/full'
+
+
+def make_feed(updated, entries, next_uri=None):
+  xml = ['<feed xmlns="http://www.w3.org/2005/Atom" '
+         'xmlns:gd="http://schemas.google.com/g/2005">']
+  if updated:
+    xml.append('<updated>%s</updated>' % updated)
+  if next_uri:
+    xml.append('<link rel="next" href="%s"/>' % next_uri)
+  for entry_id, entry_updated, deleted in entries:
+    xml.append('<entry><id>%s</id><updated>%s</updated>%s</entry>' % (
+        entry_id, entry_updated, deleted and '<gd:deleted/>' or ''))
+  xml.append('</feed>')
+  return ''.join(xml)
+
+
+class FeedHttpClient(object):
+  """Replies with the next (status, body) and records each URL requested."""
+
+  def __init__(self, *replies):
+    self.replies = list(replies)
+    self.uris = []
+
+  def request(self, http_request):
+    self.uris.append(http_request.uri)
+    status, body = self.replies.pop(0)
+    return atom.mock_http_core.MockHttpResponse(status, 'reason', {}, body)
+
+
+class IsDeletedTest(unittest.TestCase):
+
+  def test_contacts(self):
+    entry = gdata.contacts.data.ContactEntry(
+        deleted=gdata.contacts.data.Deleted())
+    self.assert_(gdata.sync.is_deleted(entry))
+    self.assertFalse(gdata.sync.is_deleted(gdata.contacts.data.ContactEntry()))
+
+  def test_unknown_deleted_element(self):
+    entry = atom.core.parse(
+        '<entry xmlns="http://www.w3.org/2005/Atom" '
+        'xmlns:gd="http://schemas.google.com/g/2005"><gd:deleted/></entry>',
+        gdata.data.GDEntry)
+    self.assert_(gdata.sync.is_deleted(entry))
+
+  def test_canceled_event(self):
+    entry = atom.core.parse(
+        '<entry xmlns="http://www.w3.org/2005/Atom" '
+        'xmlns:gd="http://schemas.google.com/g/2005"><gd:eventStatus '
+        'value="http://schemas.google.com/g/2005#event.canceled"/></entry>',
+        gdata.calendar.data.CalendarEventEntry)
+    self.assertEqual(entry.event_status.value, gdata.data.CANCELED_EVENT)
+    self.assert_(gdata.sync.is_deleted(entry))
+    entry.event_status.value = gdata.data.CONFIRMED_EVENT
+    self.assertFalse(gdata.sync.is_deleted(entry))
+
+
+class FeedSyncTest(unittest.TestCase):
+
+  def setUp(self):
+    self.client = gdata.contacts.client.ContactsClient()
+    self.directory = tempfile.mkdtemp()
+    self.store = gdata.sync.FileStore(self.directory)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def first_sync(self):
+    self.client.http_client = FeedHttpClient(
+        (200, make_feed('2010-11-01T00:00:00Z',
+                        [('a', '2010-10-01T00:00:00Z', False),
+                         ('b', '2010-10-02T00:00:00Z', False)],
+                        next_uri=CONTACTS_URI + '?start-index=3')),
+        (200, make_feed('2010-11-01T00:00:01Z',
+                        [('c', '2010-10-03T00:00:00Z', False)])))
+    contacts = self.client.get_contacts_sync(store=self.store)
+    return contacts, contacts.sync()
+
+  def test_first_sync_fetches_everything(self):
+    contacts, result = self.first_sync()
+    self.assert_(result.full)
+    self.assertEqual([entry.id.text for entry in result.updated],
+                     ['a', 'b', 'c'])
+    self.assertEqual(result.deleted, [])
+    self.assertEqual(contacts.get_watermark(), '2010-11-01T00:00:00Z')
+    self.assertEqual(sorted(contacts.get_entries().keys()), ['a', 'b', 'c'])
+    first, second = self.client.http_client.uris
+    self.assertEqual(first.query['showdeleted'], 'true')
+    self.assert_('updated-min' not in first.query)
+    self.assertEqual(second.query, {'start-index': '3'})
+
+  def test_changes_are_applied(self):
+    contacts, result = self.first_sync()
+    self.client.http_client = FeedHttpClient(
+        (200, make_feed('2010-11-02T00:00:00Z',
+                        [('a', '2010-11-01T10:00:00Z', True),
+                         ('b', '2010-11-01T11:00:00Z', False),
+                         ('z', '2010-11-01T12:00:00Z', True)])))
+    result = contacts.sync()
+    self.assertFalse(result.full)
+    self.assertEqual([entry.id.text for entry in result.updated], ['b'])
+    # A tombstone for an entry which was never mirrored is ignored.
+    self.assertEqual(result.deleted, ['a'])
+    self.assertEqual(sorted(contacts.get_entries().keys()), ['b', 'c'])
+    self.assertEqual(
+        contacts.get_entries()['b'].updated.text, '2010-11-01T11:00:00Z')
+    query = self.client.http_client.uris[0].query
+    self.assertEqual(query['updated-min'], '2010-11-01T00:00:00Z')
+    self.assertEqual(query['requirealldeleted'], 'true')
+    self.assertEqual(contacts.get_watermark(), '2010-11-02T00:00:00Z')
+
+  def test_state_is_saved(self):
+    self.first_sync()
+    contacts = self.client.get_contacts_sync(store=self.store)
+    self.assertEqual(contacts.get_watermark(), '2010-11-01T00:00:00Z')
+    entries = contacts.get_entries()
+    self.assertEqual(sorted(entries.keys()), ['a', 'b', 'c'])
+    self.assert_(isinstance(entries['a'], gdata.contacts.data.ContactEntry))
+    # Another feed is stored separately.
+    groups = self.client.get_contacts_sync(store=self.store, kind='groups')
+    self.assertEqual(groups.get_watermark(), None)
+
+  def test_gone_fetches_everything(self):
+    contacts, result = self.first_sync()
+    self.client.http_client = FeedHttpClient(
+        (410, 'Gone'),
+        (200, make_feed('2010-12-01T00:00:00Z',
+                        [('c', '2010-10-03T00:00:00Z', False),
+                         ('d', '2010-11-03T00:00:00Z', False)])))
+    result = contacts.sync()
+    self.assert_(result.full)
+    self.assertEqual(sorted(result.deleted), ['a', 'b'])
+    self.assertEqual(sorted(contacts.get_entries().keys()), ['c', 'd'])
+    self.assert_('updated-min' not in self.client.http_client.uris[1].query)
+
+  def test_failed_sync_changes_nothing(self):
+    contacts, result = self.first_sync()
+    self.client.http_client = FeedHttpClient(
+        (200, make_feed('2010-11-02T00:00:00Z',
+                        [('a', '2010-11-01T10:00:00Z', True)],
+                        next_uri=CONTACTS_URI + '?start-index=2')),
+        (500, 'Server error'))
+    self.assertRaises(gdata.client.RequestError, contacts.sync)
+    self.assertEqual(contacts.get_watermark(), '2010-11-01T00:00:00Z')
+    self.assert_('a' in contacts.get_entries())
+    reloaded = self.client.get_contacts_sync(store=self.store)
+    self.assert_('a' in reloaded.get_entries())
+
+  def test_modifiers_only_change_first_page(self):
+    client = gdata.client.GDClient(host='example.com')
+    client.http_client = FeedHttpClient(
+        (200, make_feed('2010-11-01T00:00:00Z',
+                        [('a', '2010-10-01T00:00:00Z', False)],
+                        next_uri='http://example.com/feed?start-index=2')),
+        (200, make_feed('2010-11-01T00:00:01Z',
+                        [('b', '2010-10-02T00:00:00Z', False)])))
+    feed = gdata.sync.FeedSync(client, 'http://example.com/feed')
+    result = feed.sync(page=gdata.client.Query(start_index=1))
+    self.assertEqual([entry.id.text for entry in result.updated], ['a', 'b'])
+    first, second = client.http_client.uris
+    self.assertEqual(first.query['start-index'], '1')
+    self.assertEqual(second.query['start-index'], '2')
+
+  def test_watermark_from_entries(self):
+    client = gdata.client.GDClient(host='example.com')
+    client.http_client = FeedHttpClient(
+        (200, make_feed(None, [('a', '2010-10-01T00:00:00Z', False),
+                               ('b', '2010-10-05T00:00:00Z', False)])))
+    events = gdata.sync.FeedSync(
+        client, '/calendar/feeds/default/private/full',
+        gdata.calendar.data.CalendarEventFeed,
+        query=gdata.sync.SyncQuery(showdeleted='true', max_results=50))
+    events.sync()
+    self.assertEqual(events.get_watermark(), '2010-10-05T00:00:00Z')
+    query = client.http_client.uris[0].query
+    self.assertEqual(query, {'showdeleted': 'true', 'max-results': '50'})
+
+  def test_doclist_sync(self):
+    client = gdata.docs.client.DocsClient()
+    client.http_client = FeedHttpClient(
+        (200, make_feed('2010-11-01T00:00:00Z', [])))
+    docs = client.get_doclist_sync(limit=10)
+    docs.sync()
+    uri = client.http_client.uris[0]
+    self.assertEqual(uri.path, '/feeds/default/private/full/')
+    self.assertEqual(uri.query, {'showdeleted': 'true', 'max-results': '10'})
+
+
+def make_user_feed(names, next_uri=None):
+  xml = ['<feed xmlns="http://www.w3.org/2005/Atom" '
+         'xmlns:apps="http://schemas.google.com/apps/2006">']
+  if next_uri:
+    xml.append('<link rel="next" href="%s"/>' % next_uri)
+  for name in names:
+    xml.append('<entry><apps:login userName="%s"/></entry>' % name)
+  xml.append('</feed>')
+  return ''.join(xml)
+
+
+class CheckpointTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'users')
+    self.checkpoint = gdata.sync.FileCheckpoint(self.path)
+    self.service = gdata.apps.service.AppsService(domain='example.com')
+    self.pages = {
+        '/a/feeds/example.com/user/2.0': make_user_feed(
+            ['a', 'b'], 'https://example.com/users?startUsername=c'),
+        'https://example.com/users?startUsername=c': make_user_feed(
+            ['c', 'd'], 'https://example.com/users?startUsername=e'),
+        'https://example.com/users?startUsername=e': make_user_feed(['e'])}
+    self.requested = []
+    self.service.GetWithRetries = self.get
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def get(self, uri, **kwargs):
+    self.requested.append(uri)
+    return self.pages[uri]
+
+  def test_save_and_clear(self):
+    self.assertEqual(self.checkpoint.load(), None)
+    self.checkpoint.save('http://example.com/feed?start-index=3')
+    self.assertEqual(self.checkpoint.load(),
+                     'http://example.com/feed?start-index=3')
+    self.checkpoint.clear()
+    self.assertEqual(self.checkpoint.load(), None)
+    self.checkpoint.clear()
+
+  def test_pages_are_fetched_as_needed(self):
+    users = self.service.GetEntryGeneratorForAllUsers()
+    self.assertEqual(users.next().login.user_name, 'a')
+    self.assertEqual(users.next().login.user_name, 'b')
+    self.assertEqual(len(self.requested), 1)
+    self.assertEqual(users.next().login.user_name, 'c')
+    self.assertEqual(len(self.requested), 2)
+    self.assertEqual([user.login.user_name for user in users], ['d', 'e'])
+
+  def test_interrupted_listing_resumes(self):
+    del self.pages['https://example.com/users?startUsername=e']
+    users = self.service.GetEntryGeneratorForAllUsers(
+        checkpoint=self.checkpoint)
+    self.assertEqual([users.next() for i in range(4)][-1].login.user_name,
+                     'd')
+    self.assertRaises(KeyError, users.next)
+    self.assertEqual(self.checkpoint.load(),
+                     'https://example.com/users?startUsername=e')
+    self.pages['https://example.com/users?startUsername=e'] = (
+        make_user_feed(['e']))
+    self.requested = []
+    users = self.service.GetEntryGeneratorForAllUsers(
+        checkpoint=self.checkpoint)
+    self.assertEqual([user.login.user_name for user in users], ['e'])
+    self.assertEqual(self.requested,
+                     ['https://example.com/users?startUsername=e'])
+    self.assertFalse(os.path.exists(self.path))
+
+
+def suite():
+  return unittest.TestSuite((unittest.makeSuite(IsDeletedTest, 'test'),
+                             unittest.makeSuite(FeedSyncTest, 'test'),
+                             unittest.makeSuite(CheckpointTest, 'test')))
+
+
+if __name__ == '__main__':
+  unittest.main()